@@ -3,31 +3,104 @@ AWS Lambda handler for Health Waze API
 Server-driven UI implementation with business rules
 """
 
+import base64
+import hashlib
+import importlib.util
 import json
 import os
+import sys
+import threading
 import time
+import uuid
+from collections import Counter, OrderedDict
 from decimal import Decimal
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple
-import boto3
-import jwt
-from boto3.dynamodb.conditions import Key, Attr
-
-# DynamoDB tables
-DDB_ENDPOINT = os.environ.get('DYNAMODB_ENDPOINT')
-dynamodb = boto3.resource('dynamodb', endpoint_url=DDB_ENDPOINT)
-users_table = dynamodb.Table(os.environ['USERS_TABLE'])
-sessions_table = dynamodb.Table(os.environ['SESSIONS_TABLE'])
-centres_table = dynamodb.Table(os.environ['CENTRES_TABLE'])
-ledger_table = dynamodb.Table(os.environ['LEDGER_TABLE'])
-entitlements_table = dynamodb.Table(os.environ['ENTITLEMENTS_TABLE'])
+from math import radians, sin, cos, sqrt, atan2, floor
+from typing import Dict, List, Optional, Tuple, Union
+
+# Lambda loads handlers as lambda/<module>; keep sibling modules importable
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from catalogue import (
+    CATALOGUE_INDEX, REGION_INDEX, Catalogue, catalogue_partitions, read_catalogue_changes,
+    read_catalogue_version, read_region_versions, regions_within
+)
+from clients import LazyTable, dynamodb, on_dynamodb_call
+from encoding import compress, pick_content_encoding, to_json, to_json_bytes
+from geo import KM_PER_DEG_LAT, DensityGrid, DistanceEngine, GridIndex, bucket_by_tile, tile_xy
+from router import Request, Router
+import snapshot_file
+import store
+
+def _lazy_module(name: str):
+    """Module that is only executed on first attribute access."""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+# PyJWT (and the crypto backends it probes) loads on first token use;
+# routes that never sign or verify one skip it on cold start
+jwt = _lazy_module('jwt')
+
+# DynamoDB tables; boto3 is loaded and the client built on first use (clients.py)
+users_table = LazyTable(os.environ['USERS_TABLE'])
+sessions_table = LazyTable(os.environ['SESSIONS_TABLE'])
+centres_table = LazyTable(os.environ['CENTRES_TABLE'])
+ledger_table = LazyTable(os.environ['LEDGER_TABLE'])
+entitlements_table = LazyTable(os.environ['ENTITLEMENTS_TABLE'])
+
+class _RequestMetrics(threading.local):
+    """
+    Per-request counters, fed by a botocore hook on the shared clients.
+    Thread-local: the hook runs on the calling thread, so calls made by a
+    background snapshot refresh never count towards the request it overlaps.
+    """
+
+    def __init__(self):
+        self.ddb_calls = 0
+        self.radius_cache = None
+
+_REQUEST_METRICS = _RequestMetrics()
+
+def _count_ddb_call(**kwargs):
+    _REQUEST_METRICS.ddb_calls += 1
+
+on_dynamodb_call(_count_ddb_call)
+
+def request_ddb_calls() -> int:
+    """DynamoDB calls this thread made since its current request started."""
+    return _REQUEST_METRICS.ddb_calls
 
 # Constants
 SECRET_KEY = os.environ['JWT_SECRET']
+
+# 'table': session id cookie looked up in sessions_table on every request.
+# 'signed': cookie is a signed token embedding user and session ids, verified
+# locally; table-backed cookies keep working so clients migrate on /bootstrap.
+SESSION_MODE = os.environ.get('SESSION_MODE', 'table')
+SESSION_TTL_DAYS = 30
+REVOKED_SESSION_PREFIX = 'revoked#'
 RADIUS_1_METERS = 50
 RADIUS_2_KM = 7
 RADIUS_3_KM = 13
 
+# /flow/map viewport clustering
+CLUSTER_MAX_ZOOM = 14      # from this map zoom on, every pin is sent individually
+CLUSTER_TILE_SHIFT = 2     # cluster cells are tiles of (zoom + 2), ~64 px on screen
+CLUSTER_MIN_CENTRES = 5    # sparser cells are sent as plain pins
+
+# A 304 for /flow/map lets the client keep its CTA tokens, so the ETag
+# changes at least this often (tokens live 10 minutes)
+ETAG_TOKEN_WINDOW_SECONDS = 300
+
+# Response compression: smaller bodies are not worth the CPU (or the base64 overhead)
+COMPRESS_MIN_BYTES = 1024
+COMPRESSED_CACHE_ENTRIES = 32
+
 # T$ amounts
 DISCOVER_COST = 60
 FIRST_LOCATION_BONUS = 60
@@ -63,8 +136,6 @@ def calculate_help_earnings(centre_type: str, help_type: str, radius3_count: int
 
 def calculate_distance(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
     """Calculate distance between two points in kilometers"""
-    from math import radians, sin, cos, sqrt, atan2
-    
     R = 6371  # Earth's radius in km
     lat1, lng1, lat2, lng2 = map(radians, [lat1, lng1, lat2, lng2])
     dlat = lat2 - lat1
@@ -75,8 +146,18 @@ def calculate_distance(lat1: float, lng1: float, lat2: float, lng2: float) -> fl
     
     return R * c
 
-def get_user_radius_context(user_location: Dict, centres: List[Dict]) -> Dict:
-    """Determine user's radius context for all centres"""
+def get_user_radius_context(user_location: Dict, centres: List[Dict],
+                            index: Optional[GridIndex] = None,
+                            engine: Optional[DistanceEngine] = None,
+                            density: Optional[DensityGrid] = None) -> Dict:
+    """
+    Determine user's radius context for all centres.
+    With a spatial `index` built over `centres`, only centres in nearby
+    cells are measured; with a matching `engine` they are classified in
+    one batch instead of one calculate_distance call per centre.
+    With a matching `density` grid radius3_count is read from it and only
+    radius1/radius2 are classified (radius3_centres is then left empty).
+    """
     context = {
         'radius1_centres': [],
         'radius2_centres': [],
@@ -89,7 +170,24 @@ def get_user_radius_context(user_location: Dict, centres: List[Dict]) -> Dict:
     
     user_lat = user_location['lat']
     user_lng = user_location['lng']
-    
+    outer_km = RADIUS_3_KM if density is None else RADIUS_2_KM
+
+    if engine is not None:
+        candidates = index.candidates(user_lat, user_lng, outer_km) if index is not None else None
+        r1, r2, r3 = engine.classify(
+            user_lat, user_lng, RADIUS_1_METERS, RADIUS_2_KM, outer_km, candidates
+        )
+        context['radius1_centres'] = [centres[i]['id'] for i in r1]
+        context['radius2_centres'] = [centres[i]['id'] for i in r2]
+        context['radius3_centres'] = [centres[i]['id'] for i in r3]
+        context['radius3_count'] = len(r3)
+        if density is not None:
+            context['radius3_count'] = radius3_count_at(density, user_lat, user_lng)
+        return context
+
+    if index is not None:
+        centres = [centres[i] for i in index.candidates(user_lat, user_lng, outer_km)]
+
     for centre in centres:
         distance_km = calculate_distance(
             user_lat, user_lng,
@@ -101,78 +199,81 @@ def get_user_radius_context(user_location: Dict, centres: List[Dict]) -> Dict:
             context['radius1_centres'].append(centre['id'])
         elif distance_km <= RADIUS_2_KM:
             context['radius2_centres'].append(centre['id'])
-        elif distance_km <= RADIUS_3_KM:
+        elif distance_km <= outer_km:
             context['radius3_centres'].append(centre['id'])
     
     context['radius3_count'] = len(context['radius3_centres'])
+    if density is not None:
+        context['radius3_count'] = radius3_count_at(density, user_lat, user_lng)
     return context
 
+def radius3_count_at(density: DensityGrid, lat: float, lng: float) -> int:
+    """Centres in the radius3 band around the point (beyond RADIUS_2_KM, within RADIUS_3_KM)."""
+    return density.count_within(lat, lng, RADIUS_3_KM) - density.count_within(lat, lng, RADIUS_2_KM)
+
 def lambda_handler(event, context):
     """Main Lambda handler with routing (works for REST v1 and HTTP v2)"""
-    # Path
-    path = event.get('path') or event.get('rawPath') or '/'
-    for prefix in ('/dev', '/prod', '/staging'):
-        if path.startswith(prefix + '/'):
-            path = path[len(prefix):]
-            break
+    return ROUTER.dispatch(event)
 
-    # Method
-    if 'httpMethod' in event:  # REST v1
-        method = event['httpMethod']
-    else:  # HTTP v2
-        method = (event.get('requestContext', {})
-                      .get('http', {})
-                      .get('method', 'GET'))
-
-    # Body (handle base64 + non-JSON)
-    body_raw = event.get('body') or '{}'
-    if event.get('isBase64Encoded'):
-        import base64
-        body_raw = base64.b64decode(body_raw).decode('utf-8')
-    try:
-        body = json.loads(body_raw) if isinstance(body_raw, str) else (body_raw or {})
-    except json.JSONDecodeError:
-        body = {}
-
-    # Headers (be lenient on casing)
-    headers = event.get('headers') or {}
-    auth = headers.get('Authorization') or headers.get('authorization')
-    if auth and auth.startswith('Bearer '):
-        session_token = auth.split(' ', 1)[1]
-    cookie_header = headers.get('Cookie') or headers.get('cookie') or ''
-
-    # Extract session from cookie
-    session_token = None
-    if cookie_header:
-        for cookie in cookie_header.split('; '):
-            if cookie.startswith('session='):
-                session_token = cookie.split('=', 1)[1]
-                break
-    if not session_token and auth and auth.startswith('Bearer '):
-        session_token = auth.split(' ', 1)[1]
-    
-    # Route to appropriate handler
-    if path == '/bootstrap' and method == 'POST':
-        return handle_bootstrap(body, session_token)
-    elif path == '/flow/map' and method == 'POST':
-        return handle_flow_map(body, session_token)
-    elif path.startswith('/centre/') and path.endswith('/open') and method == 'POST':
-        centre_id = path.split('/')[2]
-        return handle_open_centre(centre_id, body, session_token)
-    elif path.startswith('/centre/') and path.endswith('/read') and method == 'GET':
-        centre_id = path.split('/')[2]
-        return handle_centre_read(centre_id, session_token)
-    elif path == '/cta/execute' and method == 'POST':
-        return handle_cta_execute(body, session_token)
-    elif path == '/flow/nudges' and method == 'POST':
-        return handle_nudges(body, session_token)
-    elif path == '/help/plan' and method == 'POST':
-        return handle_help_plan(body, session_token)
+def compress_response(response: Dict, accept_encoding: Optional[str], shared: bool = False) -> Dict:
+    """
+    Content-Encoding negotiation for JSON bodies of COMPRESS_MIN_BYTES or
+    more. The compressed body goes back base64-encoded with isBase64Encoded:
+    the HTTP API (httpApi, payload v2) decodes it to the raw compressed bytes
+    and passes our Content-Encoding through, so only clients whose
+    Accept-Encoding allowed it ever get a compressed body; the rest get the
+    JSON unchanged. `shared` bodies (the same for every user) are compressed
+    once per snapshot; per-user bodies never repeat, so are not cached.
+    """
+    body = response.get('body')
+    if response.get('isBase64Encoded') or not isinstance(body, str) or len(body) < COMPRESS_MIN_BYTES:
+        return response
+
+    headers = response.setdefault('headers', {})
+    headers['Vary'] = 'Accept-Encoding'
+    content_encoding = pick_content_encoding(accept_encoding)
+    if content_encoding is None:
+        return response
+
+    data = body.encode('utf-8')
+    # Shared bodies (the name table) are compressed once per catalogue
+    # snapshot, next to the snapshot's pin fragments
+    snapshot = _CENTRES_CACHE["snapshot"] if shared else None
+    cache = snapshot["compressed"] if snapshot is not None else None
+    key = (content_encoding, hashlib.blake2b(data, digest_size=16).digest()) if cache is not None else None
+    compressed = cache.get(key) if cache is not None else None
+    if compressed is None:
+        compressed = compress(data, content_encoding)
+        if cache is not None:
+            if len(cache) >= COMPRESSED_CACHE_ENTRIES:
+                cache.pop(next(iter(cache)))
+            cache[key] = compressed
+
+    headers['Content-Encoding'] = content_encoding
+    response['body'] = base64.b64encode(compressed).decode('ascii')
+    response['isBase64Encoded'] = True
+    return response
 
+def make_etag(*parts) -> str:
+    """Strong ETag over the values a response body is derived from."""
+    digest = hashlib.sha256(json.dumps(parts, default=str).encode('utf-8')).hexdigest()
+    return f'"{digest[:32]}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match check (weak comparison, as RFC 9110 requires for it)."""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate == '*' or candidate.removeprefix('W/') == etag:
+            return True
+    return False
+
+def not_modified(etag: str, cache_control: str = 'private, no-cache') -> Dict:
     return {
-        "statusCode": 404,
-        "headers": {"Content-Type": "application/json"},
-        "body": json.dumps({"error": "Not found"})
+        'statusCode': 304,
+        'headers': {'ETag': etag, 'Cache-Control': cache_control},
+        'body': ''
     }
 
 def _to_int(v, default=0):
@@ -183,23 +284,28 @@ def _to_int(v, default=0):
     except Exception:
         return default
     
-def handle_centre_read(centre_id: str, session_token: Optional[str]) -> Dict:
+def handle_centre_read(centre_id: str, if_none_match: Optional[str] = None, fresh: bool = False) -> Dict:
     """
     Read-only payload for X:readStatusPage.
     Keeps rules on the server; returns presentation fields only.
+    Answers 304 when the centre's last_update matches the client's ETag.
+    Served from the per-centre cache unless the client asks for `fresh` data.
     """
-    # Ensure we have (or mint) a session; you may also set a cookie in other handlers
-    _ = get_or_create_session(session_token)
-
-    resp = centres_table.get_item(Key={"id": centre_id})
-    item = resp.get("Item")
+    item = get_centre_item(centre_id, fresh)
     if not item:
         return {
             "statusCode": 404,
             "headers": {"Content-Type": "application/json"},
-            "body": json.dumps({"error": "centre not found"})
+            "body": to_json({"error": "centre not found"})
         }
 
+    headers = {"Content-Type": "application/json"}
+    if item.get("last_update"):
+        etag = make_etag("centre", item["id"], item["last_update"])
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        headers.update({"ETag": etag, "Cache-Control": "private, no-cache"})
+
     # Build the shape the frontend expects
     data = {
         "id": item["id"],
@@ -212,15 +318,13 @@ def handle_centre_read(centre_id: str, session_token: Optional[str]) -> Dict:
 
     return {
         "statusCode": 200,
-        "headers": {"Content-Type": "application/json"},
-        "body": json.dumps(data)
+        "headers": headers,
+        "body": to_json(data)
     }
     
-def handle_bootstrap(body: Dict, session_token: Optional[str]) -> Dict:
+def handle_bootstrap(session: Dict, user_ctx: 'UserContext') -> Dict:
     """Handle bootstrap - initial app load"""
-    # Get or create session
-    session = get_or_create_session(session_token)
-    user_state = get_user_state(session['user_id'])
+    user_state = user_ctx.state
     
     # Determine if first access
     is_first_access = user_state.get('first_access_time') is None
@@ -233,14 +337,17 @@ def handle_bootstrap(body: Dict, session_token: Optional[str]) -> Dict:
         'tutorial': {}
     }
     
-    if is_first_access:
-        # Mark first access
+    if is_first_access and not session.get('provisional'):
+        # Mark first access (provisional users keep seeing the tutorial until persisted)
+        first_access_time = datetime.utcnow().isoformat()
         users_table.update_item(
             Key={'user_id': session['user_id']},
             UpdateExpression='SET first_access_time = :time',
-            ExpressionAttributeValues={':time': datetime.utcnow().isoformat()}
+            ExpressionAttributeValues={':time': first_access_time}
         )
-        
+        user_ctx.apply({'first_access_time': first_access_time})
+
+    if is_first_access:
         response['tutorial']['home'] = [
             {
                 'message': 'Welcome to Health Waze! Save time finding healthcare.',
@@ -251,18 +358,72 @@ def handle_bootstrap(body: Dict, session_token: Optional[str]) -> Dict:
     return {
         'statusCode': 200,
         'headers': {
-            'Set-Cookie': f"session={session['session_id']}; HttpOnly; Secure; SameSite=Strict; Path=/",
+            'Set-Cookie': session_cookie(session),
             'Content-Type': 'application/json'
         },
-        'body':json_dumps_safe(response)
+        'body':to_json(response)
     }
 
-# small hot-cache with TTL; survives across warm invocations
+# small hot-cache with TTL; survives across warm invocations.
+# "snapshot" is swapped as a whole so readers never mix lists and indexes
+# from different scans while a background refresh is running.
 _CENTRES_CACHE = {
-    "items": None,
+    "snapshot": None,      # {"catalogue", "index", "engine", "version", "watermark", "built_at", ...}
     "expires_at": 0.0,
-    "ttl_seconds": 30.0,   # tune as you like; centres are basically static
+    "ttl_seconds": 30.0,   # how often the catalogue version is probed
+    "full_rebuild_seconds": 600.0,  # full scan cadence; picks up deletions and disabled flags
+    # Rescanned at least this often even when the version has not moved, for
+    # writers that do not bump it (e.g. scripts/seed_data.py)
+    "max_age_seconds": 900.0,
+    "refreshing": False,
 }
+_CENTRES_LOCK = threading.Lock()
+
+# Re-read a little before the watermark: the last_update index is eventually
+# consistent and writers' clocks are not perfectly in sync
+DELTA_OVERLAP_SECONDS = 60
+
+# /flow/map delta responses: clients further behind than this get everything
+MAP_DELTA_MAX_VERSIONS = 50
+
+# Radius1/radius2 classifications memoized per quantized location cell
+# (~5.6 m), LRU ordered; radius3 is counted from the density grid instead.
+# Each entry is the classification seen from the cell's centre, minus the few
+# centres close enough to a radius edge that their band can change within the
+# cell; those are re-measured against the actual point. Entries hold catalogue
+# indices, so they are cleared whenever the snapshot's Catalogue object changes
+# (a rescan or delta refresh can rebuild it, reordered, at the same version).
+RADIUS_CELL_DEG = 0.00005
+RADIUS_CONTEXT_CACHE_ENTRIES = 4096
+_RADIUS_CONTEXTS: 'OrderedDict[Tuple[int, int], Dict]' = OrderedDict()
+_RADIUS_CONTEXTS_OWNER = {"catalogue": None}
+RADIUS_CACHE_STATS = {"hits": 0, "misses": 0, "refined": 0}
+# Farther than any point of a cell from its centre (half-diagonal is ~0.707 cells)
+_RADIUS_CELL_REACH_KM = 0.75 * RADIUS_CELL_DEG * KM_PER_DEG_LAT
+
+# Per-centre detail items for the centre pages, LRU ordered:
+# centre id -> (catalogue version it was read at, read time, item or None if
+# missing). Like the snapshot, entries are re-read after its max age even if
+# the version has not moved, to pick up writers that do not bump it.
+CENTRE_DETAIL_CACHE_ENTRIES = 2048
+_CENTRE_DETAILS: 'OrderedDict[str, Tuple[int, float, Optional[Dict]]]' = OrderedDict()
+# Catalogue version for containers that have not built a snapshot yet
+_DETAIL_VERSION = {"version": None, "expires_at": 0.0}
+
+# Change log entries never change once written; version -> centre ids
+_CHANGELOG_CACHE: Dict[int, List[str]] = {}
+
+# Region shards (catalogue.py) for counts around a point: a container without
+# the full snapshot loads only the shards the radius-3 circle touches. Each
+# shard is cached on its own, LRU ordered, and its version is re-probed after
+# REGION_SHARD_TTL_SECONDS. Needs every centre to carry its region
+# (scripts/backfill_regions.py), hence opt-in. Only these counts use shards:
+# /flow/map, /centres and /centres/names still load the full catalogue.
+REGION_SHARDS = os.environ.get('REGION_SHARDS', '0') == '1'
+REGION_SHARD_TTL_SECONDS = 30.0
+REGION_SHARD_CACHE_ENTRIES = 256
+# region -> {"version", "density", "expires_at"}
+_REGION_SHARDS: 'OrderedDict[str, Dict]' = OrderedDict()
 
 def _now_epoch() -> float:
     return time.time()
@@ -293,55 +454,601 @@ def _normalize_centre_item(it: Dict) -> Optional[Dict]:
         "last_update": it.get("last_update"),
     }
 
-def get_all_centres() -> List[Dict]:
+def _scan_centres() -> List[Dict]:
+    """Full paginated scan of the centres table, normalized (projected, see store.py)."""
+    return store.scan_centres(centres_table.name)
+
+def _build_snapshot(centres: Union[List[Dict], Catalogue], version: int, built_at: Optional[float] = None,
+                    spatial: Optional[Dict] = None) -> Dict:
     """
-    Return every centre (as normalized dicts) from DynamoDB.
-    Uses a short in-memory cache for warm Lambda invocations.
+    Bundle the centres, as a Catalogue, with the structures derived from it.
+    `spatial` reuses the index/engine of a previous snapshot whose
+    centre positions are unchanged.
     """
-    global _CENTRES_CACHE
-    if _CENTRES_CACHE["items"] and _now_epoch() < _CENTRES_CACHE["expires_at"]:
-        return _CENTRES_CACHE["items"]
+    catalogue = centres if isinstance(centres, Catalogue) else Catalogue(centres)
+    if spatial is None:
+        spatial = {
+            "index": GridIndex(catalogue.lat, catalogue.lng),
+            "engine": DistanceEngine(catalogue.lat, catalogue.lng),
+        }
+    return {
+        "catalogue": catalogue,
+        "index": spatial["index"],
+        "engine": spatial["engine"],
+        "version": version,
+        "watermark": catalogue.watermark,
+        "built_at": _now_epoch() if built_at is None else built_at,  # last full scan
+        "tiles": {},       # tile zoom -> {(x, y): [centre indices]}, filled lazily
+        "clusters": {},    # (tile zoom, (x, y)) -> cluster summary, filled lazily
+        "density": spatial.get("density"),  # DensityGrid, filled lazily, see _snapshot_density
+        "pins": {},        # pin variant -> [encoded pin or None per centre], filled lazily
+        "columns": None,   # schema 2 pin columns, filled lazily
+        "names": None,     # encoded name table, filled lazily
+        "compressed": {},  # (content encoding, body digest) -> compressed body, see compress_response
+    }
 
-    items: List[Dict] = []
-    scan_kwargs: Dict = {}
-    while True:
-        resp = centres_table.scan(**scan_kwargs)
-        items.extend(resp.get("Items", []))
-        lek = resp.get("LastEvaluatedKey")
-        if not lek:
-            break
-        scan_kwargs["ExclusiveStartKey"] = lek
+def _query_changed_centres(since: str) -> List[Tuple[str, Optional[Dict]]]:
+    """(id, normalized centre or None) for items touched at or after `since`, via the last_update index."""
+    return [
+        changed
+        for partition in catalogue_partitions()
+        for changed in store.query_changed_centres(centres_table.name, CATALOGUE_INDEX, partition, since)
+    ]
 
-    centres: List[Dict] = []
-    for it in items:
-        n = _normalize_centre_item(it)
-        if n:
+def _merge_centres(snapshot: Dict, changed: List[Tuple[str, Optional[Dict]]], version: int) -> Dict:
+    """
+    Apply changed centres (None = drop) to a snapshot, returning a new one.
+    The spatial structures are kept unless a centre was added, dropped or moved.
+    """
+    centres = list(snapshot["catalogue"].centres())
+    positions = dict(snapshot["catalogue"].positions)
+    dropped = set()
+    moved = False
+
+    for cid, n in changed:
+        i = positions.get(cid)
+        if n is None:
+            if i is not None:
+                dropped.add(i)
+        elif i is None:
+            positions[n["id"]] = len(centres)
             centres.append(n)
+            moved = True
+        else:
+            old = centres[i]
+            moved = moved or old["lat"] != n["lat"] or old["lng"] != n["lng"]
+            centres[i] = n
+
+    if dropped:
+        centres = [c for i, c in enumerate(centres) if i not in dropped]
+
+    spatial = None if (moved or dropped) else snapshot
+    return _build_snapshot(centres, version, snapshot["built_at"], spatial)
+
+def _full_snapshot(version: int) -> Dict:
+    """
+    Snapshot of every centre at `version`: mapped from the file the
+    background jobs published for it (no DynamoDB reads), else a full scan.
+    """
+    if version and snapshot_file.enabled():
+        try:
+            catalogue = snapshot_file.load(version)
+        except Exception as e:
+            print(f"Published centres snapshot v{version} unusable, scanning: {e}")
+            catalogue = None
+        if catalogue is not None:
+            return _build_snapshot(catalogue, version)
+    return _build_snapshot(_scan_centres(), version)
+
+def _refresh_centres(version: int, rescan: bool = False) -> None:
+    """
+    Rebuild the snapshot for `version` (read before querying, so it is never
+    newer than the data). Between periodic full scans only centres whose
+    last_update passed the snapshot's watermark are fetched and merged.
+    `rescan` forces a table scan, skipping any published snapshot file.
+    On failure the current snapshot is kept and the next request re-probes.
+    """
+    try:
+        current = _CENTRES_CACHE["snapshot"]
+        delta_ok = (
+            not rescan
+            and current is not None
+            and current["watermark"]
+            and _now_epoch() - current["built_at"] < _CENTRES_CACHE["full_rebuild_seconds"]
+        )
+        if rescan:
+            snapshot = _build_snapshot(_scan_centres(), version)
+        elif delta_ok:
+            try:
+                since = datetime.fromisoformat(current["watermark"]) - timedelta(seconds=DELTA_OVERLAP_SECONDS)
+                snapshot = _merge_centres(current, _query_changed_centres(since.isoformat()), version)
+            except Exception as e:
+                print(f"Incremental centres refresh failed, doing a full rebuild: {e}")
+                snapshot = _full_snapshot(version)
+        else:
+            snapshot = _full_snapshot(version)
+        _CENTRES_CACHE["snapshot"] = snapshot
+        _CENTRES_CACHE["expires_at"] = _now_epoch() + _CENTRES_CACHE["ttl_seconds"]
+    except Exception as e:
+        if _CENTRES_CACHE["snapshot"] is None:
+            raise
+        print(f"Centres refresh to v{version} failed, serving the stale snapshot: {e}")
+    finally:
+        _CENTRES_CACHE["refreshing"] = False
+
+def _probe_catalogue_version() -> Optional[int]:
+    try:
+        return read_catalogue_version(centres_table)
+    except Exception as e:
+        print(f"Catalogue version probe failed: {e}")
+        return None
+
+def get_centres_snapshot() -> Dict:
+    """
+    Current catalogue snapshot for warm Lambda invocations.
+    After the TTL, one GetItem on the catalogue version decides whether a
+    re-scan is needed; while it runs, the stale snapshot keeps being served.
+    A snapshot older than max_age_seconds is rescanned whatever the version.
 
-    # cache the normalized list
-    _CENTRES_CACHE["items"] = centres
-    _CENTRES_CACHE["expires_at"] = _now_epoch() + _CENTRES_CACHE["ttl_seconds"]
-    return centres
+    The refresh runs on a daemon thread, which Lambda freezes along with the
+    rest of the container between invocations: a refresh started late in one
+    invocation finishes during a later one, and its first call may go out on
+    a pooled connection that did not survive the freeze. botocore retries
+    such calls; if the refresh still fails, the stale snapshot stays and the
+    next request after the TTL starts another one.
+    """
+    snapshot = _CENTRES_CACHE["snapshot"]
+    if snapshot is not None and _now_epoch() < _CENTRES_CACHE["expires_at"]:
+        return snapshot
+
+    version = _probe_catalogue_version()
+
+    if snapshot is None:
+        # Cold container: nothing stale to serve, build inline
+        with _CENTRES_LOCK:
+            if _CENTRES_CACHE["snapshot"] is None:
+                _CENTRES_CACHE["refreshing"] = True
+                _refresh_centres(version or 0)
+        return _CENTRES_CACHE["snapshot"]
+
+    expired = _now_epoch() - snapshot["built_at"] >= _CENTRES_CACHE["max_age_seconds"]
+    if version is not None and version == snapshot["version"] and not expired:
+        _CENTRES_CACHE["expires_at"] = _now_epoch() + _CENTRES_CACHE["ttl_seconds"]
+        return snapshot
+
+    with _CENTRES_LOCK:
+        if not _CENTRES_CACHE["refreshing"]:
+            _CENTRES_CACHE["refreshing"] = True
+            threading.Thread(
+                target=_refresh_centres,
+                args=(snapshot["version"] if version is None else version,
+                      expired and version == snapshot["version"]),
+                daemon=True,
+            ).start()
+    return snapshot
+
+def get_all_centres() -> List[Dict]:
+    """Return every centre (as normalized dicts) from the cached snapshot."""
+    return list(get_centres_snapshot()["catalogue"].centres())
+
+def _parse_viewport(body: Dict) -> Tuple[Optional[Tuple[float, float, float, float]], Optional[int]]:
+    """Optional {'bbox': {south, west, north, east}, 'zoom': int} from a /flow/map body."""
+    bbox = body.get('bbox')
+    if not isinstance(bbox, dict):
+        return None, None
+    try:
+        box = (float(bbox['south']), float(bbox['west']), float(bbox['north']), float(bbox['east']))
+    except (KeyError, TypeError, ValueError):
+        return None, None
+
+    try:
+        zoom = max(0, min(22, int(body['zoom']))) if body.get('zoom') is not None else None
+    except (TypeError, ValueError):
+        zoom = None
+    return box, zoom
+
+def _in_bbox(lat: float, lng: float, bbox: Tuple[float, float, float, float]) -> bool:
+    south, west, north, east = bbox
+    if not south <= lat <= north:
+        return False
+    if west <= east:
+        return west <= lng <= east
+    return lng >= west or lng <= east  # viewport crosses the antimeridian
+
+def _snapshot_tiles(snapshot: Dict, tile_zoom: int) -> Dict:
+    tiles = snapshot["tiles"].get(tile_zoom)
+    if tiles is None:
+        catalogue = snapshot["catalogue"]
+        tiles = bucket_by_tile(catalogue.lat, catalogue.lng, tile_zoom)
+        snapshot["tiles"][tile_zoom] = tiles
+    return tiles
+
+def _snapshot_density(snapshot: Dict) -> DensityGrid:
+    density = snapshot["density"]
+    if density is None:
+        catalogue = snapshot["catalogue"]
+        density = DensityGrid(catalogue.lat, catalogue.lng)
+        snapshot["density"] = density
+    return density
+
+def _region_shards(regions: List[str]) -> List[Dict]:
+    """
+    The cached shards for `regions`. Expired ones are re-validated with one
+    BatchGetItem of their versions (read before querying, like the full
+    refresh) and re-queried only if the version moved.
+    """
+    now = _now_epoch()
+    stale = [r for r in regions if r not in _REGION_SHARDS or now >= _REGION_SHARDS[r]["expires_at"]]
+    if stale:
+        versions = read_region_versions(dynamodb(), centres_table, stale)
+        for region in stale:
+            shard = _REGION_SHARDS.get(region)
+            if shard is None or shard["version"] != versions[region]:
+                catalogue = Catalogue(store.query_region_centres(centres_table.name, REGION_INDEX, region))
+                shard = {"version": versions[region], "density": DensityGrid(catalogue.lat, catalogue.lng)}
+            shard["expires_at"] = now + REGION_SHARD_TTL_SECONDS
+            _REGION_SHARDS[region] = shard
+    for region in regions:
+        _REGION_SHARDS.move_to_end(region)
+    shards = [_REGION_SHARDS[r] for r in regions]
+    while len(_REGION_SHARDS) > REGION_SHARD_CACHE_ENTRIES:
+        _REGION_SHARDS.popitem(last=False)
+    return shards
+
+def radius3_count_near(lat: float, lng: float) -> int:
+    """
+    radius3_count_at over the whole catalogue. From the full snapshot when
+    this container has one; otherwise from the region shards the radius-3
+    circle touches (shards are disjoint, so their counts add up).
+    """
+    if REGION_SHARDS and _CENTRES_CACHE["snapshot"] is None:
+        try:
+            shards = _region_shards(regions_within(lat, lng, RADIUS_3_KM))
+            return sum(radius3_count_at(shard["density"], lat, lng) for shard in shards)
+        except Exception as e:
+            print(f"Region shard read failed, using the full catalogue: {e}")
+    return radius3_count_at(_snapshot_density(get_centres_snapshot()), lat, lng)
+
+def _radius_band(distance_km: float) -> int:
+    """1, 2 or 3 for the radius band at this distance (same tests as DistanceEngine.classify), else 0."""
+    if distance_km * 1000 <= RADIUS_1_METERS:
+        return 1
+    if distance_km <= RADIUS_2_KM:
+        return 2
+    if distance_km <= RADIUS_3_KM:
+        return 3
+    return 0
+
+def _radius_cell_entry(snapshot: Dict, lat: float, lng: float) -> Dict:
+    """Radius1/radius2 classification from a cell centre, split into settled centres and edge centres."""
+    reach = _RADIUS_CELL_REACH_KM
+    edges_km = (RADIUS_1_METERS / 1000, RADIUS_2_KM)
+    candidates = snapshot['index'].candidates(lat, lng, RADIUS_2_KM + reach)
+    distances = snapshot['engine'].distances_km(lat, lng, candidates)
+
+    entry = {"r1": [], "r2": [], "edges": []}
+    for i, d in zip(candidates, distances):
+        d = float(d)
+        if any(abs(d - edge) <= reach for edge in edges_km):
+            entry["edges"].append(i)
+            continue
+        band = _radius_band(d)
+        if band == 1:
+            entry["r1"].append(i)
+        elif band == 2:
+            entry["r2"].append(i)
+    return entry
+
+def _radius_context_from_entry(snapshot: Dict, entry: Dict, lat: float, lng: float) -> Dict:
+    ids = snapshot['catalogue'].ids
+    r1, r2 = entry["r1"], entry["r2"]
+    if entry["edges"]:
+        r1, r2 = list(r1), list(r2)
+        for i, d in zip(entry["edges"], snapshot['engine'].distances_km(lat, lng, entry["edges"])):
+            band = _radius_band(float(d))
+            if band == 1:
+                r1.append(i)
+            elif band == 2:
+                r2.append(i)
+        r1.sort()
+        r2.sort()
+    return {
+        'radius1_centres': [ids[i] for i in r1],
+        'radius2_centres': [ids[i] for i in r2],
+        'radius3_centres': [],
+        'radius3_count': radius3_count_at(_snapshot_density(snapshot), lat, lng),
+    }
+
+def get_radius_context(snapshot: Dict, location: Optional[Dict]) -> Dict:
+    """
+    get_user_radius_context over the snapshot, with radius3 as a count read
+    from the snapshot's density grid at the actual point. The radius1 and
+    radius2 classification is memoized by location cell; a hit re-measures
+    only the cell's edge centres, so the result is exact for any point in
+    the cell.
+    """
+    if not location:
+        return get_user_radius_context(location, [])
+
+    if _RADIUS_CONTEXTS_OWNER["catalogue"] is not snapshot["catalogue"]:
+        _RADIUS_CONTEXTS.clear()
+        _RADIUS_CONTEXTS_OWNER["catalogue"] = snapshot["catalogue"]
+
+    lat, lng = location['lat'], location['lng']
+    key = (floor(lat / RADIUS_CELL_DEG), floor(lng / RADIUS_CELL_DEG))
+    entry = _RADIUS_CONTEXTS.get(key)
+    if entry is not None:
+        _RADIUS_CONTEXTS.move_to_end(key)
+        RADIUS_CACHE_STATS["hits"] += 1
+        _REQUEST_METRICS.radius_cache = "hit"
+    else:
+        entry = _radius_cell_entry(snapshot, (key[0] + 0.5) * RADIUS_CELL_DEG, (key[1] + 0.5) * RADIUS_CELL_DEG)
+        _RADIUS_CONTEXTS[key] = entry
+        while len(_RADIUS_CONTEXTS) > RADIUS_CONTEXT_CACHE_ENTRIES:
+            _RADIUS_CONTEXTS.popitem(last=False)
+        RADIUS_CACHE_STATS["misses"] += 1
+        _REQUEST_METRICS.radius_cache = "miss"
+    if entry["edges"]:
+        RADIUS_CACHE_STATS["refined"] += 1
+    return _radius_context_from_entry(snapshot, entry, lat, lng)
+
+def _snapshot_centre(snapshot: Dict, centre_id: str) -> Optional[Dict]:
+    catalogue = snapshot["catalogue"]
+    i = catalogue.positions.get(centre_id)
+    return catalogue.centre(i) if i is not None else None
+
+# /flow/map pin variants: what the user sees of a centre
+PIN_LOCKED = 'locked'              # grey pin, no status
+PIN_LOCKED_NEARBY = 'nearby'       # still locked, but status is readable from radius1
+PIN_UNLOCKED = 'unlocked'
+
+# Schema 2 coordinates are sent as integers of 1e-5 degrees (~1 m)
+PIN_COORD_SCALE = 100_000
 
-def get_centre(centre_id: str) -> Optional[Dict]:
+def _pin_fragment(snapshot: Dict, i: int, variant: str) -> bytes:
+    """Encoded JSON of one pin variant; the same bytes for every user until the snapshot changes."""
+    fragments = snapshot["pins"].get(variant)
+    if fragments is None:
+        fragments = snapshot["pins"].setdefault(variant, [None] * len(snapshot["catalogue"]))
+    fragment = fragments[i]
+    if fragment is None:
+        catalogue = snapshot["catalogue"]
+        pin = {
+            'id': catalogue.ids[i],
+            'name': catalogue.names[i],
+            'lat': catalogue.lat[i],
+            'lng': catalogue.lng[i],
+            'locked': variant != PIN_UNLOCKED,
+            'type': catalogue.type(i),
+        }
+        # status only when unlocked or user currently in radius1 (read rules)
+        if variant != PIN_LOCKED:
+            pin['status'] = catalogue.status(i)
+            pin['lastUpdate'] = catalogue.last_update[i]
+        fragment = fragments[i] = to_json_bytes(pin)
+    return fragment
+
+def _changed_since(snapshot: Dict, since_version: int) -> Optional[set]:
+    """
+    Ids of the centres changed after `since_version` up to the snapshot's
+    version, or None when that range cannot be diffed (too old, or a
+    writer did not log its changes).
+    """
+    version = snapshot['version']
+    if since_version > version or version - since_version > MAP_DELTA_MAX_VERSIONS:
+        return None
+
+    wanted = range(since_version + 1, version + 1)
+    missing = [v for v in wanted if v not in _CHANGELOG_CACHE]
+    if missing:
+        _CHANGELOG_CACHE.update(read_catalogue_changes(dynamodb(), centres_table, missing))
+        for v in [v for v in _CHANGELOG_CACHE if v <= version - MAP_DELTA_MAX_VERSIONS]:
+            del _CHANGELOG_CACHE[v]
+
+    changed = set()
+    for v in wanted:
+        ids = _CHANGELOG_CACHE.get(v)
+        if ids is None:
+            return None
+        changed.update(ids)
+    return changed
+
+def _parse_since(since) -> Tuple[Optional[int], Optional[str]]:
+    """Split a client's `since` ("<catalogue version>.<view key>") from a previous map response."""
+    if not isinstance(since, str) or '.' not in since:
+        return None, None
+    version, view_key = since.split('.', 1)
+    try:
+        return int(version), view_key
+    except ValueError:
+        return None, None
+
+def _catalogue_key(snapshot: Dict) -> str:
+    """Short id of the snapshot's catalogue, for caches keyed by catalogue version."""
+    return make_etag('catalogue', snapshot['version'], snapshot['watermark'], len(snapshot['catalogue']))[1:13]
+
+def _snapshot_columns(snapshot: Dict) -> Dict:
+    """Quantized coordinates and dictionary-coded type/status per centre (schema 2)."""
+    columns = snapshot["columns"]
+    if columns is None:
+        catalogue = snapshot["catalogue"]
+        # Sorted value tables, so codes do not depend on catalogue order
+        types = sorted({str(t) for t in catalogue.types})
+        statuses = sorted(st for st in catalogue.statuses if isinstance(st, str))
+        type_remap = [types.index(str(t)) for t in catalogue.types]
+        status_remap = [statuses.index(st) if isinstance(st, str) else None for st in catalogue.statuses]
+        columns = {
+            'lat': [round(v * PIN_COORD_SCALE) for v in catalogue.lat],
+            'lng': [round(v * PIN_COORD_SCALE) for v in catalogue.lng],
+            'type': [type_remap[code] for code in catalogue.type_codes],
+            'status': [status_remap[code] if code >= 0 else None for code in catalogue.status_codes],
+            'types': types,
+            'statuses': statuses,
+        }
+        snapshot["columns"] = columns
+    return columns
+
+def encode_pin_columns(snapshot: Dict, pins: List[Tuple[int, str]]) -> Dict:
+    """
+    Schema 2 pins: parallel arrays instead of one object per pin.
+    Coordinates are integers in 1/PIN_COORD_SCALE degrees, type and status
+    index into the `types`/`statuses` tables (status null when hidden), and
+    `locked` is a base64 bitmap, bit k (LSB first) for the k-th pin.
+    Names come from GET /centres/names for `names_version`.
+    """
+    catalogue = snapshot["catalogue"]
+    columns = _snapshot_columns(snapshot)
+    lat, lng, type_col, status_col = columns['lat'], columns['lng'], columns['type'], columns['status']
+    locked = bytearray((len(pins) + 7) // 8)
+    out = {'ids': [], 'lat': [], 'lng': [], 'type': [], 'status': [], 'lastUpdate': []}
+    for k, (i, variant) in enumerate(pins):
+        out['ids'].append(catalogue.ids[i])
+        out['lat'].append(lat[i])
+        out['lng'].append(lng[i])
+        out['type'].append(type_col[i])
+        if variant == PIN_LOCKED:
+            out['status'].append(None)
+            out['lastUpdate'].append(None)
+        else:
+            out['status'].append(status_col[i])
+            out['lastUpdate'].append(catalogue.last_update[i])
+        if variant != PIN_UNLOCKED:
+            locked[k >> 3] |= 1 << (k & 7)
+    out.update({
+        'count': len(pins),
+        'scale': PIN_COORD_SCALE,
+        'types': columns['types'],
+        'statuses': columns['statuses'],
+        'locked': base64.b64encode(bytes(locked)).decode('ascii'),
+        'names_version': _catalogue_key(snapshot),
+    })
+    return out
+
+def _cluster_summary(snapshot: Dict, tile_zoom: int, key: Tuple[int, int], members: List[int]) -> Dict:
+    """Count, centroid and dominant status of one tile; cached per snapshot."""
+    summary = snapshot["clusters"].get((tile_zoom, key))
+    if summary is None:
+        catalogue = snapshot["catalogue"]
+        statuses = Counter(
+            st for st in map(catalogue.status, members) if isinstance(st, str)
+        )
+        summary = {
+            'id': f"{tile_zoom}/{key[0]}/{key[1]}",
+            'lat': sum(catalogue.lat[i] for i in members) / len(members),
+            'lng': sum(catalogue.lng[i] for i in members) / len(members),
+            'count': len(members),
+            'status': statuses.most_common(1)[0][0] if statuses else None,
+        }
+        snapshot["clusters"][(tile_zoom, key)] = summary
+    return summary
+
+def get_viewport_layout(snapshot: Dict, bbox: Tuple[float, float, float, float],
+                        zoom: Optional[int]) -> Tuple[List[int], List[Dict]]:
+    """
+    Split the centres inside `bbox` into individual pins and, below
+    CLUSTER_MAX_ZOOM, per-tile clusters for dense areas.
+    Returns (pin indices in catalogue order, cluster summaries).
+    """
+    cluster = zoom is not None and zoom < CLUSTER_MAX_ZOOM
+    tile_zoom = (zoom if cluster else CLUSTER_MAX_ZOOM) + CLUSTER_TILE_SHIFT
+    tiles = _snapshot_tiles(snapshot, tile_zoom)
+    lat, lng = snapshot["catalogue"].lat, snapshot["catalogue"].lng
+
+    south, west, north, east = bbox
+    x0, y0 = tile_xy(north, west, tile_zoom)
+    x1, y1 = tile_xy(south, east, tile_zoom)
+    xs = range(x0, x1 + 1) if x0 <= x1 else [*range(x0, 1 << tile_zoom), *range(0, x1 + 1)]
+
+    if len(xs) * (y1 - y0 + 1) <= len(tiles):
+        keys = [(x, y) for x in xs for y in range(y0, y1 + 1) if (x, y) in tiles]
+    else:
+        xset = set(xs)
+        keys = [k for k in tiles if k[0] in xset and y0 <= k[1] <= y1]
+
+    pins: List[int] = []
+    clusters: List[Dict] = []
+    for key in keys:
+        members = tiles[key]
+        if cluster and len(members) >= CLUSTER_MIN_CENTRES:
+            clusters.append(_cluster_summary(snapshot, tile_zoom, key, members))
+        else:
+            pins.extend(i for i in members if _in_bbox(lat[i], lng[i], bbox))
+
+    pins.sort()
+    return pins, clusters
+
+def _detail_cache_version() -> Optional[int]:
+    """
+    Catalogue version cached centre items are checked against. Uses the
+    snapshot's when there is one; otherwise probes (a /read must not pay
+    for a full scan) at the snapshot's TTL.
+    """
+    if _CENTRES_CACHE["snapshot"] is not None:
+        return get_centres_snapshot()["version"]
+    now = _now_epoch()
+    if now >= _DETAIL_VERSION["expires_at"]:
+        _DETAIL_VERSION["version"] = _probe_catalogue_version()
+        _DETAIL_VERSION["expires_at"] = now + _CENTRES_CACHE["ttl_seconds"]
+    return _DETAIL_VERSION["version"]
+
+def get_centre_item(centre_id: str, fresh: bool = False) -> Optional[Dict]:
+    """
+    One centre's detail item (store.CENTRE_DETAIL_FIELDS), read through the
+    per-centre cache. Entries are dropped whenever the catalogue version
+    moves on, or once they are older than the snapshot's max age. `fresh`
+    skips the cache and does a strongly consistent read.
+    Callers must not mutate the returned dict.
+    """
+    version = _detail_cache_version()
+    now = _now_epoch()
+    if not fresh and version is not None:
+        hit = _CENTRE_DETAILS.get(centre_id)
+        if hit is not None and hit[0] == version and now - hit[1] < _CENTRES_CACHE["max_age_seconds"]:
+            _CENTRE_DETAILS.move_to_end(centre_id)
+            return hit[2]
+
+    item = store.get_centre(centres_table.name, centre_id, consistent=fresh)
+    if version is not None:
+        _CENTRE_DETAILS[centre_id] = (version, now, item)
+        _CENTRE_DETAILS.move_to_end(centre_id)
+        while len(_CENTRE_DETAILS) > CENTRE_DETAIL_CACHE_ENTRIES:
+            _CENTRE_DETAILS.popitem(last=False)
+    return item
+
+def get_centre(centre_id: str, fresh: bool = False) -> Optional[Dict]:
     """Fetch a single centre by id (normalized)."""
-    resp = centres_table.get_item(Key={"id": centre_id})
-    it = resp.get("Item")
+    it = get_centre_item(centre_id, fresh)
     return _normalize_centre_item(it) if it else None
 
-def get_unlocked_centres(user_id: str) -> List[str]:
+def _pin_variants(count: int, indices, unlocked_bits: bytearray,
+                  nearby_bits: bytearray) -> List[Tuple[int, str]]:
     """
-    Minimal implementation: read a 'unlocked_centres' list from the user item.
-    If absent, return empty list (pins will still render as locked).
+    (centre index, pin variant) for `indices`, or for all `count` centres
+    when None. The whole-catalogue case walks the bitsets a byte at a time,
+    so a run of eight plain locked pins costs one test.
     """
-    try:
-        resp = users_table.get_item(Key={"user_id": user_id}, ProjectionExpression="unlocked_centres")
-        item = resp.get("Item") or {}
-        unlocked = item.get("unlocked_centres") or []
-        # DynamoDB string sets may arrive as set(...); normalize to list
-        return list(unlocked) if not isinstance(unlocked, list) else unlocked
-    except Exception:
-        return []
+    pins = []
+    append = pins.append
+    if indices is None:
+        for byte in range(len(unlocked_bits)):
+            u, n, base = unlocked_bits[byte], nearby_bits[byte], byte << 3
+            if not (u | n):
+                for i in range(base, min(base + 8, count)):
+                    append((i, PIN_LOCKED))
+                continue
+            for k in range(min(8, count - base)):
+                if u >> k & 1:
+                    append((base + k, PIN_UNLOCKED))
+                else:
+                    append((base + k, PIN_LOCKED_NEARBY if n >> k & 1 else PIN_LOCKED))
+        return pins
+    for i in indices:
+        byte, k = i >> 3, i & 7
+        if unlocked_bits[byte] >> k & 1:
+            append((i, PIN_UNLOCKED))
+        else:
+            append((i, PIN_LOCKED_NEARBY if nearby_bits[byte] >> k & 1 else PIN_LOCKED))
+    return pins
 
 def check_can_earn_by_info(user_id: str, radius_ctx: Dict) -> bool:
     """
@@ -350,58 +1057,99 @@ def check_can_earn_by_info(user_id: str, radius_ctx: Dict) -> bool:
     """
     return bool(radius_ctx.get("radius1_centres") or radius_ctx.get("radius2_centres"))
 
-def handle_flow_map(body: Dict, session_token: str) -> Dict:
-    session = get_or_create_session(session_token)
-    user_state = get_user_state(session['user_id'])
+def handle_flow_map(body: Dict, session: Dict, user_ctx: 'UserContext',
+                    if_none_match: Optional[str] = None) -> Dict:
+    user_state = user_ctx.state
     location = body.get('location')
 
-    centres = get_all_centres()                  # ← implemented
-    radius_ctx = get_user_radius_context(location, centres)
-    unlocked = get_unlocked_centres(session['user_id'])  # ← implemented
+    snapshot = get_centres_snapshot()
+    catalogue = snapshot['catalogue']
+    radius_ctx = get_radius_context(snapshot, location)
+    unlocked = user_ctx.unlocked
 
-    pins = []
-    for c in centres:
-        pin = {
-            'id': c['id'],
-            'name': c['name'],
-            'lat': float(c['lat']),
-            'lng': float(c['lng']),
-            'locked': c['id'] not in unlocked,
-            'type': c.get('type', 'A'),
-        }
-        # status only when unlocked or user currently in radius1 (read rules)
-        if (not pin['locked']) or (c['id'] in radius_ctx['radius1_centres']):
-            pin['status'] = c.get('status')
-            pin['lastUpdate'] = c.get('last_update')
-        pins.append(pin)
+    # Optional viewport: only pins inside it, dense areas folded into clusters
+    bbox, zoom = _parse_viewport(body)
+    # Clients opt into the columnar pin encoding with {'schema': '2'}
+    schema = '2' if str(body.get('schema', '1')) == '2' else '1'
+
+    # Delta responses: `since` echoes the `version` of an earlier reply, i.e. the
+    # catalogue version plus a key over everything else the pins depend on.
+    # Only pins changed since then are sent, unless that range cannot be diffed.
+    view_key = make_etag(
+        'view', sorted(unlocked), sorted(radius_ctx['radius1_centres']), bbox, zoom, schema
+    )[1:13]
+    since_version, since_view = _parse_since(body.get('since'))
+    delta_ids = None
+    if since_version is not None and since_view == view_key:
+        delta_ids = _changed_since(snapshot, since_version)
+
+    # Conditional response: everything the body depends on goes into the ETag.
+    # The first-location bonus has side effects, so it always gets a full reply.
+    etag = None
+    grants_bonus = bool(location) and user_state.get('first_location_shared') is None
+    if not grants_bonus:
+        can_discover = user_state.get('balance', 0) >= DISCOVER_COST
+        etag = make_etag(
+            'map', snapshot['version'], snapshot['watermark'], len(catalogue),
+            session['user_id'], sorted(unlocked), can_discover,
+            sorted(radius_ctx['radius1_centres']), radius_ctx['radius3_count'],
+            check_can_earn_by_info(session['user_id'], radius_ctx),
+            bbox, zoom, schema, since_version if delta_ids is not None else None,
+            int(_now_epoch() // ETAG_TOKEN_WINDOW_SECONDS) if can_discover else None,
+        )
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+    # Id sets as bitsets over catalogue indices; a delta only visits changed indices
+    unlocked_bits = catalogue.bitset(unlocked)
+    nearby_bits = catalogue.bitset(radius_ctx['radius1_centres'])
+    delta_bits = catalogue.bitset(delta_ids) if delta_ids is not None else None
+    clusters = []
+    if bbox is not None:
+        visible, clusters = get_viewport_layout(snapshot, bbox, zoom)
+        any_locked = any(not unlocked_bits[i >> 3] >> (i & 7) & 1 for i in visible)
+        if delta_bits is not None:
+            visible = [i for i in visible if delta_bits[i >> 3] >> (i & 7) & 1]
+    else:
+        any_locked = Catalogue.count(unlocked_bits) < len(catalogue)
+        visible = Catalogue.members(delta_bits) if delta_bits is not None else None
+    pin_variants = _pin_variants(len(catalogue), visible, unlocked_bits, nearby_bits)
+
+    # Changed centres that are gone, or no longer visible, are sent as removals
+    removed = []
+    if delta_ids is not None:
+        removed = sorted(delta_ids.difference(catalogue.ids[i] for i, _ in pin_variants))
 
     highlights = []
 
+    # One grant covers every locked pin in the response instead of a token per centre
     entitlements = []
-    if user_state.get('balance', 0) >= DISCOVER_COST:
-        for c in centres:
-            if c['id'] in unlocked:
-                continue
-            entitlements.append({
-                'cta': 'discover',
-                'centre_id': c['id'],
-                'token': generate_cta_token(
-                    session['user_id'], 'discover', c['id'], radius_ctx['radius3_count']
-                ),
-                'limit': '1/h',
-            })
+    if user_state.get('balance', 0) >= DISCOVER_COST and any_locked:
+        entitlements.append({
+            'cta': 'discover',
+            'scope': 'map',
+            'token': generate_map_grant_token(
+                session['user_id'], 'discover', radius_ctx['radius3_count'], bbox
+            ),
+            'limit': '1/h',
+        })
 
     response = {
-        'schema': '1',
-        'pins': pins,
+        'schema': schema,
+        'version': f"{snapshot['version']}.{view_key}",
+        'clusters': clusters,
         'highlights': highlights,
         'overlays': [],
         'entitlements': entitlements,
         'pages_after': None
     }
+    if delta_ids is not None:
+        # pins: added or changed since `since`; removed: ids to drop from the map
+        response['delta'] = True
+        response['removed'] = removed
 
-    if location and user_state.get('first_location_shared') is None:
-        credit_user_balance(session['user_id'], FIRST_LOCATION_BONUS, 'first_location_share')
+    if grants_bonus:
+        persist_session(session)
+        credit_user_balance(session['user_id'], FIRST_LOCATION_BONUS, 'first_location_share', user_ctx)
         response['overlays'].append({
             'type': 'success',
             'message': 'Congrats! You earned 1 hour.',
@@ -412,6 +1160,7 @@ def handle_flow_map(body: Dict, session_token: str) -> Dict:
             UpdateExpression='SET first_location_shared = :true',
             ExpressionAttributeValues={':true': True}
         )
+        user_ctx.apply({'first_location_shared': True})
         response['tutorial'] = {
             'map': [
                 {
@@ -435,64 +1184,107 @@ def handle_flow_map(body: Dict, session_token: str) -> Dict:
                 'anchor': 'balance'
             })
 
+    headers = {'Content-Type': 'application/json'}
+    if etag:
+        headers.update({'ETag': etag, 'Cache-Control': 'private, no-cache'})
+    if session.get('cookie_changed'):
+        headers['Set-Cookie'] = session_cookie(session)
+
+    if schema == '2':
+        response['pins'] = encode_pin_columns(snapshot, pin_variants)
+        body_out = to_json(response)
+    else:
+        # Pins are spliced in from per-snapshot encoded fragments, see _pin_fragment
+        pins = [_pin_fragment(snapshot, i, variant) for i, variant in pin_variants]
+        body_out = encode_with_pins(response, pins).decode('utf-8')
+
     return {
         'statusCode': 200,
-        'headers': {'Content-Type': 'application/json'},
-        'body': json_dumps_safe(response)   # safer for any Decimal left around
+        'headers': headers,
+        'body': body_out
     }
 
-def json_dumps_safe(obj):
-    """json.dumps that converts Decimal -> int/float recursively"""
-    def convert(o):
-        if isinstance(o, list):
-            return [convert(i) for i in o]
-        if isinstance(o, dict):
-            return {k: convert(v) for k, v in o.items()}
-        if isinstance(o, Decimal):
-            return int(o) if o % 1 == 0 else float(o)
-        return o
-    return json.dumps(convert(obj))
-
-def handle_open_centre(centre_id: str, body: Dict, session_token: str) -> Dict:
+def encode_with_pins(response: Dict, pins: List[bytes]) -> bytes:
+    """JSON of `response` with a 'pins' array made of already encoded pin fragments."""
+    rest = to_json_bytes(response)
+    return b''.join((rest[:-1], b',"pins":[' if len(rest) > 2 else b'"pins":[', b','.join(pins), b']}'))
+
+def handle_centre_names(if_none_match: Optional[str] = None) -> Dict:
+    """
+    Centre id -> name table for schema 2 map responses.
+    The same for every user; clients keep it until `version` changes.
+    """
+    snapshot = get_centres_snapshot()
+    version = _catalogue_key(snapshot)
+    etag = f'"{version}"'
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag, 'public, no-cache')
+
+    if snapshot['names'] is None:
+        catalogue = snapshot['catalogue']
+        snapshot['names'] = to_json({
+            'version': version,
+            'ids': catalogue.ids,
+            'names': catalogue.names,
+        })
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json', 'ETag': etag, 'Cache-Control': 'public, no-cache'},
+        'body': snapshot['names']
+    }
+
+def handle_open_centre(centre_id: str, body: Dict, session: Dict, fresh: bool = False) -> Dict:
     """Handle opening a centre - decides X vs Y pages"""
-    # session = get_session(session_token)
-    session = get_or_create_session(session_token)
     location = body.get('location')
     
     # Get centre and user context
-    centre = get_centre(centre_id)
-    radius_context = get_user_radius_context(location, [centre])
+    centre = get_centre(centre_id, fresh)
+    if centre is None:
+        return {
+            'statusCode': 404,
+            'headers': {'Content-Type': 'application/json'},
+            'body': to_json({'error': 'centre not found'})
+        }
+    in_radius1 = bool(location) and calculate_distance(
+        location['lat'], location['lng'], centre['lat'], centre['lng']
+    ) * 1000 <= RADIUS_1_METERS
     
     # Determine page type
-    if centre_id in radius_context['radius1_centres']:
+    if in_radius1:
+        # Auto-unlock below writes to the user: persist a provisional session first
+        persist_session(session)
         shows = 'Y'  # ReadWrite page
+        # Earnings scale with the centres around the user, counted over the whole catalogue
+        radius3_count = radius3_count_near(location['lat'], location['lng'])
         entitlements = generate_write_entitlements(
             session['user_id'],
             centre_id,
             centre['type'],
-            radius_context['radius3_count']
+            radius3_count
         )
     else:
         shows = 'X'  # ReadOnly page
         entitlements = []
     
     # Auto-unlock if in radius1
-    if centre_id in radius_context['radius1_centres']:
+    if in_radius1:
         unlock_centre(session['user_id'], centre_id, 'radius1')
     
+    headers = {'Content-Type': 'application/json'}
+    if session.get('cookie_changed'):
+        headers['Set-Cookie'] = session_cookie(session)
+
     return {
         'statusCode': 200,
-        'headers': {'Content-Type': 'application/json'},
-        'body': json.dumps({
+        'headers': headers,
+        'body': to_json({
             'shows': shows,
             'entitlements': entitlements
         })
     }
 
-def handle_cta_execute(body: Dict, session_token: str) -> Dict:
+def handle_cta_execute(body: Dict, session: Dict, user_ctx: 'UserContext') -> Dict:
     """Execute a CTA with token validation"""
-    # session = get_session(session_token)
-    session = get_or_create_session(session_token)
     cta_id = body['cta_id']
     token = body['token']
     payload = body.get('payload', {})
@@ -504,52 +1296,50 @@ def handle_cta_execute(body: Dict, session_token: str) -> Dict:
         # Verify token claims
         if claims['sub'] != session['user_id']:
             raise ValueError('Token user mismatch')
-        if claims['cta'] != cta_id:
+        if claims.get('cta') != cta_id:
             raise ValueError('Token CTA mismatch')
-        if claims.get('centre_id') != payload.get('centre_id'):
+        if claims.get('scope') == 'map':
+            check_map_grant(claims, payload.get('centre_id'), user_ctx)
+        elif claims.get('centre_id') != payload.get('centre_id'):
             raise ValueError('Token centre mismatch')
             
     except (jwt.ExpiredSignatureError, jwt.InvalidTokenError, ValueError) as e:
         return {
             'statusCode': 403,
             'headers': {'Content-Type': 'application/json'},
-            'body': json_dumps_safe({'error': 'Invalid or expired token'})
+            'body': to_json({'error': 'Invalid or expired token'})
         }
     
-    # Execute CTA based on type
+    # Execute CTA based on type; every CTA writes, so persist a provisional session
+    persist_session(session)
     if cta_id == 'discover':
-        result = execute_discover(session['user_id'], payload['centre_id'])
+        result = execute_discover(session['user_id'], payload['centre_id'], user_ctx)
     elif cta_id.startswith('help.'):
-        result = execute_help_action(session['user_id'], cta_id, payload, claims)
+        result = execute_help_action(session['user_id'], cta_id, payload, claims, user_ctx)
     else:
         return {
             'statusCode': 400,
             'headers': {'Content-Type': 'application/json'},
-            'body': json_dumps_safe({'error': 'Unknown CTA'})
+            'body': to_json({'error': 'Unknown CTA'})
         }
     
+    headers = {'Content-Type': 'application/json'}
+    if session.get('cookie_changed'):
+        headers['Set-Cookie'] = session_cookie(session)
+
     return {
         'statusCode': 200,
-        'headers': {'Content-Type': 'application/json'},
-        'body': json_dumps_safe(result)
+        'headers': headers,
+        'body': to_json(result)
     }
 
-def execute_discover(user_id: str, centre_id: str) -> Dict:
+def execute_discover(user_id: str, centre_id: str, user_ctx: Optional['UserContext'] = None) -> Dict:
     """Execute discover action - unlock a centre"""
-    user_state = get_user_state(user_id)
-    
-    # Check balance
-    if user_state['balance'] < DISCOVER_COST:
-        raise ValueError('Insufficient balance')
-    
-    # Deduct cost
-    debit_user_balance(user_id, DISCOVER_COST, f'discover:{centre_id}')
+    # Deduct cost; the conditional update raises ValueError on insufficient balance
+    new_balance = debit_user_balance(user_id, DISCOVER_COST, f'discover:{centre_id}', user_ctx)
     
     # Unlock centre  
-    unlock_centre(user_id, centre_id, 'radius2')
-    
-    # Get updated balance
-    new_balance = user_state['balance'] - DISCOVER_COST
+    unlock_centre(user_id, centre_id, 'radius2', user_ctx)
     
     return {
         'success': True,
@@ -557,7 +1347,8 @@ def execute_discover(user_id: str, centre_id: str) -> Dict:
         'message': 'Centre unlocked!'
     }
 
-def execute_help_action(user_id: str, cta_id: str, payload: Dict, claims: Dict) -> Dict:
+def execute_help_action(user_id: str, cta_id: str, payload: Dict, claims: Dict,
+                        user_ctx: Optional['UserContext'] = None) -> Dict:
     """Execute a help action"""
     centre_id = payload['centre_id']
     # centre = get_centre(centre_id)
@@ -591,16 +1382,11 @@ def execute_help_action(user_id: str, cta_id: str, payload: Dict, claims: Dict)
     # Record help action
     # record_help_action(user_id, centre_id, cta_id, payload)
     
-    # Get updated balance
-    user_state = get_user_state(user_id)
+    # Current balance (already folded in from any write above)
+    user_state = (user_ctx or UserContext(user_id, CTA_USER_FIELDS)).state
     bal = user_state.get('balance', 0)
-    try:
-        # Convert Decimal -> int (or float) explicitly
-        from decimal import Decimal as _D
-        if isinstance(bal, _D):
-            bal = int(bal) if bal % 1 == 0 else float(bal)
-    except Exception:
-        pass
+    if isinstance(bal, Decimal):
+        bal = int(bal) if bal % 1 == 0 else float(bal)
  
     return {
         'success': True,
@@ -663,6 +1449,40 @@ def generate_cta_token(user_id: str, cta: str, centre_id: str, radius3_count: in
     
     return jwt.encode(payload, SECRET_KEY, algorithm='HS256')
 
+def generate_map_grant_token(user_id: str, cta: str, radius3_count: int,
+                             bbox: Optional[Tuple[float, float, float, float]] = None) -> str:
+    """
+    Short-lived CTA token valid for any centre the user has locked when it
+    is used, limited to the map viewport (if any) it was issued for
+    """
+    now = datetime.utcnow()
+    payload = {
+        'sub': user_id,
+        'cta': cta,
+        'scope': 'map',
+        'radius3_count': radius3_count,
+        'exp': now + timedelta(minutes=10),
+        'iat': now
+    }
+    if bbox is not None:
+        payload['bbox'] = list(bbox)
+    return jwt.encode(payload, SECRET_KEY, algorithm='HS256')
+
+def check_map_grant(claims: Dict, centre_id: Optional[str], user_ctx: 'UserContext') -> None:
+    """Raise ValueError unless a map grant covers `centre_id` for this user."""
+    if not centre_id:
+        raise ValueError('Token centre mismatch')
+    if centre_id in user_ctx.unlocked:
+        raise ValueError('Centre already unlocked')
+
+    # Centres created after this container's snapshot are read directly
+    centre = _snapshot_centre(get_centres_snapshot(), centre_id) or get_centre(centre_id)
+    if centre is None:
+        raise ValueError('Unknown centre')
+    bbox = claims.get('bbox')
+    if bbox and not _in_bbox(centre['lat'], centre['lng'], tuple(bbox)):
+        raise ValueError('Centre outside granted viewport')
+
 def format_time_amount(minutes: int) -> str:
     """Format minutes as human-readable time"""
     if minutes < 60:
@@ -673,53 +1493,254 @@ def format_time_amount(minutes: int) -> str:
         return f"{hours} hour{'s' if hours > 1 else ''}"
     return f"{hours}h {mins}min"
 
+def generate_session_token(session_id: str, user_id: str, provisional: bool = False) -> str:
+    """Signed, expiring session cookie value (SESSION_MODE=signed)"""
+    now = datetime.utcnow()
+    payload = {
+        'typ': 'session',
+        'sid': session_id,
+        'sub': user_id,
+        'iat': now,
+        'exp': now + timedelta(days=SESSION_TTL_DAYS)
+    }
+    if provisional:
+        payload['prv'] = True  # user/session not persisted yet
+    return jwt.encode(payload, SECRET_KEY, algorithm='HS256')
+
+def verify_session_token(token: str) -> Optional[Dict]:
+    """Claims of a valid signed session token, or None."""
+    try:
+        claims = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
+    except jwt.InvalidTokenError:
+        return None
+    if claims.get('typ') != 'session' or not claims.get('sid') or not claims.get('sub'):
+        return None
+    return claims
+
+def revoke_session(session_id: str, expires_at: Optional[int] = None) -> None:
+    """
+    Add a signed session to the revocation list (checked on sensitive routes).
+    Entries live in sessions_table under REVOKED_SESSION_PREFIX keys, which
+    are never valid session ids, and expire with the token via its TTL.
+    """
+    if expires_at is None:
+        expires_at = int((datetime.utcnow() + timedelta(days=SESSION_TTL_DAYS)).timestamp())
+    sessions_table.put_item(Item={
+        'session_id': f"{REVOKED_SESSION_PREFIX}{session_id}",
+        'revoked_at': datetime.utcnow().isoformat(),
+        'ttl': expires_at
+    })
+
+def is_session_revoked(session_id: str) -> bool:
+    response = sessions_table.get_item(
+        Key={'session_id': f"{REVOKED_SESSION_PREFIX}{session_id}"},
+        ProjectionExpression='session_id'
+    )
+    return 'Item' in response
+
 # Helper functions for data access
-def get_or_create_session(session_token: Optional[str]) -> Dict:
-    """Get existing session or create new anonymous one"""
-    if session_token:
+def get_or_create_session(session_token: Optional[str], sensitive: bool = False) -> Dict:
+    """
+    Get existing session or start a new anonymous one.
+    Signed tokens are verified locally; only `sensitive` routes pay a
+    lookup against the revocation list. Other values are table session ids.
+
+    New anonymous sessions are provisional: nothing is written until the
+    first stateful write calls persist_session(), so drive-by traffic
+    (crawlers, health checks, prefetches) costs no write capacity. Their
+    cookie is a signed token (in either mode), so the ids a provisional
+    session is later persisted under are always ones the server issued.
+    """
+    if session_token and session_token.count('.') == 2:
+        claims = verify_session_token(session_token)
+        if claims and not (sensitive and is_session_revoked(claims['sid'])):
+            session = {
+                'session_id': claims['sid'],
+                'user_id': claims['sub'],
+                'token': session_token,
+                'expires_at': claims['exp'],
+            }
+            if claims.get('prv'):
+                session['provisional'] = True
+            return session
+    elif session_token and not session_token.startswith(REVOKED_SESSION_PREFIX):
         try:
-            response = sessions_table.get_item(Key={'session_id': session_token})
-            if 'Item' in response:
-                return response['Item']
+            session = store.get_session(sessions_table.name, session_token)
+            if session:
+                # In signed mode the next Set-Cookie migrates it to a signed token (session_cookie)
+                return session
         except:
             pass
-    
-    # Create new anonymous session
-    import uuid
-    session_id = str(uuid.uuid4())
-    user_id = f"anon_{uuid.uuid4()}"
-    
-    # Create anonymous user
-    users_table.put_item(Item={
-        'user_id': user_id,
-        'anonymous': True,
-        'balance': 0,
-        'created_at': datetime.utcnow().isoformat()
-    })
-    
-    # Create session
-    sessions_table.put_item(Item={
-        'session_id': session_id,
-        'user_id': user_id,
-        'created_at': datetime.utcnow().isoformat(),
-        'ttl': int((datetime.utcnow() + timedelta(days=30)).timestamp())
-    })
-    
-    return {'session_id': session_id, 'user_id': user_id}
 
-def get_user_state(user_id: str) -> Dict:
-    """Get complete user state"""
-    response = users_table.get_item(Key={'user_id': user_id})
-    return response.get('Item', {'balance': 0})
+    return _new_provisional_session()
+
+def _new_provisional_session() -> Dict:
+    session = {
+        'session_id': str(uuid.uuid4()),
+        'user_id': f"anon_{uuid.uuid4()}",
+        'provisional': True,
+        'is_new': True,   # nothing stored for this user yet, no need to read it
+    }
+    return session
+
+def _session_puts(session: Dict, now: datetime) -> List[Dict]:
+    puts = [{
+        'Put': {
+            'TableName': users_table.name,
+            'Item': {
+                'user_id': session['user_id'],
+                'anonymous': True,
+                'balance': 0,
+                'created_at': now.isoformat()
+            },
+            'ConditionExpression': 'attribute_not_exists(user_id)'
+        }
+    }]
+    if SESSION_MODE != 'signed':
+        puts.append({
+            'Put': {
+                'TableName': sessions_table.name,
+                'Item': {
+                    'session_id': session['session_id'],
+                    'user_id': session['user_id'],
+                    'created_at': now.isoformat(),
+                    'ttl': int((now + timedelta(days=SESSION_TTL_DAYS)).timestamp())
+                },
+                'ConditionExpression': 'attribute_not_exists(session_id)'
+            }
+        })
+    return puts
+
+def _already_persisted(session: Dict) -> bool:
+    """True when the session's rows exist as this very session wrote them (a retried request)."""
+    if SESSION_MODE == 'signed':
+        # The user id comes from a signed token, so an existing row is this session's own
+        key, table, owner = {'user_id': session['user_id']}, users_table, 'user_id'
+    else:
+        key, table, owner = {'session_id': session['session_id']}, sessions_table, 'user_id'
+    item = table.get_item(Key=key, ConsistentRead=True).get('Item')
+    return item is not None and item.get(owner) == session['user_id']
+
+def persist_session(session: Dict) -> Dict:
+    """
+    Write a provisional session's user (and, in table mode, session) rows
+    in one transaction. No-op for sessions that already exist.
+    Rows are never adopted from another session: if an id turns out to be
+    taken by someone else, the session is re-minted under fresh ids.
+    """
+    if not session.get('provisional'):
+        return session
+
+    client = dynamodb().meta.client
+    for _ in range(2):
+        try:
+            client.transact_write_items(TransactItems=_session_puts(session, datetime.utcnow()))
+            break
+        except client.exceptions.TransactionCanceledException:
+            if _already_persisted(session):
+                break
+            session['session_id'] = str(uuid.uuid4())
+            session['user_id'] = f"anon_{uuid.uuid4()}"
+    else:
+        raise RuntimeError('Could not persist a new session')
+
+    session.pop('provisional', None)
+    session.pop('is_new', None)
+    # The provisional token is spent: session_cookie issues the persisted
+    # session's cookie (a signed token, or in table mode the session id)
+    session.pop('token', None)
+    session.pop('expires_at', None)
+    session['cookie_changed'] = True
+    return session
 
-def credit_user_balance(user_id: str, amount: int, reason: str):
+def session_cookie(session: Dict) -> str:
+    """
+    Set-Cookie value for the session. Signed tokens (provisional ones in
+    either mode) are minted here, so only when a cookie is actually sent.
+    """
+    token = session.get('token')
+    if token is None and (session.get('provisional') or SESSION_MODE == 'signed'):
+        token = session['token'] = generate_session_token(
+            session['session_id'], session['user_id'], provisional=bool(session.get('provisional'))
+        )
+    return f"session={token or session['session_id']}; HttpOnly; Secure; SameSite=Strict; Path=/"
+
+def handle_signout(session: Dict) -> Dict:
+    """
+    End the session and clear its cookie. A signed token goes on the
+    revocation list until it expires; a table session's row is deleted.
+    """
+    if session.get('expires_at') is not None:
+        revoke_session(session['session_id'], session['expires_at'])
+    elif not session.get('provisional'):
+        sessions_table.delete_item(Key={'session_id': session['session_id']})
+
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Set-Cookie': 'session=; HttpOnly; Secure; SameSite=Strict; Path=/; Max-Age=0',
+            'Content-Type': 'application/json'
+        },
+        'body': to_json({'success': True})
+    }
+
+# User attributes each route reads; UserContext projects on these
+BOOTSTRAP_USER_FIELDS = ('balance', 'first_access_time')
+MAP_USER_FIELDS = ('balance', 'unlocked_centres', 'first_location_shared')
+CTA_USER_FIELDS = ('balance', 'unlocked_centres')
+
+class UserContext:
+    """
+    Request-scoped view of one user item.
+    The item is read at most once, projected on the fields the route needs;
+    writes made through credit/debit/unlock fold their ReturnValues back in
+    instead of re-reading.
+    """
+
+    def __init__(self, user_id: str, fields: Tuple[str, ...] = MAP_USER_FIELDS,
+                 is_new: bool = False):
+        self.user_id = user_id
+        self.fields = fields
+        # Users minted in this request have no item yet: start from the defaults
+        self._item: Optional[Dict] = {'balance': 0} if is_new else None
+
+    def _load(self) -> Dict:
+        return store.get_user(users_table.name, self.user_id, self.fields)
+
+    @property
+    def state(self) -> Dict:
+        if self._item is None:
+            self._item = self._load()
+            self._item.setdefault('balance', 0)
+        return self._item
+
+    @property
+    def unlocked(self) -> List[str]:
+        unlocked = self.state.get('unlocked_centres') or []
+        # DynamoDB string sets may arrive as set(...); normalize to list
+        return list(unlocked) if not isinstance(unlocked, list) else unlocked
+
+    def apply(self, attributes: Dict) -> None:
+        """Merge attributes returned by (or written in) an update."""
+        if self._item is not None:
+            self._item.update(attributes)
+
+    @property
+    def ddb_calls(self) -> int:
+        return request_ddb_calls()
+
+def credit_user_balance(user_id: str, amount: int, reason: str,
+                        user_ctx: Optional[UserContext] = None):
     """Add to user balance and record in ledger"""
     # Update balance
-    users_table.update_item(
+    resp = users_table.update_item(
         Key={'user_id': user_id},
         UpdateExpression='ADD balance :amount',
-        ExpressionAttributeValues={':amount': amount}
+        ExpressionAttributeValues={':amount': amount},
+        ReturnValues='UPDATED_NEW'
     )
+    if user_ctx is not None:
+        user_ctx.apply(resp.get('Attributes', {}))
     
     # Record in ledger
     ledger_table.put_item(Item={
@@ -731,7 +1752,8 @@ def credit_user_balance(user_id: str, amount: int, reason: str):
         'timestamp': datetime.utcnow().isoformat()
     })
 
-def debit_user_balance(user_id: str, amount: int, reason: str) -> int:
+def debit_user_balance(user_id: str, amount: int, reason: str,
+                       user_ctx: Optional[UserContext] = None) -> int:
     """
     Atomically subtract `amount` from user balance (non-negative).
     Returns the updated balance (int).
@@ -744,7 +1766,7 @@ def debit_user_balance(user_id: str, amount: int, reason: str) -> int:
         resp = users_table.update_item(
             Key={'user_id': user_id},
             UpdateExpression='SET balance = if_not_exists(balance, :zero) - :amt',
-            ConditionExpression=Attr('balance').gte(Decimal(amount)),
+            ConditionExpression='balance >= :amt',
             ExpressionAttributeValues={
                 ':amt': Decimal(amount),
                 ':zero': Decimal(0),
@@ -753,6 +1775,8 @@ def debit_user_balance(user_id: str, amount: int, reason: str) -> int:
         )
     except users_table.meta.client.exceptions.ConditionalCheckFailedException:
         raise ValueError('Insufficient balance')
+    if user_ctx is not None:
+        user_ctx.apply(resp.get('Attributes', {}))
 
     # Record in ledger (negative)
     ledger_table.put_item(Item={
@@ -768,7 +1792,8 @@ def debit_user_balance(user_id: str, amount: int, reason: str) -> int:
     # new_bal may be Decimal
     return int(new_bal) if isinstance(new_bal, Decimal) else int(new_bal or 0)
 
-def unlock_centre(user_id: str, centre_id: str, scope: str):
+def unlock_centre(user_id: str, centre_id: str, scope: str,
+                  user_ctx: Optional[UserContext] = None):
     """
     Persist unlock for a centre.
     - Prefers a String Set 'unlocked_centres' (ADD).
@@ -776,13 +1801,16 @@ def unlock_centre(user_id: str, centre_id: str, scope: str):
     """
     # Fast path: ADD to a String Set
     try:
-        users_table.update_item(
+        resp = users_table.update_item(
             Key={'user_id': user_id},
             UpdateExpression='ADD unlocked_centres :c',
             ExpressionAttributeValues={
                 ':c': set([centre_id])
-            }
+            },
+            ReturnValues='UPDATED_NEW'
         )
+        if user_ctx is not None:
+            user_ctx.apply(resp.get('Attributes', {}))
         return
     except users_table.meta.client.exceptions.ValidationException:
         # Type mismatch (likely a list) -> fall back below
@@ -791,17 +1819,89 @@ def unlock_centre(user_id: str, centre_id: str, scope: str):
     # Fallback: ensure no duplicates, then list_append
     # Prevent duplicates with a condition
     try:
-        users_table.update_item(
+        resp = users_table.update_item(
             Key={'user_id': user_id},
             UpdateExpression='SET unlocked_centres = list_append(if_not_exists(unlocked_centres, :empty), :new)',
-            ConditionExpression=Attr('unlocked_centres').not_exists() | Attr('unlocked_centres').contains(centre_id).negate(),
+            ConditionExpression='attribute_not_exists(unlocked_centres) OR NOT contains(unlocked_centres, :c)',
             ExpressionAttributeValues={
                 ':empty': [],
                 ':new': [centre_id],
-            }
+                ':c': centre_id,
+            },
+            ReturnValues='UPDATED_NEW'
         )
+        if user_ctx is not None:
+            user_ctx.apply(resp.get('Attributes', {}))
     except users_table.meta.client.exceptions.ConditionalCheckFailedException:
         # Already present in the list -> nothing else to do
         pass
 
     # (Optional) You can persist scope/expiry later in a dedicated table as per your full rules.
+
+# Routing table: each route names what its handler needs, and only that is loaded
+
+def _provide_session(req: Request) -> Dict:
+    session = req.context.get('session')
+    if session is None:
+        token = req.cookie('session') or req.bearer_token()
+        session = get_or_create_session(token, sensitive=req.route.options.get('sensitive', False))
+        req.context['session'] = session
+    return session
+
+def _provide_user(req: Request) -> UserContext:
+    session = _provide_session(req)
+    return UserContext(session['user_id'], req.route.options['user_fields'], session.get('is_new'))
+
+def _not_found(req: Request) -> Dict:
+    return {
+        "statusCode": 404,
+        "headers": {"Content-Type": "application/json"},
+        "body": to_json({"error": "Not found"})
+    }
+
+def metrics_middleware(req: Request, call_next) -> Dict:
+    """One log line per request: route, status, latency, DynamoDB calls and radius cache use."""
+    _REQUEST_METRICS.ddb_calls = 0
+    _REQUEST_METRICS.radius_cache = None
+    start = time.perf_counter()
+    response = call_next(req)
+    line = {
+        'metric': 'route',
+        'route': req.route.name if req.route else f'{req.method} <unmatched>',
+        'status': response.get('statusCode'),
+        'ms': round((time.perf_counter() - start) * 1000, 2),
+        'ddb_calls': request_ddb_calls(),
+    }
+    if _REQUEST_METRICS.radius_cache is not None:
+        line['radius_cache'] = _REQUEST_METRICS.radius_cache
+        line['radius_cache_totals'] = RADIUS_CACHE_STATS
+    print(to_json(line))
+    return response
+
+def compression_middleware(req: Request, call_next) -> Dict:
+    shared = req.route is not None and req.route.options.get('shared_body', False)
+    return compress_response(call_next(req), req.header('accept-encoding'), shared)
+
+ROUTER = Router(
+    providers={
+        'body': lambda req: req.body,
+        'session': _provide_session,
+        'user_ctx': _provide_user,
+        'if_none_match': lambda req: req.header('if-none-match'),
+        'fresh': lambda req: req.query('fresh') in ('1', 'true'),
+    },
+    not_found=_not_found,
+)
+ROUTER.use(metrics_middleware)
+ROUTER.use(compression_middleware)
+
+ROUTER.add('POST', '/bootstrap', handle_bootstrap, ('session', 'user_ctx'),
+           user_fields=BOOTSTRAP_USER_FIELDS)
+ROUTER.add('POST', '/flow/map', handle_flow_map, ('body', 'session', 'user_ctx', 'if_none_match'),
+           user_fields=MAP_USER_FIELDS)
+ROUTER.add('GET', '/centres/names', handle_centre_names, ('if_none_match',), shared_body=True)
+ROUTER.add('POST', '/centre/{centre_id}/open', handle_open_centre, ('body', 'session', 'fresh'))
+ROUTER.add('GET', '/centre/{centre_id}/read', handle_centre_read, ('if_none_match', 'fresh'))
+ROUTER.add('POST', '/cta/execute', handle_cta_execute, ('body', 'session', 'user_ctx'),
+           user_fields=CTA_USER_FIELDS, sensitive=True)
+ROUTER.add('POST', '/auth/signout', handle_signout, ('session',))
@@ -0,0 +1,386 @@
+"""
+Centres catalogue versioning shared by the API and the background jobs
+Writers bump a single version item in the centres table; readers probe it
+with one GetItem to decide whether their cached snapshot is still current.
+Each bump can also log which centres changed, so clients can be sent deltas.
+Centres are also sharded by region (a coarse geocell) with a version per
+shard, so readers and jobs can work on the shards they need.
+Catalogue is the read side's compact in-memory form of the centres.
+"""
+
+import os
+import sys
+import time
+import zlib
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from clients import thread_table
+from geo import cells_within, grid_cell
+
+# Lives in the centres table; it has no lat/lng so it is never a centre
+CATALOGUE_VERSION_ID = '__catalogue_version__'
+
+# Every centre carries catalogue = catalogue_partition(id) so this GSI lists
+# them ordered by last_update; readers query it for incremental refreshes.
+# Centres are spread over CATALOGUE_SHARDS partition values so writes and
+# queries are not all on one partition key; readers query every shard.
+CATALOGUE_INDEX = 'catalogue-last-update-index'
+CATALOGUE_PARTITION = 'centres'
+CATALOGUE_SHARDS = 8
+
+# Change log entries: one item per version listing the centres it touched.
+# They expire (table TTL on `ttl`); readers fall back to a full response
+# whenever an entry in the range they need is missing.
+CHANGELOG_PREFIX = '__changes__#'
+CHANGELOG_TTL_SECONDS = 24 * 3600
+# Larger change sets are not logged: the entry must stay well under
+# DynamoDB's 400 KB item limit
+CHANGELOG_MAX_IDS = 2000
+CHANGELOG_BUMP_ATTEMPTS = 5
+
+# Region shards: every centre carries region = region_key(lat, lng), so this
+# GSI (keyed on region alone, so items without last_update are not left
+# out) lists one shard's centres. Each shard has its own version item; the
+# registry item lists the shards that have centres. Centres written without
+# a region are in no shard; the jobs pick them up with a catch-all scan.
+REGION_INDEX = 'region-index'
+REGION_CELL_DEG = 0.5  # ~55 km: a radius-3 circle (13 km) touches at most 4 shards
+REGION_VERSION_PREFIX = '__region_version__#'
+REGIONS_ID = '__catalogue_regions__'
+
+# Region shards the jobs process at once (each one on its own thread)
+SHARD_WORKERS = int(os.environ.get('SHARD_WORKERS', '8'))
+
+
+def is_catalogue_meta(item) -> bool:
+    """True for bookkeeping items stored alongside the centres."""
+    return bool(item) and str(item.get('id', '')).startswith('__')
+
+
+def catalogue_partition(centre_id: str) -> str:
+    """The last_update index partition of a centre (stable across writers)."""
+    return f'{CATALOGUE_PARTITION}#{zlib.crc32(centre_id.encode()) % CATALOGUE_SHARDS}'
+
+
+def catalogue_partitions() -> List[str]:
+    return [f'{CATALOGUE_PARTITION}#{n}' for n in range(CATALOGUE_SHARDS)]
+
+
+def bump_catalogue_version(centres_table, changed_ids: Optional[Iterable[str]] = None) -> int:
+    """
+    Mark the catalogue as changed; returns the new version number.
+    Pass the ids of the centres that changed to log them for delta
+    responses: the version and its log entry are written in one
+    transaction, so no version is ever visible without its entry. Without
+    ids, or with more than CHANGELOG_MAX_IDS of them, the version is left
+    unlogged and readers treat it as undiffable.
+    """
+    ids = sorted(set(changed_ids)) if changed_ids is not None else None
+    if ids is not None and len(ids) <= CHANGELOG_MAX_IDS:
+        client = centres_table.meta.client
+        for _ in range(CHANGELOG_BUMP_ATTEMPTS):
+            current = int((centres_table.get_item(
+                Key={'id': CATALOGUE_VERSION_ID},
+                ProjectionExpression='#v',
+                ExpressionAttributeNames={'#v': 'version'},
+                ConsistentRead=True
+            ).get('Item') or {}).get('version', 0))
+            version = current + 1
+            try:
+                client.transact_write_items(TransactItems=[
+                    {'Update': {
+                        'TableName': centres_table.name,
+                        'Key': {'id': CATALOGUE_VERSION_ID},
+                        'UpdateExpression': 'SET #v = :version, updated_at = :time',
+                        'ConditionExpression': '#v = :current' if current else 'attribute_not_exists(#v)',
+                        'ExpressionAttributeNames': {'#v': 'version'},
+                        'ExpressionAttributeValues': {
+                            ':version': version,
+                            ':time': datetime.utcnow().isoformat(),
+                            **({':current': current} if current else {})
+                        }
+                    }},
+                    {'Put': {
+                        'TableName': centres_table.name,
+                        'Item': {
+                            'id': f'{CHANGELOG_PREFIX}{version}',
+                            'version': version,
+                            'centres': ids,
+                            'ttl': int(time.time()) + CHANGELOG_TTL_SECONDS
+                        }
+                    }},
+                ])
+                return version
+            except client.exceptions.TransactionCanceledException:
+                continue  # another writer bumped first; retry on top of its version
+        print("Catalogue version kept moving; bumping without a change log entry")
+
+    resp = centres_table.update_item(
+        Key={'id': CATALOGUE_VERSION_ID},
+        UpdateExpression='ADD #v :one SET updated_at = :time',
+        ExpressionAttributeNames={'#v': 'version'},
+        ExpressionAttributeValues={
+            ':one': 1,
+            ':time': datetime.utcnow().isoformat()
+        },
+        ReturnValues='UPDATED_NEW'
+    )
+    return int(resp.get('Attributes', {}).get('version', 0))
+
+
+def publish_catalogue_change(centres_table, changed_ids: Iterable[str]) -> int:
+    """
+    A job's end-of-run step: one version bump (logging `changed_ids`) tells
+    API containers to refresh their cache, and the snapshot file published
+    for it lets them load it without scanning the table. A failed publish
+    is only logged; containers then scan as before. Returns the version.
+    """
+    import snapshot_file  # builds on Catalogue, so it cannot be imported at the top
+    version = bump_catalogue_version(centres_table, changed_ids)
+    try:
+        snapshot_file.publish(centres_table.name, version)
+    except Exception as e:
+        print(f"Error publishing centres snapshot v{version}: {e}")
+    return version
+
+
+def read_catalogue_version(centres_table) -> int:
+    """Current catalogue version (0 if no writer has bumped it yet)."""
+    resp = centres_table.get_item(
+        Key={'id': CATALOGUE_VERSION_ID},
+        ProjectionExpression='#v',
+        ExpressionAttributeNames={'#v': 'version'}
+    )
+    return int((resp.get('Item') or {}).get('version', 0))
+
+
+def region_key(lat: float, lng: float) -> str:
+    """The region shard a centre at this position belongs to."""
+    row, col = grid_cell(float(lat), float(lng), REGION_CELL_DEG)
+    return f'{row}:{col}'
+
+
+def regions_within(lat: float, lng: float, radius_km: float) -> List[str]:
+    """Every region shard a circle of `radius_km` around the point can touch."""
+    return [f'{row}:{col}' for row, col in cells_within(lat, lng, radius_km, REGION_CELL_DEG)]
+
+
+def register_regions(centres_table, regions: Iterable[str]) -> None:
+    """Add shards to the registry (writers call it when they put centres)."""
+    regions = set(regions)
+    if regions:
+        centres_table.update_item(
+            Key={'id': REGIONS_ID},
+            UpdateExpression='ADD #r :regions',
+            ExpressionAttributeNames={'#r': 'regions'},
+            ExpressionAttributeValues={':regions': regions}
+        )
+
+
+def read_regions(centres_table) -> List[str]:
+    """Every registered region shard ([] until centres carry regions)."""
+    resp = centres_table.get_item(
+        Key={'id': REGIONS_ID},
+        ProjectionExpression='#r',
+        ExpressionAttributeNames={'#r': 'regions'}
+    )
+    return sorted((resp.get('Item') or {}).get('regions') or [])
+
+
+def bump_region_version(centres_table, region: str) -> int:
+    """Mark one region shard as changed; returns its new version number."""
+    resp = centres_table.update_item(
+        Key={'id': f'{REGION_VERSION_PREFIX}{region}'},
+        UpdateExpression='ADD #v :one SET updated_at = :time',
+        ExpressionAttributeNames={'#v': 'version'},
+        ExpressionAttributeValues={
+            ':one': 1,
+            ':time': datetime.utcnow().isoformat()
+        },
+        ReturnValues='UPDATED_NEW'
+    )
+    return int(resp.get('Attributes', {}).get('version', 0))
+
+
+def map_shards(centres_table, fn: Callable, shards: List) -> List:
+    """
+    fn(table, shard) for every shard on up to SHARD_WORKERS threads, results
+    in order. Each thread gets its own Table for `centres_table`, since boto3
+    resources cannot be shared between threads.
+    """
+    if not shards:
+        return []
+    with ThreadPoolExecutor(max_workers=min(SHARD_WORKERS, len(shards))) as pool:
+        return list(pool.map(lambda shard: fn(thread_table(centres_table.name), shard), shards))
+
+
+def _batch_get(dynamodb, centres_table, ids: List[str], projection: str, names: Dict[str, str]) -> List[Dict]:
+    items: List[Dict] = []
+    for start in range(0, len(ids), 100):  # BatchGetItem limit
+        request = {centres_table.name: {
+            'Keys': [{'id': i} for i in ids[start:start + 100]],
+            'ProjectionExpression': projection,
+            'ExpressionAttributeNames': names,
+        }}
+        while request:
+            resp = dynamodb.batch_get_item(RequestItems=request)
+            items.extend(resp.get('Responses', {}).get(centres_table.name, []))
+            request = resp.get('UnprocessedKeys') or None
+    return items
+
+
+def read_region_versions(dynamodb, centres_table, regions: List[str]) -> Dict[str, int]:
+    """Current version of each of `regions` (0 for a shard never bumped)."""
+    ids = [f'{REGION_VERSION_PREFIX}{r}' for r in dict.fromkeys(regions)]
+    versions = {r: 0 for r in regions}
+    for item in _batch_get(dynamodb, centres_table, ids, '#i, #v', {'#i': 'id', '#v': 'version'}):
+        versions[item['id'][len(REGION_VERSION_PREFIX):]] = int(item.get('version', 0))
+    return versions
+
+
+def read_centre_regions(dynamodb, centres_table, centre_ids: List[str]) -> Dict[str, str]:
+    """centre id -> region for those of `centre_ids` that have one."""
+    items = _batch_get(dynamodb, centres_table, list(dict.fromkeys(centre_ids)), '#i, #r', {'#i': 'id', '#r': 'region'})
+    return {item['id']: item['region'] for item in items if item.get('region')}
+
+
+def read_catalogue_changes(dynamodb, centres_table, versions: List[int]) -> Dict[int, List[str]]:
+    """Logged centre ids for each of `versions` that still has a change log entry."""
+    out: Dict[int, List[str]] = {}
+    keys = [{'id': f'{CHANGELOG_PREFIX}{v}'} for v in versions]
+    for start in range(0, len(keys), 100):  # BatchGetItem limit
+        request = {centres_table.name: {'Keys': keys[start:start + 100]}}
+        while request:
+            resp = dynamodb.batch_get_item(RequestItems=request)
+            for item in resp.get('Responses', {}).get(centres_table.name, []):
+                out[int(item['version'])] = list(item.get('centres') or [])
+            request = resp.get('UnprocessedKeys') or None
+    return out
+
+
+class Catalogue:
+    """
+    The centres as parallel columns, addressed by catalogue index.
+    Coordinates are array('d'), ids are interned with an id -> index map,
+    type and status are small-int codes into per-catalogue value tables
+    (status code -1 for none), and id sets become bitsets over the indices.
+    Columns may also be read-only views into a mapped snapshot file.
+    Immutable once built; a changed catalogue is a new object.
+    """
+
+    __slots__ = ('ids', 'names', 'lat', 'lng', 'type_codes', 'types', 'status_codes', 'statuses',
+                 'last_update', 'positions', 'watermark')
+
+    def __init__(self, centres: Iterable[Dict]):
+        self.ids: List[str] = []
+        self.names: List[str] = []
+        self.lat = array('d')
+        self.lng = array('d')
+        self.type_codes = array('h')
+        self.types: List[str] = []
+        self.status_codes = array('i')
+        self.statuses: List = []   # str, or whatever map/list value the item carried
+        self.last_update: List[Optional[str]] = []
+        self.positions: Dict[str, int] = {}
+
+        type_lookup: Dict[str, int] = {}
+        status_lookup: Dict = {}
+        for c in centres:
+            cid = sys.intern(c['id'])
+            self.positions[cid] = len(self.ids)
+            self.ids.append(cid)
+            self.names.append(c.get('name', cid))
+            self.lat.append(c['lat'])
+            self.lng.append(c['lng'])
+
+            ctype = c.get('type') or 'A'
+            code = type_lookup.get(ctype)
+            if code is None:
+                code = type_lookup[ctype] = len(self.types)
+                self.types.append(ctype)
+            self.type_codes.append(code)
+
+            status = c.get('status')
+            if status is None:
+                self.status_codes.append(-1)
+            else:
+                key = status if isinstance(status, str) else repr(status)
+                code = status_lookup.get(key)
+                if code is None:
+                    code = status_lookup[key] = len(self.statuses)
+                    self.statuses.append(status)
+                self.status_codes.append(code)
+            self.last_update.append(c.get('last_update'))
+
+        # Newest last_update (ISO strings sort chronologically)
+        self.watermark = max((s for s in self.last_update if isinstance(s, str)), default=None)
+
+    @classmethod
+    def from_columns(cls, ids: List[str], names: List[str], lat, lng, type_codes, types: List[str],
+                     status_codes, statuses: List, last_update: List[Optional[str]],
+                     watermark: Optional[str]) -> 'Catalogue':
+        """
+        Catalogue over prebuilt columns, e.g. memoryviews into a published
+        snapshot file (snapshot_file.py); only the id map is computed.
+        """
+        self = cls.__new__(cls)
+        self.ids, self.names, self.lat, self.lng = ids, names, lat, lng
+        self.type_codes, self.types = type_codes, types
+        self.status_codes, self.statuses = status_codes, statuses
+        self.last_update = last_update
+        self.positions = {cid: i for i, cid in enumerate(ids)}
+        self.watermark = watermark
+        return self
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def type(self, i: int) -> str:
+        return self.types[self.type_codes[i]]
+
+    def status(self, i: int):
+        code = self.status_codes[i]
+        return self.statuses[code] if code >= 0 else None
+
+    def centre(self, i: int) -> Dict:
+        """Centre `i` as a normalized centre dict."""
+        return {
+            'id': self.ids[i],
+            'name': self.names[i],
+            'lat': self.lat[i],
+            'lng': self.lng[i],
+            'type': self.type(i),
+            'status': self.status(i),
+            'last_update': self.last_update[i],
+        }
+
+    def centres(self) -> Iterator[Dict]:
+        return (self.centre(i) for i in range(len(self.ids)))
+
+    def bitset(self, ids: Iterable[str]) -> bytearray:
+        """Bit i set for every id in `ids` at catalogue index i (unknown ids are skipped)."""
+        bits = bytearray((len(self.ids) + 7) >> 3)
+        positions = self.positions
+        for cid in ids:
+            i = positions.get(cid)
+            if i is not None:
+                bits[i >> 3] |= 1 << (i & 7)
+        return bits
+
+    @staticmethod
+    def members(bits: bytearray) -> Iterator[int]:
+        """Indices set in `bits`, ascending; empty bytes are skipped whole."""
+        for byte, b in enumerate(bits):
+            if b:
+                base = byte << 3
+                for k in range(8):
+                    if b >> k & 1:
+                        yield base + k
+
+    @staticmethod
+    def count(bits: bytearray) -> int:
+        # bin().count, not int.bit_count: that needs Python 3.10 and CI runs 3.9
+        return bin(int.from_bytes(bits, 'little')).count('1')
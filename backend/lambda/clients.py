@@ -0,0 +1,155 @@
+"""
+AWS clients shared by the Lambda handlers
+Nothing is created at import: boto3 itself is imported, and each client
+built, the first time it is actually used, then reused for the rest of the
+container's life. Every client shares one botocore config tuned from the
+environment:
+  AWS_CLIENT_POOL_SIZE         connections kept per client (botocore default 10)
+  AWS_CLIENT_KEEPALIVE         TCP keep-alive on pooled sockets (1/0)
+  AWS_CLIENT_CONNECT_TIMEOUT   seconds
+  AWS_CLIENT_READ_TIMEOUT      seconds
+  AWS_RETRY_MODE               legacy, standard or adaptive
+  AWS_MAX_ATTEMPTS             attempts per call, first one included
+"""
+
+import os
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+DDB_ENDPOINT = os.environ.get('DYNAMODB_ENDPOINT')
+S3_ENDPOINT = os.environ.get('S3_ENDPOINT')  # e.g. LocalStack
+
+POOL_SIZE = int(os.environ.get('AWS_CLIENT_POOL_SIZE', '10'))
+TCP_KEEPALIVE = os.environ.get('AWS_CLIENT_KEEPALIVE', '1') == '1'
+CONNECT_TIMEOUT = float(os.environ.get('AWS_CLIENT_CONNECT_TIMEOUT', '2'))
+READ_TIMEOUT = float(os.environ.get('AWS_CLIENT_READ_TIMEOUT', '10'))
+RETRY_MODE = os.environ.get('AWS_RETRY_MODE', 'adaptive')
+MAX_ATTEMPTS = int(os.environ.get('AWS_MAX_ATTEMPTS', '3'))
+
+_LOCK = threading.Lock()
+_SESSION = None
+_CONFIG = None
+_CLIENTS: Dict[Tuple[str, Optional[str]], object] = {}
+_DYNAMODB = None
+_TABLES: Dict[str, object] = {}
+_THREAD = threading.local()  # per-thread DynamoDB resource and its tables, see thread_table
+_DDB_CALL_HOOKS: List[Callable] = []
+
+
+def _session():
+    global _SESSION, _CONFIG
+    if _SESSION is None:
+        import boto3  # deferred: the heaviest import of every handler
+        from botocore.config import Config
+        _CONFIG = Config(
+            max_pool_connections=POOL_SIZE,
+            tcp_keepalive=TCP_KEEPALIVE,
+            connect_timeout=CONNECT_TIMEOUT,
+            read_timeout=READ_TIMEOUT,
+            retries={'mode': RETRY_MODE, 'total_max_attempts': MAX_ATTEMPTS},
+        )
+        _SESSION = boto3.session.Session()
+    return _SESSION
+
+
+def client(service: str, endpoint_url: Optional[str] = None):
+    """
+    Low-level client for `service`, one per endpoint per container.
+    Clients are thread-safe, so worker threads can share them.
+    """
+    key = (service, endpoint_url)
+    c = _CLIENTS.get(key)
+    if c is None:
+        with _LOCK:
+            c = _CLIENTS.get(key)
+            if c is None:
+                session = _session()
+                c = session.client(service, endpoint_url=endpoint_url, config=_CONFIG)
+                if service == 'dynamodb':
+                    for hook in _DDB_CALL_HOOKS:
+                        c.meta.events.register('before-call.dynamodb', hook)
+                _CLIENTS[key] = c
+    return c
+
+
+def dynamodb_client():
+    """
+    Plain low-level DynamoDB client: wire-format attribute values in and out.
+    (The resource's meta.client is not one; boto3 wraps it to (de)serialize.)
+    """
+    return client('dynamodb', DDB_ENDPOINT)
+
+
+def s3():
+    """S3 client (the published centres snapshots, see snapshot_file.py)."""
+    return client('s3', S3_ENDPOINT)
+
+
+def management_api(endpoint_url: str):
+    """API Gateway management client for a WebSocket API stage endpoint."""
+    return client('apigatewaymanagementapi', endpoint_url)
+
+
+def dynamodb():
+    """The container's DynamoDB service resource."""
+    global _DYNAMODB
+    if _DYNAMODB is None:
+        session = _session()
+        resource = session.resource('dynamodb', endpoint_url=DDB_ENDPOINT, config=_CONFIG)
+        for hook in _DDB_CALL_HOOKS:
+            resource.meta.client.meta.events.register('before-call.dynamodb', hook)
+        _DYNAMODB = resource
+    return _DYNAMODB
+
+
+def table(name: str):
+    """Cached Table object for `name`."""
+    t = _TABLES.get(name)
+    if t is None:
+        t = _TABLES[name] = dynamodb().Table(name)
+    return t
+
+
+def thread_table(name: str):
+    """
+    Table object for `name` on a DynamoDB resource owned by the calling
+    thread. Resources, unlike clients, are not thread-safe: worker threads
+    use this instead of sharing table(name).
+    """
+    tables = getattr(_THREAD, 'tables', None)
+    if tables is None:
+        with _LOCK:
+            resource = _session().resource('dynamodb', endpoint_url=DDB_ENDPOINT, config=_CONFIG)
+        for hook in _DDB_CALL_HOOKS:
+            resource.meta.client.meta.events.register('before-call.dynamodb', hook)
+        _THREAD.resource = resource
+        tables = _THREAD.tables = {}
+    t = tables.get(name)
+    if t is None:
+        t = tables[name] = _THREAD.resource.Table(name)
+    return t
+
+
+def on_dynamodb_call(hook: Callable) -> None:
+    """Register a botocore before-call hook on the shared DynamoDB clients."""
+    _DDB_CALL_HOOKS.append(hook)
+    if _DYNAMODB is not None:
+        _DYNAMODB.meta.client.meta.events.register('before-call.dynamodb', hook)
+    for (service, _), c in _CLIENTS.items():
+        if service == 'dynamodb':
+            c.meta.events.register('before-call.dynamodb', hook)
+
+
+class LazyTable:
+    """
+    Module-level stand-in for a DynamoDB Table: resolves the real one on
+    first attribute access, so handlers can keep `users_table.get_item(...)`.
+    """
+
+    __slots__ = ('name',)
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __getattr__(self, attr):
+        return getattr(table(self.name), attr)
@@ -0,0 +1,396 @@
+"""
+Geospatial helpers for centre lookups
+Cell-grid index so radius queries only visit nearby centres, a batch
+haversine kernel (NumPy when available) to classify them in one pass, and
+a prefix-sum density grid that counts centres in a radius without visiting them
+"""
+
+from array import array
+from math import asin, asinh, atan2, ceil, cos, degrees, floor, pi, radians, sin, sqrt, tan
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Optional dependency, imported when the first DistanceEngine is built
+# (it is a large share of cold-start import time); see load_numpy
+np = None
+_NUMPY_CHECKED = False
+
+EARTH_RADIUS_KM = 6371
+KM_PER_DEG_LAT = pi * EARTH_RADIUS_KM / 180
+
+# ~11 km per cell: a 13 km query visits at most 4x4 cells
+DEFAULT_CELL_DEG = 0.1
+
+# Pad search boxes so float rounding never drops a centre sitting on the edge
+_BOX_PADDING = 1e-6
+
+# Density grid cells (~2.2 km); doubled until the catalogue's box fits in
+# DENSITY_MAX_CELLS so a continent-wide catalogue stays a few MiB
+DENSITY_CELL_DEG = 0.02
+DENSITY_MAX_CELLS = 1 << 20
+# Cells are only counted wholesale when this far inside the radius (km);
+# covers the bulge of parallels between cell corners
+_DENSITY_MARGIN_KM = 0.01
+
+# Web Mercator stops here; tiles are clamped to this latitude
+MAX_MERCATOR_LAT = 85.05112878
+
+
+def search_box(lat: float, lng: float, radius_km: float) -> Tuple[float, float, float, float]:
+    """
+    Conservative lat/lng box around a spherical cap of `radius_km`.
+    Returns (min_lat, max_lat, min_lng, max_lng); the longitude span is
+    widened to the full circle when the cap reaches a pole.
+    """
+    delta = radius_km / EARTH_RADIUS_KM  # angular radius (rad)
+    dlat = degrees(delta) + _BOX_PADDING
+    phi = radians(lat)
+
+    if abs(phi) + delta >= pi / 2:
+        return lat - dlat, lat + dlat, -180.0, 180.0
+
+    dlng = degrees(asin(min(1.0, sin(delta) / cos(phi)))) + _BOX_PADDING
+    if dlng >= 180:
+        return lat - dlat, lat + dlat, -180.0, 180.0
+    return lat - dlat, lat + dlat, lng - dlng, lng + dlng
+
+
+def grid_cell(lat: float, lng: float, cell_deg: float) -> Tuple[int, int]:
+    """(row, col) of the cell_deg grid cell holding the point; columns wrap at the antimeridian."""
+    half = int(round(180 / cell_deg))
+    return floor(lat / cell_deg), (floor(lng / cell_deg) + half) % (2 * half) - half
+
+
+def cells_within(lat: float, lng: float, radius_km: float, cell_deg: float) -> List[Tuple[int, int]]:
+    """Every grid_cell the cap of `radius_km` around the point can touch (the cells of its search_box)."""
+    min_lat, max_lat, min_lng, max_lng = search_box(lat, lng, radius_km)
+    half = int(round(180 / cell_deg))
+    rows = range(floor(max(min_lat, -90.0) / cell_deg), floor(min(max_lat, 90.0) / cell_deg) + 1)
+    first, last = floor(min_lng / cell_deg), floor(max_lng / cell_deg)
+    if last - first + 1 >= 2 * half:
+        cols = range(-half, half)
+    else:
+        cols = sorted({(c + half) % (2 * half) - half for c in range(first, last + 1)})
+    return [(row, col) for row in rows for col in cols]
+
+
+def _haversine_km(phi1: float, lam1: float, cos1: float, phi2: float, lam2: float, cos2: float) -> float:
+    a = sin((phi2 - phi1) / 2) ** 2 + cos1 * cos2 * sin((lam2 - lam1) / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * atan2(sqrt(a), sqrt(1 - a))
+
+
+def tile_xy(lat: float, lng: float, zoom: int) -> Tuple[int, int]:
+    """Web Mercator (slippy map) tile containing the point at `zoom`."""
+    n = 1 << zoom
+    lat = max(-MAX_MERCATOR_LAT, min(MAX_MERCATOR_LAT, lat))
+    x = int((lng + 180) / 360 * n)
+    y = int((1 - asinh(tan(radians(lat))) / pi) / 2 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def bucket_by_tile(lats: Sequence[float], lngs: Sequence[float], zoom: int) -> Dict[Tuple[int, int], List[int]]:
+    """Group catalogue positions by Web Mercator tile at `zoom`."""
+    tiles: Dict[Tuple[int, int], List[int]] = {}
+    for i in range(len(lats)):
+        key = tile_xy(lats[i], lngs[i], zoom)
+        bucket = tiles.get(key)
+        if bucket is None:
+            tiles[key] = [i]
+        else:
+            bucket.append(i)
+    return tiles
+
+
+def load_numpy():
+    """Import NumPy once; returns the module, or None when it is not installed."""
+    global np, _NUMPY_CHECKED
+    if not _NUMPY_CHECKED:
+        try:
+            import numpy
+            np = numpy
+        except ImportError:  # DistanceEngine falls back to pure Python
+            np = None
+        _NUMPY_CHECKED = True
+    return np
+
+
+class GridIndex:
+    """
+    Buckets catalogue positions into fixed lat/lng cells.
+    Built once per catalogue snapshot; queries return indices into the
+    list the index was built from, in catalogue order.
+    """
+
+    def __init__(self, lats: Sequence[float], lngs: Sequence[float], cell_deg: float = DEFAULT_CELL_DEG):
+        self.cell_deg = cell_deg
+        self.ncols = int(round(360 / cell_deg))
+        self.size = len(lats)
+        self.cells: Dict[Tuple[int, int], List[int]] = {}
+
+        for i in range(self.size):
+            key = (self._row(lats[i]), self._col(lngs[i]))
+            bucket = self.cells.get(key)
+            if bucket is None:
+                self.cells[key] = [i]
+            else:
+                bucket.append(i)
+
+    def _row(self, lat: float) -> int:
+        return floor(lat / self.cell_deg)
+
+    def _col(self, lng: float) -> int:
+        return floor((lng + 180) / self.cell_deg) % self.ncols
+
+    def candidates(self, lat: float, lng: float, radius_km: float) -> List[int]:
+        """Indices of every centre that may lie within `radius_km` of the point."""
+        min_lat, max_lat, min_lng, max_lng = search_box(lat, lng, radius_km)
+        row0, row1 = self._row(min_lat), self._row(max_lat)
+
+        if max_lng - min_lng >= 360:
+            cols = None
+        else:
+            c0 = floor((min_lng + 180) / self.cell_deg)
+            c1 = floor((max_lng + 180) / self.cell_deg)
+            cols = {c % self.ncols for c in range(c0, c1 + 1)}
+
+        out: List[int] = []
+        if cols is None or (row1 - row0 + 1) * len(cols) > len(self.cells):
+            # Query box covers more cells than are occupied: walk the buckets
+            for (row, col), bucket in self.cells.items():
+                if row0 <= row <= row1 and (cols is None or col in cols):
+                    out.extend(bucket)
+        else:
+            for row in range(row0, row1 + 1):
+                for col in cols:
+                    bucket = self.cells.get((row, col))
+                    if bucket:
+                        out.extend(bucket)
+
+        out.sort()
+        return out
+
+
+class DistanceEngine:
+    """
+    Centre coordinates kept as contiguous float64 columns (radians, plus
+    cos(lat)) so a user location can be classified against every centre
+    in a single pass. Uses NumPy when installed, pure Python otherwise.
+    """
+
+    def __init__(self, lats: Sequence[float], lngs: Sequence[float], use_numpy: Optional[bool] = None):
+        available = use_numpy is not False and load_numpy() is not None
+        self.use_numpy = available if use_numpy is None else (use_numpy and available)
+        self.size = len(lats)
+
+        if self.use_numpy:
+            self.lat = np.radians(np.asarray(lats, dtype=np.float64))
+            self.lng = np.radians(np.asarray(lngs, dtype=np.float64))
+            self.cos_lat = np.cos(self.lat)
+        else:
+            self.lat = array('d', map(radians, lats))
+            self.lng = array('d', map(radians, lngs))
+            self.cos_lat = array('d', map(cos, self.lat))
+
+    def distances_km(self, lat: float, lng: float, candidates: Optional[Sequence[int]] = None):
+        """Haversine distances (km) from the point to every centre (or just `candidates`)."""
+        phi, lam = radians(lat), radians(lng)
+        cos_phi = cos(phi)
+
+        if self.use_numpy:
+            if candidates is None:
+                lat2, lng2, cos2 = self.lat, self.lng, self.cos_lat
+            else:
+                sel = np.asarray(candidates, dtype=np.intp)
+                lat2, lng2, cos2 = self.lat[sel], self.lng[sel], self.cos_lat[sel]
+            a = np.sin((lat2 - phi) / 2) ** 2 + cos_phi * cos2 * np.sin((lng2 - lam) / 2) ** 2
+            return EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+        idx = range(self.size) if candidates is None else candidates
+        lat2, lng2, cos2 = self.lat, self.lng, self.cos_lat
+        out = []
+        for i in idx:
+            a = sin((lat2[i] - phi) / 2) ** 2 + cos_phi * cos2[i] * sin((lng2[i] - lam) / 2) ** 2
+            out.append(EARTH_RADIUS_KM * 2 * atan2(sqrt(a), sqrt(1 - a)))
+        return out
+
+    def classify(self, lat: float, lng: float, radius1_m: float, radius2_km: float, radius3_km: float,
+                 candidates: Optional[Sequence[int]] = None) -> Tuple[List[int], List[int], List[int]]:
+        """
+        Split centres into the three radius bands around the point.
+        Returns catalogue indices (ascending) for radius1, radius2 and
+        radius3; bands are exclusive, like get_user_radius_context.
+        """
+        dist = self.distances_km(lat, lng, candidates)
+
+        if self.use_numpy:
+            idx = np.arange(self.size) if candidates is None else np.asarray(candidates, dtype=np.intp)
+            in1 = dist * 1000 <= radius1_m
+            in2 = ~in1 & (dist <= radius2_km)
+            in3 = ~in1 & ~in2 & (dist <= radius3_km)
+            return idx[in1].tolist(), idx[in2].tolist(), idx[in3].tolist()
+
+        idx = range(self.size) if candidates is None else candidates
+        r1: List[int] = []
+        r2: List[int] = []
+        r3: List[int] = []
+        for i, d in zip(idx, dist):
+            if d * 1000 <= radius1_m:
+                r1.append(i)
+            elif d <= radius2_km:
+                r2.append(i)
+            elif d <= radius3_km:
+                r3.append(i)
+        return r1, r2, r3
+
+
+class DensityGrid:
+    """
+    Centre counts per lat/lng cell over the catalogue's bounding box, with
+    2D prefix sums so any block of cells is summed in O(1). count_within
+    takes cells entirely inside the circle from the prefix sums and only
+    measures the centres in cells its edge crosses, so the cost depends on
+    the radius, not on the catalogue size. Built once per catalogue snapshot.
+    """
+
+    def __init__(self, lats: Sequence[float], lngs: Sequence[float],
+                 cell_deg: float = DENSITY_CELL_DEG, max_cells: int = DENSITY_MAX_CELLS):
+        self.size = len(lats)
+        self.lat = array('d', map(radians, lats))
+        self.lng = array('d', map(radians, lngs))
+        self.cos_lat = array('d', map(cos, self.lat))
+        self.cells: Dict[Tuple[int, int], List[int]] = {}
+
+        self.lat0 = min(lats) if self.size else 0.0
+        self.lng0 = min(lngs) if self.size else 0.0
+        span_lat = max(lats) - self.lat0 if self.size else 0.0
+        span_lng = max(lngs) - self.lng0 if self.size else 0.0
+        while (floor(span_lat / cell_deg) + 1) * (floor(span_lng / cell_deg) + 1) > max_cells:
+            cell_deg *= 2
+        self.cell_deg = cell_deg
+        self.rows = floor(span_lat / cell_deg) + 1
+        self.cols = floor(span_lng / cell_deg) + 1
+
+        counts = array('q', bytes(8 * self.rows * self.cols))
+        for i in range(self.size):
+            r, c = self._row(lats[i]), self._col(lngs[i])
+            counts[r * self.cols + c] += 1
+            bucket = self.cells.get((r, c))
+            if bucket is None:
+                self.cells[(r, c)] = [i]
+            else:
+                bucket.append(i)
+
+        # prefix[(r + 1) * stride + c + 1] = centres in rows <= r, cols <= c
+        self.stride = self.cols + 1
+        if load_numpy() is not None:
+            table = np.zeros((self.rows + 1, self.stride), dtype=np.int64)
+            table[1:, 1:] = np.frombuffer(counts, dtype=np.int64).reshape(self.rows, self.cols)
+            self.prefix = array('q', table.cumsum(axis=0).cumsum(axis=1).tobytes())
+        else:
+            prefix = array('q', bytes(8 * (self.rows + 1) * self.stride))
+            stride = self.stride
+            for r in range(self.rows):
+                running = 0
+                above, here = r * stride, (r + 1) * stride
+                for c in range(self.cols):
+                    running += counts[r * self.cols + c]
+                    prefix[here + c + 1] = prefix[above + c + 1] + running
+            self.prefix = prefix
+
+    def _row(self, lat: float) -> int:
+        return min(self.rows - 1, floor((lat - self.lat0) / self.cell_deg))
+
+    def _col(self, lng: float) -> int:
+        return min(self.cols - 1, floor((lng - self.lng0) / self.cell_deg))
+
+    def block_count(self, r0: int, r1: int, c0: int, c1: int) -> int:
+        """Centres in rows r0..r1 x cols c0..c1 (inclusive, clipped to the grid)."""
+        r0, r1 = max(r0, 0), min(r1, self.rows - 1)
+        c0, c1 = max(c0, 0), min(c1, self.cols - 1)
+        if r0 > r1 or c0 > c1:
+            return 0
+        p, s = self.prefix, self.stride
+        return p[(r1 + 1) * s + c1 + 1] - p[r0 * s + c1 + 1] - p[(r1 + 1) * s + c0] + p[r0 * s + c0]
+
+    def _count_exact(self, lat: float, lng: float, radius_km: float, indices) -> int:
+        phi, lam = radians(lat), radians(lng)
+        cos_phi = cos(phi)
+        lat2, lng2, cos2 = self.lat, self.lng, self.cos_lat
+        return sum(1 for i in indices if _haversine_km(phi, lam, cos_phi, lat2[i], lng2[i], cos2[i]) <= radius_km)
+
+    def count_within(self, lat: float, lng: float, radius_km: float) -> int:
+        """Number of centres within `radius_km` of the point (same test as DistanceEngine)."""
+        if not self.size:
+            return 0
+        min_lat, max_lat, min_lng, max_lng = search_box(lat, lng, radius_km)
+        if max_lng - min_lng >= 360 or min_lng < -180 or max_lng > 180:
+            # The cap reaches a pole or wraps the antimeridian; the grid does not
+            return self._count_exact(lat, lng, radius_km, range(self.size))
+
+        phi0 = radians(lat)
+        cos_phi0 = cos(phi0)
+        delta = radius_km / EARTH_RADIUS_KM
+        hav_in = sin(max(0.0, radius_km - _DENSITY_MARGIN_KM) / EARTH_RADIUS_KM / 2) ** 2
+        hav_out = sin(delta / 2) ** 2
+        # The cap is widest in longitude at this latitude; search_box gives that width
+        peak = degrees(asin(max(-1.0, min(1.0, sin(phi0) / cos(delta)))))
+        box_width = lng - min_lng
+
+        def half_width(lat_deg: float, hav: float) -> Optional[float]:
+            """Half the cap's longitude span along a parallel (None if it misses)."""
+            phi = radians(lat_deg)
+            cos_phi = cos(phi)
+            if cos_phi <= 0:
+                return None
+            x = (hav - sin((phi - phi0) / 2) ** 2) / (cos_phi * cos_phi0)
+            if x < 0:
+                return None
+            return degrees(2 * asin(min(1.0, sqrt(x))))
+
+        cell = self.cell_deg
+        total = 0
+        boundary: List[Tuple[int, int]] = []
+        run = None  # [first row, last row, c0, c1] of fully-inside cells sharing columns
+
+        r0 = floor((min_lat - self.lat0) / cell)
+        r1 = floor((max_lat - self.lat0) / cell)
+        for r in range(max(r0, 0), min(r1, self.rows - 1) + 1):
+            south = self.lat0 + r * cell
+            north = south + cell
+
+            # Columns the circle may touch in this row...
+            if south <= peak <= north:
+                w_out = box_width
+            else:
+                widths = [w for w in (half_width(south, hav_out), half_width(north, hav_out)) if w is not None]
+                if not widths:
+                    continue
+                w_out = max(widths) + _BOX_PADDING
+            co0 = max(0, floor((lng - w_out - self.lng0) / cell))
+            co1 = min(self.cols - 1, floor((lng + w_out - self.lng0) / cell))
+
+            # ...and those lying entirely inside it (the span is narrowest at an edge)
+            w_s, w_n = half_width(south, hav_in), half_width(north, hav_in)
+            ci0, ci1 = 0, -1
+            if w_s is not None and w_n is not None:
+                w_in = min(w_s, w_n)
+                ci0 = max(co0, ceil((lng - w_in - self.lng0) / cell))
+                ci1 = min(co1, floor((lng + w_in - self.lng0) / cell) - 1)
+
+            if ci0 <= ci1:
+                if run is not None and run[1] == r - 1 and run[2] == ci0 and run[3] == ci1:
+                    run[1] = r
+                else:
+                    if run is not None:
+                        total += self.block_count(*run)
+                    run = [r, r, ci0, ci1]
+                boundary.extend((r, c) for c in range(co0, ci0))
+                boundary.extend((r, c) for c in range(ci1 + 1, co1 + 1))
+            else:
+                boundary.extend((r, c) for c in range(co0, co1 + 1))
+
+        if run is not None:
+            total += self.block_count(*run)
+
+        cells = self.cells
+        members = [i for key in boundary if key in cells for i in cells[key]]
+        return total + self._count_exact(lat, lng, radius_km, members)
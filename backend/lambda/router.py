@@ -0,0 +1,172 @@
+"""
+Table-driven HTTP routing for API Gateway proxy events (REST v1 and HTTP v2)
+Routes are method + path template ("/centre/{centre_id}/open"); each one
+declares the values its handler needs and only those are computed.
+Middleware wraps every dispatch, e.g. for metrics or compression.
+"""
+
+import base64
+import json
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+_PARAM = re.compile(r'\{(\w+)\}')
+
+
+class Request:
+    """An API Gateway event, parsed on demand."""
+
+    def __init__(self, event: Dict, method: str, path: str):
+        self.event = event
+        self.method = method
+        self.path = path
+        self.route: Optional['Route'] = None
+        self.params: Dict[str, str] = {}
+        self.context: Dict = {}  # per-request values shared by middleware and providers
+        self._headers: Optional[Dict[str, str]] = None
+        self._body = None
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        """Request headers with lower-cased names."""
+        if self._headers is None:
+            self._headers = {k.lower(): v for k, v in (self.event.get('headers') or {}).items()}
+        return self._headers
+
+    def header(self, name: str) -> Optional[str]:
+        return self.headers.get(name.lower())
+
+    @property
+    def body(self) -> Dict:
+        """JSON body (base64 aware); {} when missing or not JSON."""
+        if self._body is None:
+            raw = self.event.get('body') or '{}'
+            if self.event.get('isBase64Encoded'):
+                raw = base64.b64decode(raw).decode('utf-8')
+            try:
+                body = json.loads(raw) if isinstance(raw, str) else raw
+            except json.JSONDecodeError:
+                body = {}
+            self._body = body if isinstance(body, dict) else {}
+        return self._body
+
+    def query(self, name: str) -> Optional[str]:
+        """Query string parameter (first value)."""
+        return (self.event.get('queryStringParameters') or {}).get(name)
+
+    def cookie(self, name: str) -> Optional[str]:
+        # REST v1 sends a Cookie header; HTTP v2 also lists them in event['cookies']
+        cookies = self.event.get('cookies') or (self.header('cookie') or '').split(';')
+        prefix = name + '='
+        for cookie in cookies:
+            cookie = cookie.strip()
+            if cookie.startswith(prefix):
+                return cookie[len(prefix):]
+        return None
+
+    def bearer_token(self) -> Optional[str]:
+        auth = self.header('authorization')
+        if auth and auth.startswith('Bearer '):
+            return auth.split(' ', 1)[1]
+        return None
+
+
+class Route:
+    """
+    One registered endpoint. `needs` names the keyword arguments the
+    handler takes besides path parameters; `options` are free-form
+    settings read by providers and middleware.
+    """
+
+    def __init__(self, method: str, template: str, handler: Callable, needs: Tuple[str, ...] = (),
+                 **options):
+        self.method = method
+        self.template = template
+        self.handler = handler
+        self.needs = needs
+        self.options = options
+        self.name = f'{method} {template}'
+        self.pattern = None
+        parts = _PARAM.split(template)  # literal, param, literal, ...
+        if len(parts) > 1:
+            self.pattern = re.compile('^' + ''.join(
+                f'(?P<{part}>[^/]+)' if i % 2 else re.escape(part) for i, part in enumerate(parts)
+            ) + '$')
+
+
+Middleware = Callable[[Request, Callable[[Request], Dict]], Dict]
+
+
+class Router:
+    """
+    Routing table plus middleware chain.
+    `providers` compute the handler arguments routes ask for in `needs`;
+    each receives the Request and may cache values in request.context.
+    """
+
+    def __init__(self, providers: Dict[str, Callable[[Request], object]], not_found: Callable[[Request], Dict]):
+        self.providers = providers
+        self.not_found = not_found
+        self.static: Dict[Tuple[str, str], Route] = {}
+        self.dynamic: List[Route] = []
+        self.middleware: List[Middleware] = []
+        self._chain: Callable[[Request], Dict] = self._invoke
+
+    def add(self, method: str, template: str, handler: Callable, needs: Tuple[str, ...] = (), **options) -> Route:
+        unknown = [n for n in needs if n not in self.providers]
+        if unknown:
+            raise ValueError(f'No provider for {unknown} ({method} {template})')
+        route = Route(method, template, handler, needs, **options)
+        if route.pattern is None:
+            self.static[(method, template)] = route
+        else:
+            self.dynamic.append(route)
+        return route
+
+    def use(self, middleware: Middleware) -> None:
+        """Add middleware; the first one added is the outermost."""
+        self.middleware.append(middleware)
+        chain = self._invoke
+        for mw in reversed(self.middleware):
+            chain = (lambda mw, nxt: lambda req: mw(req, nxt))(mw, chain)
+        self._chain = chain
+
+    def resolve(self, method: str, path: str) -> Tuple[Optional[Route], Dict[str, str]]:
+        route = self.static.get((method, path))
+        if route is not None:
+            return route, {}
+        for route in self.dynamic:
+            if route.method == method:
+                m = route.pattern.match(path)
+                if m:
+                    return route, m.groupdict()
+        return None, {}
+
+    def dispatch(self, event: Dict) -> Dict:
+        request = Request(event, event_method(event), event_path(event))
+        request.route, request.params = self.resolve(request.method, request.path)
+        return self._chain(request)
+
+    def _invoke(self, request: Request) -> Dict:
+        route = request.route
+        if route is None:
+            return self.not_found(request)
+        kwargs = dict(request.params)
+        for need in route.needs:
+            kwargs[need] = self.providers[need](request)
+        return route.handler(**kwargs)
+
+
+def event_method(event: Dict) -> str:
+    if 'httpMethod' in event:  # REST v1
+        return event['httpMethod']
+    return event.get('requestContext', {}).get('http', {}).get('method', 'GET')  # HTTP v2
+
+
+def event_path(event: Dict) -> str:
+    """Request path without the stage prefix (HTTP v2 keeps it in rawPath for named stages)."""
+    path = event.get('rawPath') or event.get('path') or '/'
+    stage = event.get('requestContext', {}).get('stage')
+    if stage and stage != '$default' and path.startswith(f'/{stage}/'):
+        path = path[len(stage) + 1:]
+    return path
@@ -0,0 +1,236 @@
+"""
+Binary centres snapshots published by the background jobs
+After each catalogue version bump, a job scans the centres once and
+publishes an immutable file for that version. API containers then mmap the
+file instead of scanning DynamoDB themselves: coordinates and status/type
+codes are read zero-copy from the mapping, and only ids, names and
+last_update strings are decoded. Destinations, first one set wins:
+  CENTRES_SNAPSHOT_DIR      shared directory; readers map the files in place
+  CENTRES_SNAPSHOT_BUCKET   S3 bucket; readers download once to
+                            CENTRES_SNAPSHOT_CACHE_DIR, then map that copy
+With neither set, publishing is a no-op and readers keep scanning.
+
+File layout (little-endian; every section starts on an 8-byte boundary):
+  magic 'HWCS', u16 format, u16 reserved, u32 header length, JSON header
+  lat f64[n] | lng f64[n] | type code i16[n] | status code i32[n] |
+  id, name, last_update string refs i32[n] each (-1 for none) |
+  string table: the m strings, UTF-8, NUL-separated (decoded with one split)
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from typing import Dict, List, Optional
+
+import store
+from catalogue import Catalogue
+from clients import s3
+
+SNAPSHOT_DIR = os.environ.get('CENTRES_SNAPSHOT_DIR') or None
+SNAPSHOT_BUCKET = os.environ.get('CENTRES_SNAPSHOT_BUCKET') or None
+SNAPSHOT_PREFIX = 'centres/'
+SNAPSHOT_CACHE_DIR = (
+    os.environ.get('CENTRES_SNAPSHOT_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'centres-snapshots')
+)
+
+MAGIC = b'HWCS'
+FORMAT = 1
+_PREAMBLE = struct.Struct('<4sHHI')
+
+# (section, array typecode), in file order; string refs and codes are signed so -1 can mean none
+_COLUMNS = (('lat', 'd'), ('lng', 'd'), ('type_codes', 'h'), ('status_codes', 'i'),
+            ('id_refs', 'i'), ('name_refs', 'i'), ('update_refs', 'i'))
+
+
+def enabled() -> bool:
+    return bool(SNAPSHOT_DIR or SNAPSHOT_BUCKET)
+
+
+def snapshot_name(version: int) -> str:
+    return f'centres-v{version}.bin'
+
+
+def _pad(n: int) -> int:
+    return -n % 8
+
+
+def encode(catalogue: Catalogue, version: int) -> bytes:
+    """The snapshot file for `catalogue` at catalogue `version`."""
+    strings: Dict[str, int] = {}
+
+    def ref(s) -> int:
+        if s is None:
+            return -1
+        r = strings.get(s)
+        if r is None:
+            r = strings[s] = len(strings)
+        return r
+
+    columns = {
+        'lat': array('d', catalogue.lat),
+        'lng': array('d', catalogue.lng),
+        'type_codes': array('h', catalogue.type_codes),
+        'status_codes': array('i', catalogue.status_codes),
+        'id_refs': array('i', map(ref, catalogue.ids)),
+        'name_refs': array('i', (ref(str(name)) for name in catalogue.names)),
+        'update_refs': array('i', (ref(s if isinstance(s, str) else None) for s in catalogue.last_update)),
+    }
+    if any('\0' in s for s in strings):
+        raise ValueError('centre strings may not contain NUL')
+    sections = [(name, columns[name]) for name, _ in _COLUMNS]
+    sections.append(('strings', '\0'.join(strings).encode()))
+    if sys.byteorder != 'little':
+        for _, data in sections:
+            if isinstance(data, array):
+                data.byteswap()
+
+    def header_bytes(layout: Dict) -> bytes:
+        raw = json.dumps({
+            'version': version,
+            'count': len(catalogue),
+            'types': list(catalogue.types),
+            'statuses': list(catalogue.statuses),
+            'watermark': catalogue.watermark,
+            'strings': len(strings),
+            'sections': layout,
+        }, separators=(',', ':')).encode()
+        return raw + b' ' * _pad(_PREAMBLE.size + len(raw))
+
+    # Section offsets depend on the header's length, which depends on the offsets
+    layout: Dict[str, List[int]] = {}
+    header = b''
+    while True:
+        pos = _PREAMBLE.size + len(header)
+        for name, data in sections:
+            nbytes = len(data) * data.itemsize if isinstance(data, array) else len(data)
+            layout[name] = [pos, nbytes]
+            pos += nbytes + _pad(nbytes)
+        fitted, header = header, header_bytes(layout)
+        if len(fitted) == len(header):
+            break
+
+    out = [_PREAMBLE.pack(MAGIC, FORMAT, 0, len(header)), header]
+    for name, data in sections:
+        raw = data.tobytes() if isinstance(data, array) else data
+        out += [raw, b'\0' * _pad(len(raw))]
+    return b''.join(out)
+
+
+def open_catalogue(path: str, version: Optional[int] = None) -> Catalogue:
+    """
+    Map the snapshot file at `path` and wrap it in a Catalogue whose
+    coordinate and code columns are views into the mapping. The mapping
+    lives as long as the Catalogue does. Raises ValueError for a file that
+    is not a snapshot (or not the expected `version`).
+    """
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapped)
+    if len(view) < _PREAMBLE.size:
+        raise ValueError(f'{path}: truncated snapshot')
+    magic, fmt, _, header_len = _PREAMBLE.unpack_from(view)
+    if magic != MAGIC or fmt != FORMAT:
+        raise ValueError(f'{path}: not a format {FORMAT} centres snapshot')
+    header = json.loads(bytes(view[_PREAMBLE.size:_PREAMBLE.size + header_len]))
+    if version is not None and header['version'] != version:
+        raise ValueError(f"{path}: holds version {header['version']}, not {version}")
+    n = header['count']
+
+    def section(name: str, typecode: str, count: int):
+        offset, nbytes = header['sections'][name]
+        if offset + nbytes > len(view) or nbytes != count * struct.calcsize(typecode):
+            raise ValueError(f'{path}: bad {name} section')
+        data = view[offset:offset + nbytes].cast(typecode)
+        if sys.byteorder != 'little':  # no zero-copy on big-endian hosts
+            data = array(typecode, data.tobytes())
+            data.byteswap()
+        return data
+
+    columns = {name: section(name, typecode, n) for name, typecode in _COLUMNS}
+    start, nbytes = header['sections']['strings']
+    strings = str(view[start:start + nbytes], 'utf-8').split('\0') if header['strings'] else []
+    if len(strings) != header['strings']:
+        raise ValueError(f'{path}: bad strings section')
+
+    ids = [sys.intern(strings[r]) for r in columns['id_refs']]
+    return Catalogue.from_columns(
+        ids=ids,
+        names=[strings[r] for r in columns['name_refs']],
+        lat=columns['lat'],
+        lng=columns['lng'],
+        type_codes=columns['type_codes'],
+        types=header['types'],
+        status_codes=columns['status_codes'],
+        statuses=header['statuses'],
+        last_update=[strings[r] if r >= 0 else None for r in columns['update_refs']],
+        watermark=header['watermark'],
+    )
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    """Readers see either no file or the whole file, never a partial one."""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def publish(table_name: str, version: int) -> Optional[str]:
+    """
+    Scan the centres table and publish the snapshot for `version`; returns
+    where it went, or None when no destination is configured. A job that
+    bumped the version publishes after its own writes; the scan is strongly
+    consistent, so the file holds at least every change up to `version`.
+    """
+    if not enabled():
+        return None
+    data = encode(Catalogue(store.scan_centres(table_name, consistent=True)), version)
+    name = snapshot_name(version)
+    if SNAPSHOT_DIR:
+        path = os.path.join(SNAPSHOT_DIR, name)
+        _write_atomic(path, data)
+        return path
+    s3().put_object(
+        Bucket=SNAPSHOT_BUCKET, Key=SNAPSHOT_PREFIX + name,
+        Body=data, ContentType='application/octet-stream'
+    )
+    return f's3://{SNAPSHOT_BUCKET}/{SNAPSHOT_PREFIX}{name}'
+
+
+def load(version: int) -> Optional[Catalogue]:
+    """The published catalogue for `version`, mapped; None if there is none (yet)."""
+    name = snapshot_name(version)
+    if SNAPSHOT_DIR:
+        path = os.path.join(SNAPSHOT_DIR, name)
+        if not os.path.exists(path):
+            return None
+        return open_catalogue(path, version)
+    if not SNAPSHOT_BUCKET:
+        return None
+
+    path = os.path.join(SNAPSHOT_CACHE_DIR, name)
+    if not os.path.exists(path):
+        client = s3()
+        try:
+            resp = client.get_object(Bucket=SNAPSHOT_BUCKET, Key=SNAPSHOT_PREFIX + name)
+        except client.exceptions.NoSuchKey:
+            return None
+        _write_atomic(path, resp['Body'].read())
+        # Older versions are never read again; mapped ones stay valid after unlinking
+        for other in os.listdir(SNAPSHOT_CACHE_DIR):
+            if other != name and other.startswith('centres-v'):
+                try:
+                    os.unlink(os.path.join(SNAPSHOT_CACHE_DIR, other))
+                except OSError:
+                    pass
+    return open_catalogue(path, version)
@@ -3,16 +3,24 @@ Lambda function for updating health center statuses
 Runs every hour to simulate dynamic fullness changes
 """
 
-import json
 import os
 import random
+import sys
 from datetime import datetime, timedelta
-import boto3
-from boto3.dynamodb.conditions import Key
 
-DDB_ENDPOINT = os.environ.get('DYNAMODB_ENDPOINT')
-dynamodb = boto3.resource('dynamodb', endpoint_url=DDB_ENDPOINT)
-centres_table = dynamodb.Table(os.environ['CENTRES_TABLE'])
+# Lambda loads handlers as lambda/<module>; keep sibling modules importable
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from catalogue import (
+    REGION_INDEX, bump_region_version, catalogue_partition, is_catalogue_meta, map_shards,
+    publish_catalogue_change, read_regions
+)
+from clients import LazyTable, management_api
+from encoding import to_json, to_json_bytes
+
+centres_table = LazyTable(os.environ['CENTRES_TABLE'])
+
+# UTC hour of the daily sweep for centres that are in no region shard
+SWEEP_HOUR = 0
 
 # Fullness transition probabilities
 TRANSITION_MATRIX = {
@@ -35,38 +43,97 @@ def lambda_handler(event, context):
     current_hour = datetime.utcnow().hour
     hour_modifier = HOUR_MODIFIERS.get(current_hour, 1.0)
     
-    # Get all centres
-    centres = get_all_centres()
-    
-    updates = []
-    for centre in centres:
-        new_status = calculate_new_status(centre, hour_modifier)
-        
-        if new_status != centre.get('status'):
-            update_centre_status(centre['id'], new_status)
-            updates.append({
-                'centre_id': centre['id'],
-                'old_status': centre.get('status'),
-                'new_status': new_status
-            })
+    # Region shards are independent: each is read, updated and version-bumped
+    # on its own, in parallel. {'regions': [...]} in the event limits the run
+    # to those shards (e.g. one invocation per shard). Without registered
+    # regions the whole table is one shard.
+    requested = (event or {}).get('regions')
+    regions = requested or read_regions(centres_table)
+    if regions:
+        shard_updates = map_shards(centres_table, lambda table, region: update_shard(table, region, hour_modifier),
+                                   regions)
+        updates = [u for shard in shard_updates for u in shard]
+        # Catch-all for centres written without a region (in no shard): a
+        # full-table scan, so only on the first run of the UTC day or on request
+        if (event or {}).get('sweep') or (not requested and current_hour == SWEEP_HOUR):
+            updates.extend(update_centres(get_unsharded_centres(), hour_modifier))
+    else:
+        updates = update_centres(get_all_centres(), hour_modifier)
     
+    # One version bump (and snapshot file) per run
+    if updates:
+        publish_catalogue_change(centres_table, [u['centre_id'] for u in updates])
+
     # Broadcast updates via WebSocket if enabled
     if updates:
         broadcast_status_updates(updates)
     
     return {
         'statusCode': 200,
-        'body': json.dumps({
+        'body': to_json({
             'updated': len(updates),
+            'regions': len(regions),
             'hour': current_hour,
             'modifier': hour_modifier
         })
     }
 
+def update_centres(centres, hour_modifier, table=centres_table):
+    """Move each centre to its next status; returns the changes made"""
+    updates = []
+    for centre in centres:
+        new_status = calculate_new_status(centre, hour_modifier)
+        
+        if new_status != centre.get('status'):
+            update_centre_status(centre['id'], new_status, table)
+            updates.append({
+                'centre_id': centre['id'],
+                'old_status': centre.get('status'),
+                'new_status': new_status
+            })
+    return updates
+
+def update_shard(table, region, hour_modifier):
+    """Update one region shard's centres and bump its version if any changed"""
+    updates = update_centres(get_region_centres(table, region), hour_modifier, table)
+    if updates:
+        bump_region_version(table, region)
+    return updates
+
 def get_all_centres():
     """Retrieve all centres from DynamoDB"""
     response = centres_table.scan()
-    return response.get('Items', [])
+    return [it for it in response.get('Items', []) if not is_catalogue_meta(it)]
+
+def get_unsharded_centres():
+    """Retrieve the centres without a region (so missing from the region index)"""
+    kwargs = {
+        'FilterExpression': 'attribute_not_exists(#region)',
+        'ExpressionAttributeNames': {'#region': 'region'}
+    }
+    centres = []
+    while True:
+        response = centres_table.scan(**kwargs)
+        centres.extend(it for it in response.get('Items', []) if not is_catalogue_meta(it))
+        if not response.get('LastEvaluatedKey'):
+            return centres
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def get_region_centres(table, region):
+    """Retrieve one region shard's centres (region index)"""
+    kwargs = {
+        'IndexName': REGION_INDEX,
+        'KeyConditionExpression': '#region = :region',
+        'ExpressionAttributeNames': {'#region': 'region'},
+        'ExpressionAttributeValues': {':region': region}
+    }
+    centres = []
+    while True:
+        response = table.query(**kwargs)
+        centres.extend(response.get('Items', []))
+        if not response.get('LastEvaluatedKey'):
+            return centres
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
 
 def calculate_new_status(centre, hour_modifier):
     """Calculate new status based on current status and time"""
@@ -107,7 +174,7 @@ def calculate_new_status(centre, hour_modifier):
     
     return current_status
 
-def update_centre_status(centre_id, new_status):
+def update_centre_status(centre_id, new_status, table=centres_table):
     """Update centre status in DynamoDB"""
     
     # Calculate people count based on status
@@ -117,16 +184,17 @@ def update_centre_status(centre_id, new_status):
         'full': random.randint(45, 80)
     }
     
-    centres_table.update_item(
+    table.update_item(
         Key={'id': centre_id},
-        UpdateExpression='SET #status = :status, last_update = :time, people_count = :count',
+        UpdateExpression='SET #status = :status, last_update = :time, people_count = :count, catalogue = :catalogue',
         ExpressionAttributeNames={
             '#status': 'status'  # status is a reserved word
         },
         ExpressionAttributeValues={
             ':status': new_status,
             ':time': datetime.utcnow().isoformat(),
-            ':count': people_counts[new_status]
+            ':count': people_counts[new_status],
+            ':catalogue': catalogue_partition(centre_id)  # keeps the item in the last_update index
         }
     )
 
@@ -139,13 +207,10 @@ def broadcast_status_updates(updates):
             print("WebSocket endpoint not configured, skipping broadcast")
             return
         
-        # Get connected clients from connections table
-        apigw_management = boto3.client(
-            'apigatewaymanagementapi',
-            endpoint_url=websocket_endpoint
-        )
+        apigw_management = management_api(websocket_endpoint)
         
-        connections_table = dynamodb.Table(os.environ.get('CONNECTIONS_TABLE', 'health-waze-connections'))
+        # Get connected clients from connections table
+        connections_table = LazyTable(os.environ.get('CONNECTIONS_TABLE', 'health-waze-connections'))
         response = connections_table.scan()
         connections = response.get('Items', [])
         
@@ -155,7 +220,7 @@ def broadcast_status_updates(updates):
             'timestamp': datetime.utcnow().isoformat(),
             'updates': updates
         }
-        message_bytes = json.dumps(message).encode('utf-8')
+        message_bytes = to_json_bytes(message)
         
         # Send to all connected clients
         stale_connections = []
@@ -0,0 +1,194 @@
+"""
+Hot-path DynamoDB reads on the low-level client
+The boto3 resource layer turns every number into a Decimal that the
+handlers immediately convert again, and scans return whole items. These
+readers project only the attributes the caller uses and decode the wire
+format straight into plain Python values (int/float, str, list, dict, set).
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from clients import dynamodb_client
+
+# What a map pin needs; medicines, doctor lists etc. stay on the server
+CENTRE_FIELDS = ('id', 'name', 'lat', 'lng', 'type', 'status', 'last_update', 'disabled')
+# ... plus what the centre pages show
+CENTRE_DETAIL_FIELDS = CENTRE_FIELDS + ('people_count', 'doctor_count', 'medicines')
+
+
+def _number(v: str):
+    if '.' in v or 'e' in v or 'E' in v:
+        return float(v)
+    return int(v)
+
+
+def _decode(av: Dict):
+    for tag, v in av.items():  # exactly one entry
+        return _DECODERS[tag](v)
+
+
+_DECODERS = {
+    'S': lambda v: v,
+    'N': _number,
+    'BOOL': lambda v: v,
+    'NULL': lambda v: None,
+    'L': lambda v: [_decode(x) for x in v],
+    'M': lambda v: {k: _decode(x) for k, x in v.items()},
+    'SS': set,
+    'NS': lambda v: {_number(x) for x in v},
+    'B': lambda v: v,
+    'BS': set,
+}
+
+
+def decode_item(item: Optional[Dict]) -> Optional[Dict]:
+    """Wire-format item -> plain dict (numbers become int or float, not Decimal)."""
+    if item is None:
+        return None
+    return {k: _decode(av) for k, av in item.items()}
+
+
+def _projection(fields: Iterable[str]) -> Dict:
+    # Placeholders for every name: several of ours (name, type, status) are reserved words
+    names = {f'#p{i}': f for i, f in enumerate(fields)}
+    return {'ProjectionExpression': ', '.join(names), 'ExpressionAttributeNames': names}
+
+
+def centre_from_wire(item: Dict) -> Optional[Dict]:
+    """
+    Projected centre item -> the normalized centre dict the API caches
+    (same shape as api_handler._normalize_centre_item). None for disabled
+    or unlocated items, which includes the catalogue bookkeeping items.
+    """
+    disabled = item.get('disabled')
+    if disabled is not None and disabled.get('BOOL') is True:
+        return None
+    try:
+        lat = float(_decode(item['lat']))
+        lng = float(_decode(item['lng']))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+    cid = item['id']['S']
+    name = item.get('name')
+    ctype = item.get('type')
+    status = item.get('status')
+    last_update = item.get('last_update')
+    return {
+        'id': cid,
+        'name': _decode(name) if name is not None else cid,
+        'lat': lat,
+        'lng': lng,
+        'type': _decode(ctype) if ctype is not None else 'A',
+        'status': _decode(status) if status is not None else None,
+        'last_update': _decode(last_update) if last_update is not None else None,
+    }
+
+
+def scan_centres(table_name: str, consistent: bool = False) -> List[Dict]:
+    """
+    Full paginated, projected scan of the centres table, normalized.
+    `consistent` reads strongly consistent pages (twice the read cost).
+    """
+    client = dynamodb_client()
+    kwargs = {'TableName': table_name, **_projection(CENTRE_FIELDS)}
+    if consistent:
+        kwargs['ConsistentRead'] = True
+    centres: List[Dict] = []
+    while True:
+        resp = client.scan(**kwargs)
+        for item in resp.get('Items', []):
+            c = centre_from_wire(item)
+            if c:
+                centres.append(c)
+        lek = resp.get('LastEvaluatedKey')
+        if not lek:
+            return centres
+        kwargs['ExclusiveStartKey'] = lek
+
+
+def query_changed_centres(table_name: str, index: str, partition: str,
+                          since: str) -> List[Tuple[str, Optional[Dict]]]:
+    """
+    (centre id, normalized centre or None) for every item whose
+    last_update is at or after `since`; None marks a centre to drop.
+    """
+    client = dynamodb_client()
+    kwargs = {
+        'TableName': table_name,
+        'IndexName': index,
+        'KeyConditionExpression': '#k = :catalogue AND #u >= :since',
+        'ExpressionAttributeValues': {':catalogue': {'S': partition}, ':since': {'S': since}},
+        **_projection(CENTRE_FIELDS),
+    }
+    kwargs['ExpressionAttributeNames'].update({'#k': 'catalogue', '#u': 'last_update'})
+    changed: List[Tuple[str, Optional[Dict]]] = []
+    while True:
+        resp = client.query(**kwargs)
+        for item in resp.get('Items', []):
+            if 'id' in item:
+                changed.append((item['id']['S'], centre_from_wire(item)))
+        lek = resp.get('LastEvaluatedKey')
+        if not lek:
+            return changed
+        kwargs['ExclusiveStartKey'] = lek
+
+
+def query_region_centres(table_name: str, index: str, region: str) -> List[Dict]:
+    """Every centre of one region shard, normalized, via the region index."""
+    client = dynamodb_client()
+    kwargs = {
+        'TableName': table_name,
+        'IndexName': index,
+        'KeyConditionExpression': '#r = :region',
+        'ExpressionAttributeValues': {':region': {'S': region}},
+        **_projection(CENTRE_FIELDS),
+    }
+    kwargs['ExpressionAttributeNames']['#r'] = 'region'
+    centres: List[Dict] = []
+    while True:
+        resp = client.query(**kwargs)
+        for item in resp.get('Items', []):
+            c = centre_from_wire(item)
+            if c:
+                centres.append(c)
+        lek = resp.get('LastEvaluatedKey')
+        if not lek:
+            return centres
+        kwargs['ExclusiveStartKey'] = lek
+
+
+def get_centre(table_name: str, centre_id: str, consistent: bool = False) -> Optional[Dict]:
+    """One centre's CENTRE_DETAIL_FIELDS, decoded (None if there is no such item)."""
+    resp = dynamodb_client().get_item(
+        TableName=table_name,
+        Key={'id': {'S': centre_id}},
+        ConsistentRead=consistent,
+        **_projection(CENTRE_DETAIL_FIELDS)
+    )
+    return decode_item(resp.get('Item'))
+
+
+def get_user(table_name: str, user_id: str, fields: Iterable[str]) -> Dict:
+    """The user's `fields` ({} if the user has no item yet)."""
+    resp = dynamodb_client().get_item(
+        TableName=table_name,
+        Key={'user_id': {'S': user_id}},
+        **_projection(fields)
+    )
+    return decode_item(resp.get('Item')) or {}
+
+
+def get_session(table_name: str, session_id: str) -> Optional[Dict]:
+    """
+    The session row for `session_id`; None if there is none, or if the row
+    is not a session (revocation entries share the table but have no user).
+    """
+    resp = dynamodb_client().get_item(
+        TableName=table_name,
+        Key={'session_id': {'S': session_id}}
+    )
+    session = decode_item(resp.get('Item'))
+    if not session or not session.get('user_id'):
+        return None
+    return session
@@ -3,20 +3,24 @@ Lambda function for validating pending help submissions
 Runs every 30 minutes to process and validate community-provided information
 """
 
-import json
 import os
+import sys
 from datetime import datetime, timedelta
 from decimal import Decimal
-import boto3
-from boto3.dynamodb.conditions import Key, Attr
 from collections import Counter
 
-DDB_ENDPOINT = os.environ.get('DYNAMODB_ENDPOINT')
-dynamodb = boto3.resource('dynamodb', endpoint_url=DDB_ENDPOINT)
-entitlements_table = dynamodb.Table(os.environ['ENTITLEMENTS_TABLE'])
-ledger_table = dynamodb.Table(os.environ['LEDGER_TABLE'])
-centres_table = dynamodb.Table(os.environ['CENTRES_TABLE'])
-users_table = dynamodb.Table(os.environ['USERS_TABLE'])
+# Lambda loads handlers as lambda/<module>; keep sibling modules importable
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from catalogue import (
+    bump_region_version, catalogue_partition, map_shards, publish_catalogue_change, read_centre_regions
+)
+from clients import LazyTable, dynamodb
+from encoding import to_json
+
+entitlements_table = LazyTable(os.environ['ENTITLEMENTS_TABLE'])
+ledger_table = LazyTable(os.environ['LEDGER_TABLE'])
+centres_table = LazyTable(os.environ['CENTRES_TABLE'])
+users_table = LazyTable(os.environ['USERS_TABLE'])
 
 # Validation thresholds
 MIN_CONFIRMATIONS = 3
@@ -48,7 +52,7 @@ def lambda_handler(event, context):
     
     return {
         'statusCode': 200,
-        'body': json.dumps({
+        'body': to_json({
             'processed': len(results),
             'window': window_start.isoformat()
         })
@@ -57,9 +61,13 @@ def lambda_handler(event, context):
 def get_pending_validations(window_start):
     """Retrieve all pending validations for the current window"""
     response = entitlements_table.scan(
-        FilterExpression=Attr('type').eq('pending_validation') & 
-                        Attr('validation_window').eq(window_start.isoformat()) &
-                        Attr('validated').eq(False)
+        FilterExpression='#type = :type AND validation_window = :window AND validated = :validated',
+        ExpressionAttributeNames={'#type': 'type'},  # type is a reserved word
+        ExpressionAttributeValues={
+            ':type': 'pending_validation',
+            ':window': window_start.isoformat(),
+            ':validated': False
+        }
     )
     
     return response.get('Items', [])
@@ -271,7 +279,24 @@ def mark_validation_processed(entitlement_id):
     )
 
 def update_centre_statuses(results):
-    """Update centre statuses based on validated data"""
+    """Update centre statuses based on validated data, one region shard per thread"""
+    regions = read_centre_regions(dynamodb(), centres_table, [r['centre_id'] for r in results]) if results else {}
+    shards = {}
+    for result in results:
+        shards.setdefault(regions.get(result['centre_id']), []).append(result)
+
+    changed = []
+    for shard_changed in map_shards(centres_table, update_shard_statuses, list(shards.items())):
+        changed.extend(shard_changed)
+
+    # One version bump (and snapshot file) per run
+    if changed:
+        publish_catalogue_change(centres_table, changed)
+
+def update_shard_statuses(table, shard):
+    """Apply one region shard's results and bump its version; returns the changed centre ids"""
+    region, results = shard
+    changed = []
     for result in results:
         update_data = {}
         
@@ -281,7 +306,7 @@ def update_centre_statuses(results):
         
         if result['validated_doctors']:
             # Update doctor availability
-            current_doctors = get_centre_doctors(result['centre_id'])
+            current_doctors = get_centre_doctors(result['centre_id'], table)
             for validated_doctor in result['validated_doctors']:
                 if validated_doctor['available']:
                     current_doctors.append(validated_doctor['id'])
@@ -293,7 +318,7 @@ def update_centre_statuses(results):
         
         if result['validated_medicines']:
             # Update medicine availability
-            current_medicines = get_centre_medicines(result['centre_id'])
+            current_medicines = get_centre_medicines(result['centre_id'], table)
             for validated_medicine in result['validated_medicines']:
                 if validated_medicine.get('new') and validated_medicine['available']:
                     current_medicines.append({
@@ -307,29 +332,40 @@ def update_centre_statuses(results):
             update_data['medicines'] = current_medicines
         
         if update_data:
-            update_centre(result['centre_id'], update_data)
+            update_centre(result['centre_id'], update_data, table)
+            changed.append(result['centre_id'])
+
+    # Centres without a region (not backfilled yet) only bump the catalogue version
+    if changed and region:
+        bump_region_version(table, region)
+    return changed
 
-def get_centre_doctors(centre_id):
+def get_centre_doctors(centre_id, table=centres_table):
     """Get current doctors list for a centre"""
-    response = centres_table.get_item(Key={'id': centre_id})
+    response = table.get_item(Key={'id': centre_id})
     return response.get('Item', {}).get('available_doctors', [])
 
-def get_centre_medicines(centre_id):
+def get_centre_medicines(centre_id, table=centres_table):
     """Get current medicines list for a centre"""
-    response = centres_table.get_item(Key={'id': centre_id})
+    response = table.get_item(Key={'id': centre_id})
     return response.get('Item', {}).get('medicines', [])
 
-def update_centre(centre_id, update_data):
+def update_centre(centre_id, update_data, table=centres_table):
     """Update centre data in DynamoDB"""
     update_expression = []
     expression_values = {}
-    
+
+    # Any change moves the centre up the last_update index so API caches pick it up
+    update_data = dict(update_data)
+    update_data.setdefault('last_update', datetime.utcnow().isoformat())
+    update_data['catalogue'] = catalogue_partition(centre_id)
+
     for key, value in update_data.items():
         update_expression.append(f"{key} = :{key}")
         expression_values[f":{key}"] = value
     
     if update_expression:
-        centres_table.update_item(
+        table.update_item(
             Key={'id': centre_id},
             UpdateExpression='SET ' + ', '.join(update_expression),
             ExpressionAttributeValues=expression_values
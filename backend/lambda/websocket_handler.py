@@ -5,12 +5,15 @@ Manages connections and broadcasts status changes
 
 import json
 import os
-import boto3
+import sys
 from datetime import datetime
 
-DDB_ENDPOINT = os.environ.get('DYNAMODB_ENDPOINT')
-dynamodb = boto3.resource('dynamodb', endpoint_url=DDB_ENDPOINT)
-connections_table = dynamodb.Table(os.environ.get('CONNECTIONS_TABLE', 'health-waze-connections'))
+# Lambda loads handlers as lambda/<module>; keep sibling modules importable
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from clients import LazyTable, management_api
+from encoding import to_json, to_json_bytes
+
+connections_table = LazyTable(os.environ.get('CONNECTIONS_TABLE', 'health-waze-connections'))
 
 def lambda_handler(event, context):
     """Main WebSocket handler with routing"""
@@ -30,7 +33,7 @@ def lambda_handler(event, context):
     else:
         return {
             'statusCode': 400,
-            'body': json.dumps({'error': f'Unknown route: {route_key}'})
+            'body': to_json({'error': f'Unknown route: {route_key}'})
         }
 
 def handle_connect(connection_id, event):
@@ -84,7 +87,7 @@ def handle_subscribe(connection_id, event):
         if not centre_ids:
             return {
                 'statusCode': 400,
-                'body': json.dumps({'error': 'No centre_ids provided'})
+                'body': to_json({'error': 'No centre_ids provided'})
             }
         
         # Update subscriptions
@@ -112,7 +115,7 @@ def handle_subscribe(connection_id, event):
     except Exception as e:
         return {
             'statusCode': 400,
-            'body': json.dumps({'error': str(e)})
+            'body': to_json({'error': str(e)})
         }
 
 def handle_unsubscribe(connection_id, event):
@@ -160,7 +163,7 @@ def handle_unsubscribe(connection_id, event):
     except Exception as e:
         return {
             'statusCode': 400,
-            'body': json.dumps({'error': str(e)})
+            'body': to_json({'error': str(e)})
         }
 
 def handle_ping(connection_id):
@@ -176,22 +179,19 @@ def handle_ping(connection_id):
     
     return {
         'statusCode': 200,
-        'body': json.dumps({'type': 'pong'})
+        'body': to_json({'type': 'pong'})
     }
 
 def send_to_connection(connection_id, data, event):
     """Send message to specific connection"""
     endpoint_url = f"https://{event['requestContext']['domainName']}/{event['requestContext']['stage']}"
     
-    apigw_management = boto3.client(
-        'apigatewaymanagementapi',
-        endpoint_url=endpoint_url
-    )
+    apigw_management = management_api(endpoint_url)
     
     try:
         apigw_management.post_to_connection(
             ConnectionId=connection_id,
-            Data=json.dumps(data).encode('utf-8')
+            Data=to_json_bytes(data)
         )
     except apigw_management.exceptions.GoneException:
         # Connection is stale, remove it
@@ -222,10 +222,7 @@ def broadcast_to_subscribers(centre_id, update_data):
         print("WebSocket endpoint not configured")
         return
     
-    apigw_management = boto3.client(
-        'apigatewaymanagementapi',
-        endpoint_url=endpoint_url
-    )
+    apigw_management = management_api(endpoint_url)
     
     # Send update to each connection
     stale_connections = []
@@ -235,7 +232,7 @@ def broadcast_to_subscribers(centre_id, update_data):
         'data': update_data,
         'timestamp': datetime.utcnow().isoformat()
     }
-    message_bytes = json.dumps(message).encode('utf-8')
+    message_bytes = to_json_bytes(message)
     
     for connection in connections:
         connection_id = connection['connection_id']
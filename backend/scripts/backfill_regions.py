@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Backfill the region shard key on every centre
+Sets `region` (catalogue.region_key of the centre's lat/lng) where it is
+missing or stale, registers the shards and bumps their versions. Run it
+once before setting REGION_SHARDS=1 for the API; it is safe to re-run.
+Uses DYNAMODB_ENDPOINT when set (e.g. http://localhost:8000), AWS otherwise.
+"""
+
+import os
+import sys
+
+import boto3
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda'))
+from catalogue import (  # noqa: E402
+    bump_catalogue_version, bump_region_version, is_catalogue_meta, region_key, register_regions
+)
+
+DYNAMODB_ENDPOINT = os.environ.get('DYNAMODB_ENDPOINT')
+AWS_REGION = os.environ.get('AWS_REGION', 'us-east-1')
+CENTRES_TABLE = os.environ.get('CENTRES_TABLE', 'health-waze-centres-dev')
+
+
+def scan_located_centres(table):
+    kwargs = {
+        'ProjectionExpression': '#i, lat, lng, #r',
+        'ExpressionAttributeNames': {'#i': 'id', '#r': 'region'},
+    }
+    while True:
+        resp = table.scan(**kwargs)
+        for item in resp.get('Items', []):
+            if not is_catalogue_meta(item) and item.get('lat') is not None and item.get('lng') is not None:
+                yield item
+        if not resp.get('LastEvaluatedKey'):
+            return
+        kwargs['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+
+
+def main():
+    print("Backfilling regions in:", CENTRES_TABLE)
+    table = boto3.resource('dynamodb', endpoint_url=DYNAMODB_ENDPOINT, region_name=AWS_REGION).Table(CENTRES_TABLE)
+
+    regions, changed, touched = set(), [], set()
+    for item in scan_located_centres(table):
+        region = region_key(item['lat'], item['lng'])
+        regions.add(region)
+        if item.get('region') == region:
+            continue
+        table.update_item(
+            Key={'id': item['id']},
+            UpdateExpression='SET #r = :region',
+            ExpressionAttributeNames={'#r': 'region'},
+            ExpressionAttributeValues={':region': region}
+        )
+        changed.append(item['id'])
+        touched.update(r for r in (item.get('region'), region) if r)
+
+    register_regions(table, regions)
+    for region in sorted(touched):
+        bump_region_version(table, region)
+    if changed:
+        print("  catalogue version →", bump_catalogue_version(table, changed))
+    print(f"✓ {len(changed)} centres updated, {len(regions)} regions registered")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Memory and latency of the centres catalogue
+Compares the list of normalized centre dicts the snapshot used to hold with
+catalogue.Catalogue: retained memory, the /flow/map pin pass (dict ids and
+id sets vs bitsets), and a full /flow/map call on a warm snapshot
+"""
+
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+# api_handler reads these at import; no AWS calls are made by this script
+for var, default in (
+    ('USERS_TABLE', 'bench-users'),
+    ('SESSIONS_TABLE', 'bench-sessions'),
+    ('CENTRES_TABLE', 'bench-centres'),
+    ('LEDGER_TABLE', 'bench-ledger'),
+    ('ENTITLEMENTS_TABLE', 'bench-entitlements'),
+    ('JWT_SECRET', 'bench-secret'),
+    ('AWS_DEFAULT_REGION', 'us-east-1'),
+):
+    os.environ.setdefault(var, default)
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda'))
+
+import api_handler  # noqa: E402
+from catalogue import Catalogue  # noqa: E402
+
+CENTRE_LAT, CENTRE_LNG = -16.6869, -49.2648
+SIZES = (10_000, 100_000)
+UNLOCKED_SHARE = 0.01
+ROUNDS = 5
+
+
+def make_centre(rnd, i):
+    return {
+        'id': f'centre-{i}',
+        'name': f'Centro de Saúde {i}',
+        'lat': CENTRE_LAT + rnd.uniform(-3, 3),
+        'lng': CENTRE_LNG + rnd.uniform(-3, 3),
+        'type': rnd.choice('AB'),
+        'status': rnd.choice(('empty', 'average', 'full')),
+        'last_update': f'2025-01-01T12:{i % 60:02d}:00',
+    }
+
+
+def retained_mib(build):
+    tracemalloc.start()
+    obj = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return obj, current / 1024 / 1024
+
+
+def pin_pass_dicts(centres, unlocked, nearby, delta_ids):
+    """The /flow/map pin pass over a list of dicts, kept as the baseline"""
+    unlocked_ids = set(unlocked)
+    nearby_ids = set(nearby)
+    pin_variants = []
+    any_locked = False
+    for i in range(len(centres)):
+        centre_id = centres[i]['id']
+        if centre_id in unlocked_ids:
+            variant = api_handler.PIN_UNLOCKED
+        else:
+            any_locked = True
+            variant = api_handler.PIN_LOCKED_NEARBY if centre_id in nearby_ids else api_handler.PIN_LOCKED
+        pin_variants.append((i, variant))
+    removed = []
+    if delta_ids is not None:
+        removed = sorted(delta_ids.difference(centres[i]['id'] for i, _ in pin_variants))
+        pin_variants = [(i, v) for i, v in pin_variants if centres[i]['id'] in delta_ids]
+    return pin_variants, removed, any_locked
+
+
+def pin_pass_catalogue(catalogue, unlocked, nearby, delta_ids):
+    """Same pass as handle_flow_map now does it, without a viewport"""
+    unlocked_bits = catalogue.bitset(unlocked)
+    nearby_bits = catalogue.bitset(nearby)
+    any_locked = Catalogue.count(unlocked_bits) < len(catalogue)
+    indices = Catalogue.members(catalogue.bitset(delta_ids)) if delta_ids is not None else None
+    pin_variants = api_handler._pin_variants(len(catalogue), indices, unlocked_bits, nearby_bits)
+    removed = []
+    if delta_ids is not None:
+        removed = sorted(delta_ids.difference(catalogue.ids[i] for i, _ in pin_variants))
+    return pin_variants, removed, any_locked
+
+
+def best_ms(fn, *args):
+    best = float('inf')
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def flow_map_ms(centres, unlocked, schema):
+    snapshot = api_handler._build_snapshot(centres, 1)
+    api_handler._CENTRES_CACHE["snapshot"] = snapshot
+    api_handler._CENTRES_CACHE["expires_at"] = float('inf')
+    session = {'session_id': 'bench', 'user_id': 'anon_bench'}
+
+    def call():
+        user_ctx = api_handler.UserContext('anon_bench', api_handler.MAP_USER_FIELDS, is_new=True)
+        user_ctx.state['unlocked_centres'] = unlocked
+        return api_handler.handle_flow_map({'schema': schema}, session, user_ctx)
+
+    call()  # fills the per-snapshot pin caches
+    return best_ms(call)
+
+
+def main():
+    print(f"{'centres':>8}  {'dicts MiB':>9}  {'catalogue MiB':>13}  {'pass ms':>8}  {'bitset ms':>9}  "
+          f"{'delta ms':>8}  {'bitset ms':>9}  {'map s1 ms':>9}  {'map s2 ms':>9}")
+    for n in SIZES:
+        rnd = random.Random(n)
+        seeds = [random.Random(i) for i in range(n)]
+        centres, dict_mib = retained_mib(lambda: [make_centre(seeds[i], i) for i in range(n)])
+        seeds = [random.Random(i) for i in range(n)]
+        catalogue, cat_mib = retained_mib(lambda: Catalogue(make_centre(seeds[i], i) for i in range(n)))
+
+        unlocked = [c['id'] for c in rnd.sample(centres, int(n * UNLOCKED_SHARE))]
+        nearby = [c['id'] for c in rnd.sample(centres, 3)]
+        delta_ids = {c['id'] for c in rnd.sample(centres, 100)} | {'centre-gone'}
+
+        for delta in (None, delta_ids):
+            assert pin_pass_dicts(centres, unlocked, nearby, delta) == pin_pass_catalogue(catalogue, unlocked, nearby, delta)
+        full_old = best_ms(pin_pass_dicts, centres, unlocked, nearby, None)
+        full_new = best_ms(pin_pass_catalogue, catalogue, unlocked, nearby, None)
+        delta_old = best_ms(pin_pass_dicts, centres, unlocked, nearby, delta_ids)
+        delta_new = best_ms(pin_pass_catalogue, catalogue, unlocked, nearby, delta_ids)
+
+        map1 = flow_map_ms(centres, unlocked, '1')
+        map2 = flow_map_ms(centres, unlocked, '2')
+        print(f"{n:>8}  {dict_mib:>9.1f}  {cat_mib:>13.1f}  {full_old:>8.2f}  {full_new:>9.2f}  "
+              f"{delta_old:>8.2f}  {delta_new:>9.2f}  {map1:>9.1f}  {map2:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark for the Lambda handler modules
+Each measurement runs in a fresh interpreter, like a new Lambda container:
+  - import: the module's cumulative time from `python -X importtime`
+  - first call: wall time of the first handler invocation after import
+First calls that touch DynamoDB need the local stack (docker-compose up,
+then setup_local_db.py); without it they are reported as errors.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda')
+RUNS = 5
+
+ENV = {
+    'USERS_TABLE': 'health-waze-users-dev',
+    'SESSIONS_TABLE': 'health-waze-sessions-dev',
+    'CENTRES_TABLE': 'health-waze-centres-dev',
+    'LEDGER_TABLE': 'health-waze-ledger-dev',
+    'ENTITLEMENTS_TABLE': 'health-waze-entitlements-dev',
+    'CONNECTIONS_TABLE': 'health-waze-connections-dev',
+    'JWT_SECRET': 'bench-secret',
+    'DYNAMODB_ENDPOINT': 'http://localhost:8000',
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'AWS_ACCESS_KEY_ID': 'local',
+    'AWS_SECRET_ACCESS_KEY': 'local',
+    'AWS_MAX_ATTEMPTS': '1',  # fail fast when the local stack is down
+}
+
+
+def _http_event(method, path, body=None):
+    return {
+        'rawPath': path,
+        'requestContext': {'http': {'method': method}, 'stage': '$default'},
+        'headers': {},
+        'body': json.dumps(body) if body is not None else None,
+    }
+
+
+# (label, module, first event, extra env)
+CASES = [
+    ('api /bootstrap (signed)', 'api_handler', _http_event('POST', '/bootstrap', {}), {'SESSION_MODE': 'signed'}),
+    ('api /centres/names', 'api_handler', _http_event('GET', '/centres/names'), {}),
+    ('api /flow/map', 'api_handler', _http_event('POST', '/flow/map', {}), {}),
+    ('status_updater', 'status_updater', {}, {}),
+    ('validator', 'validator', {}, {}),
+    ('websocket $connect', 'websocket_handler',
+     {'requestContext': {'routeKey': '$connect', 'connectionId': 'bench'}}, {}),
+]
+
+FIRST_CALL = '''
+import json, sys, time
+t0 = time.perf_counter()
+import {module} as m
+t1 = time.perf_counter()
+error = None
+try:
+    m.lambda_handler(json.loads(sys.argv[1]), None)
+except Exception as e:
+    error = type(e).__name__
+t2 = time.perf_counter()
+print(json.dumps({{"import_ms": (t1 - t0) * 1000, "call_ms": (t2 - t1) * 1000, "error": error}}))
+'''
+
+
+def _env(extra):
+    env = dict(os.environ)
+    for k, v in ENV.items():
+        env.setdefault(k, v)
+    env.update(extra)
+    env['PYTHONPATH'] = LAMBDA_DIR + os.pathsep + env.get('PYTHONPATH', '')
+    return env
+
+
+def importtime_ms(module, env):
+    """Cumulative import time of `module` as reported by -X importtime."""
+    out = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        env=env, capture_output=True, text=True, check=True
+    )
+    for line in out.stderr.splitlines():
+        parts = [p.strip() for p in line.split('|')]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1]) / 1000
+    return float('nan')
+
+
+def first_call(module, event, env):
+    out = subprocess.run(
+        [sys.executable, '-c', FIRST_CALL.format(module=module), json.dumps(event)],
+        env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main():
+    print(f"{'case':<26}  {'importtime ms':>13}  {'import ms':>9}  {'first call ms':>13}  note")
+    for label, module, event, extra in CASES:
+        env = _env(extra)
+        imp = median([importtime_ms(module, env) for _ in range(RUNS)])
+        calls = [first_call(module, event, env)]
+        error = calls[0]['error']
+        if not error:
+            calls += [first_call(module, event, env) for _ in range(RUNS - 1)]
+        print(
+            f"{label:<26}  {imp:>13.1f}  {median([c['import_ms'] for c in calls]):>9.1f}  "
+            f"{median([c['call_ms'] for c in calls]):>13.1f}  {('error: ' + error) if error else ''}"
+        )
+
+
+if __name__ == '__main__':
+    main()
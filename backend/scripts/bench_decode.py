@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Benchmark per-item decode cost of the centres scan
+Compares the resource path (boto3 TypeDeserializer on the whole item, then
+_normalize_centre_item) with store.centre_from_wire on the projected item,
+and the same for a user item read by UserContext
+"""
+
+import os
+import random
+import sys
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda'))
+
+for name in ('USERS_TABLE', 'SESSIONS_TABLE', 'CENTRES_TABLE', 'LEDGER_TABLE', 'ENTITLEMENTS_TABLE'):
+    os.environ.setdefault(name, name.lower())
+os.environ.setdefault('JWT_SECRET', 'bench-secret')
+
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer  # noqa: E402
+
+import store  # noqa: E402
+from api_handler import MAP_USER_FIELDS, _normalize_centre_item  # noqa: E402
+
+N = 20_000
+ROUNDS = 5
+
+
+def make_centre(rnd, i):
+    return {
+        'id': f'centre-{i}',
+        'name': f'Centro de Saúde {i}',
+        'lat': Decimal(str(round(-16.6869 + rnd.uniform(-3, 3), 6))),
+        'lng': Decimal(str(round(-49.2648 + rnd.uniform(-3, 3), 6))),
+        'type': rnd.choice('ABC'),
+        'status': rnd.choice(('empty', 'average', 'full')),
+        'last_update': '2025-01-01T12:00:00',
+        'catalogue': 'centres',
+        'people_count': Decimal(rnd.randint(0, 80)),
+        'doctor_count': Decimal(rnd.randint(0, 8)),
+        'medicines': [f'med-{rnd.randint(0, 500)}' for _ in range(rnd.randint(5, 30))],
+        'available_doctors': [
+            {'name': f'Dr. {j}', 'specialty': rnd.choice(('GP', 'Paediatrics', 'Dentist')),
+             'until': Decimal(rnd.randint(12, 22))}
+            for j in range(rnd.randint(1, 6))
+        ],
+    }
+
+
+def make_user(rnd):
+    return {
+        'user_id': 'anon_bench',
+        'anonymous': True,
+        'balance': Decimal(rnd.randint(0, 500)),
+        'created_at': '2025-01-01T12:00:00',
+        'first_location_shared': True,
+        'unlocked_centres': {f'centre-{rnd.randint(0, N)}' for _ in range(40)},
+        'history': [{'centre': f'centre-{j}', 'at': Decimal(1700000000 + j)} for j in range(50)],
+    }
+
+
+def project(item, fields):
+    return {k: v for k, v in item.items() if k in fields}
+
+
+def per_item_us(fn, items):
+    best = float('inf')
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        for it in items:
+            fn(it)
+        best = min(best, time.perf_counter() - start)
+    return best * 1e6 / len(items)
+
+
+def main():
+    rnd = random.Random(7)
+    ser, deser = TypeSerializer(), TypeDeserializer()
+    wire = lambda item: {k: ser.serialize(v) for k, v in item.items()}  # noqa: E731
+
+    centres = [wire(make_centre(rnd, i)) for i in range(N)]
+    projected = [project(it, store.CENTRE_FIELDS) for it in centres]
+
+    def resource_centre(item):
+        return _normalize_centre_item({k: deser.deserialize(v) for k, v in item.items()})
+
+    assert [resource_centre(it) for it in centres[:500]] == [store.centre_from_wire(it) for it in projected[:500]]
+
+    users = [wire(make_user(rnd)) for _ in range(2_000)]
+    users_projected = [project(it, MAP_USER_FIELDS) for it in users]
+
+    def resource_user(item):
+        return {k: deser.deserialize(v) for k, v in item.items()}
+
+    # resource us: whole item, as before; projected us: resource path with the
+    # projection alone; store us: projection plus the wire decoder
+    print(f"{'item':<8}  {'resource us':>11}  {'projected us':>12}  {'store us':>8}  {'speedup':>7}  "
+          f"{'chars full':>10}  {'chars proj':>10}")
+    for label, full, proj, old, new in (
+        ('centre', centres, projected, resource_centre, store.centre_from_wire),
+        ('user', users, users_projected, resource_user, store.decode_item),
+    ):
+        old_us, mid_us, new_us = per_item_us(old, full), per_item_us(old, proj), per_item_us(new, proj)
+        full_chars = sum(len(repr(it)) for it in full) // len(full)
+        proj_chars = sum(len(repr(it)) for it in proj) // len(proj)
+        print(f"{label:<8}  {old_us:>11.2f}  {mid_us:>12.2f}  {new_us:>8.2f}  {old_us / new_us:>6.1f}x  "
+              f"{full_chars:>10}  {proj_chars:>10}")
+
+
+if __name__ == '__main__':
+    main()
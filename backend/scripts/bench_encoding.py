@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Benchmark response encoding for /flow/map
+Compares the old json_dumps_safe (copy the tree, then json.dumps) with
+encoding.to_json, on the json module and on orjson, at several payload sizes
+"""
+
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda'))
+
+import encoding  # noqa: E402
+from encoding import to_json  # noqa: E402
+
+SIZES = (1_000, 10_000, 50_000)
+ROUNDS = 5
+
+
+def json_dumps_safe(obj):
+    """The encoder /flow/map used before encoding.py, kept as the baseline"""
+    def convert(o):
+        if isinstance(o, list):
+            return [convert(i) for i in o]
+        if isinstance(o, dict):
+            return {k: convert(v) for k, v in o.items()}
+        if isinstance(o, Decimal):
+            return int(o) if o % 1 == 0 else float(o)
+        return o
+    return json.dumps(convert(obj))
+
+
+def make_response(n):
+    rnd = random.Random(n)
+    pins = [
+        {
+            'id': f'centre-{i}',
+            'name': f'Centro de Saúde {i}',
+            'lat': Decimal(str(round(-16.6869 + rnd.uniform(-3, 3), 6))),
+            'lng': Decimal(str(round(-49.2648 + rnd.uniform(-3, 3), 6))),
+            'locked': rnd.random() < 0.9,
+            'type': rnd.choice('ABC'),
+            'status': rnd.choice(('empty', 'average', 'full')),
+            'lastUpdate': '2025-01-01T12:00:00',
+            'peopleCount': Decimal(rnd.randint(0, 80)),
+        }
+        for i in range(n)
+    ]
+    return {'schema': '1', 'pins': pins, 'clusters': [], 'overlays': [], 'entitlements': []}
+
+
+def measure(fn, obj):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        fn(obj)
+    ms = (time.perf_counter() - start) * 1000 / ROUNDS
+
+    tracemalloc.start()
+    fn(obj)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return ms, peak / 1024 / 1024
+
+
+def encode_stdlib(obj):
+    fast, encoding.orjson = encoding.orjson, None
+    try:
+        return to_json(obj)
+    finally:
+        encoding.orjson = fast
+
+
+def main():
+    print(f"orjson: {'available' if encoding.orjson is not None else 'not installed'}")
+    print(f"{'pins':>7}  {'old ms':>8}  {'json ms':>8}  {'orjson ms':>9}  "
+          f"{'old MiB':>8}  {'json MiB':>8}  {'orjson MiB':>10}")
+
+    for n in SIZES:
+        response = make_response(n)
+        expected = json.loads(json_dumps_safe(response))
+        assert json.loads(encode_stdlib(response)) == expected
+
+        old_ms, old_mib = measure(json_dumps_safe, response)
+        std_ms, std_mib = measure(encode_stdlib, response)
+        fast = '-', '-'
+        if encoding.orjson is not None:
+            assert json.loads(to_json(response)) == expected
+            fast_ms, fast_mib = measure(to_json, response)
+            fast = f'{fast_ms:.2f}', f'{fast_mib:.2f}'
+        print(
+            f"{n:>7}  {old_ms:>8.2f}  {std_ms:>8.2f}  {fast[0]:>9}  "
+            f"{old_mib:>8.2f}  {std_mib:>8.2f}  {fast[1]:>10}"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Benchmark radius classification for /flow/map
+Compares the per-centre calculate_distance loop with the batch
+DistanceEngine (NumPy and pure-Python fallback) at several catalogue sizes,
+and the snapshot path: GridIndex candidates plus a DensityGrid for radius3
+"""
+
+import os
+import random
+import sys
+import time
+
+# api_handler reads these at import; no AWS calls are made by this script
+for var, default in (
+    ('USERS_TABLE', 'bench-users'),
+    ('SESSIONS_TABLE', 'bench-sessions'),
+    ('CENTRES_TABLE', 'bench-centres'),
+    ('LEDGER_TABLE', 'bench-ledger'),
+    ('ENTITLEMENTS_TABLE', 'bench-entitlements'),
+    ('JWT_SECRET', 'bench-secret'),
+    ('AWS_DEFAULT_REGION', 'us-east-1'),
+):
+    os.environ.setdefault(var, default)
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda'))
+
+import api_handler  # noqa: E402
+from geo import DensityGrid, DistanceEngine, GridIndex, load_numpy  # noqa: E402
+
+# Goiânia city centre; catalogue spread over roughly the size of the state
+CENTRE_LAT, CENTRE_LNG = -16.6869, -49.2648
+SPREAD_DEG = 3.0
+SIZES = (1_000, 10_000, 100_000)
+QUERIES = 50
+
+
+def make_centres(n):
+    rnd = random.Random(n)
+    return [
+        {
+            'id': f'centre-{i}',
+            'lat': CENTRE_LAT + rnd.uniform(-SPREAD_DEG, SPREAD_DEG),
+            'lng': CENTRE_LNG + rnd.uniform(-SPREAD_DEG, SPREAD_DEG),
+        }
+        for i in range(n)
+    ]
+
+
+def make_locations(n):
+    rnd = random.Random(-n)
+    return [
+        {'lat': CENTRE_LAT + rnd.uniform(-0.2, 0.2), 'lng': CENTRE_LNG + rnd.uniform(-0.2, 0.2)}
+        for _ in range(QUERIES)
+    ]
+
+
+def per_query_ms(fn, locations):
+    start = time.perf_counter()
+    for loc in locations:
+        fn(loc)
+    return (time.perf_counter() - start) * 1000 / len(locations)
+
+
+def main():
+    np = load_numpy()
+    print(f"NumPy: {'available' if np is not None else 'not installed'}")
+    print(f"{'centres':>8}  {'loop ms':>9}  {'python ms':>9}  {'numpy ms':>9}  {'speedup':>7}  {'grid ms':>8}")
+
+    for n in SIZES:
+        centres = make_centres(n)
+        locations = make_locations(n)
+        lats = [c['lat'] for c in centres]
+        lngs = [c['lng'] for c in centres]
+
+        loop = per_query_ms(lambda loc: api_handler.get_user_radius_context(loc, centres), locations)
+
+        py_engine = DistanceEngine(lats, lngs, use_numpy=False)
+        py = per_query_ms(
+            lambda loc: api_handler.get_user_radius_context(loc, centres, engine=py_engine), locations
+        )
+
+        np_ms = None
+        if np is not None:
+            np_engine = DistanceEngine(lats, lngs, use_numpy=True)
+            expected = api_handler.get_user_radius_context(locations[0], centres)
+            assert api_handler.get_user_radius_context(locations[0], centres, engine=np_engine) == expected
+            np_ms = per_query_ms(
+                lambda loc: api_handler.get_user_radius_context(loc, centres, engine=np_engine), locations
+            )
+
+        index, engine, density = GridIndex(lats, lngs), DistanceEngine(lats, lngs), DensityGrid(lats, lngs)
+        expected = api_handler.get_user_radius_context(locations[0], centres)
+        got = api_handler.get_user_radius_context(locations[0], centres, index, engine, density)
+        assert got['radius3_count'] == expected['radius3_count']
+        grid = per_query_ms(
+            lambda loc: api_handler.get_user_radius_context(loc, centres, index, engine, density), locations
+        )
+
+        best = np_ms if np_ms is not None else py
+        print(
+            f"{n:>8}  {loop:>9.2f}  {py:>9.2f}  "
+            f"{(f'{np_ms:.2f}' if np_ms is not None else '-'):>9}  {loop / best:>6.1f}x  {grid:>8.3f}"
+        )
+
+
+if __name__ == '__main__':
+    main()
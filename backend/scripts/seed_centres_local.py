@@ -3,8 +3,14 @@ import os
 from datetime import datetime
 from decimal import Decimal
 import re
+import sys
 import boto3
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lambda"))
+from catalogue import (
+    bump_catalogue_version, bump_region_version, catalogue_partition, region_key, register_regions
+)
+
 # ---- config (match your local dev) ----
 DYNAMODB_ENDPOINT = os.environ.get('DYNAMODB_ENDPOINT', 'http://localhost:8000')
 AWS_REGION = os.environ.get('AWS_REGION', 'us-east-1')
@@ -36,9 +42,10 @@ def slugify(s: str) -> str:
 
 def normalize_item(raw):
     now = datetime.utcnow().isoformat()
+    centre_id = slugify(raw["name"])
     return {
         # REQUIRED by backend (_normalize_centre_item / get_all_centres)
-        "id": slugify(raw["name"]),
+        "id": centre_id,
         "name": raw["name"],
         # DynamoDB stores numbers as Decimal — backend converts to float
         "lat": Decimal(str(raw["lat"])),
@@ -53,6 +60,10 @@ def normalize_item(raw):
             "available_drugs": []            # list[str] or empty
         },
         "last_update": now,
+        # partition of the last_update index used for incremental cache refresh
+        "catalogue": catalogue_partition(centre_id),
+        # region shard (coarse geocell) for location-scoped reads and per-shard jobs
+        "region": region_key(raw["lat"], raw["lng"]),
         # do NOT set "disabled": True — that would hide the centre
     }
 
@@ -68,11 +79,19 @@ def main():
     table = dynamodb.Table(CENTRES_TABLE)
 
     # put items
+    regions = set()
     with table.batch_writer(overwrite_by_pkeys=["id"]) as batch:
         for raw in RAW_CENTRES:
             item = normalize_item(raw)
             batch.put_item(Item=item)
+            regions.add(item["region"])
             print("  +", item["id"], "→", item["name"])
+    register_regions(table, regions)
+    for region in sorted(regions):
+        bump_region_version(table, region)
+
+    # tell warm API containers to re-scan
+    print("  catalogue version →", bump_catalogue_version(table))
 
     # sanity check
     resp = table.scan(ProjectionExpression="#i, #n, lat, lng",
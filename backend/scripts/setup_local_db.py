@@ -40,7 +40,27 @@ TABLES = [
             {'AttributeName': 'id', 'KeyType': 'HASH'}
         ],
         'AttributeDefinitions': [
-            {'AttributeName': 'id', 'AttributeType': 'S'}
+            {'AttributeName': 'id', 'AttributeType': 'S'},
+            {'AttributeName': 'catalogue', 'AttributeType': 'S'},
+            {'AttributeName': 'region', 'AttributeType': 'S'},
+            {'AttributeName': 'last_update', 'AttributeType': 'S'}
+        ],
+        'GlobalSecondaryIndexes': [
+            {
+                'IndexName': 'catalogue-last-update-index',
+                'KeySchema': [
+                    {'AttributeName': 'catalogue', 'KeyType': 'HASH'},
+                    {'AttributeName': 'last_update', 'KeyType': 'RANGE'}
+                ],
+                'Projection': {'ProjectionType': 'ALL'}
+            },
+            {
+                'IndexName': 'region-index',
+                'KeySchema': [
+                    {'AttributeName': 'region', 'KeyType': 'HASH'}
+                ],
+                'Projection': {'ProjectionType': 'ALL'}
+            }
         ],
         'BillingMode': 'PAY_PER_REQUEST'
     },
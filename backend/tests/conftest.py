@@ -0,0 +1,92 @@
+"""
+Shared test setup
+The handler modules live in backend/lambda and read their table names and
+JWT secret from the environment at import time.
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+from fake_dynamodb import FakeDynamoDB
+
+for var, default in (
+    ('USERS_TABLE', 'test-users'),
+    ('SESSIONS_TABLE', 'test-sessions'),
+    ('CENTRES_TABLE', 'test-centres'),
+    ('LEDGER_TABLE', 'test-ledger'),
+    ('ENTITLEMENTS_TABLE', 'test-entitlements'),
+    ('JWT_SECRET', 'test-secret'),
+    ('AWS_DEFAULT_REGION', 'us-east-1'),
+    ('AWS_ACCESS_KEY_ID', 'testing'),
+    ('AWS_SECRET_ACCESS_KEY', 'testing'),
+):
+    os.environ.setdefault(var, default)
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda'))
+
+TABLE_KEYS = {
+    os.environ['USERS_TABLE']: 'user_id',
+    os.environ['SESSIONS_TABLE']: 'session_id',
+    os.environ['CENTRES_TABLE']: 'id',
+    os.environ['LEDGER_TABLE']: 'ledger_id',
+    os.environ['ENTITLEMENTS_TABLE']: 'entitlement_id',
+}
+
+
+@pytest.fixture
+def ddb():
+    """A fresh FakeDynamoDB answering the shared clients, with api_handler's caches emptied."""
+    import api_handler
+    import clients
+
+    api_handler._CENTRES_CACHE.update(snapshot=None, expires_at=0.0, refreshing=False)
+    api_handler._DETAIL_VERSION.update(version=None, expires_at=0.0)
+    for cache in (api_handler._RADIUS_CONTEXTS, api_handler._CENTRE_DETAILS, api_handler._CHANGELOG_CACHE,
+                  api_handler._REGION_SHARDS):
+        cache.clear()
+
+    fake = FakeDynamoDB(TABLE_KEYS)
+    # The session hook reaches the job threads' own resources (clients.thread_table)
+    uninstall = fake.install([clients.dynamodb_client(), clients.dynamodb().meta.client],
+                             clients._session()._session)
+    yield fake
+    uninstall()
+
+
+@pytest.fixture
+def make_event():
+    """Builds an HTTP API (payload v2) event, with the session cookie if given."""
+    def make(method, path, body=None, cookie=None):
+        return {
+            'rawPath': path,
+            'requestContext': {'http': {'method': method}, 'stage': '$default'},
+            'headers': {'cookie': f'session={cookie}'} if cookie else {},
+            'body': json.dumps(body or {}),
+        }
+    return make
+
+
+@pytest.fixture
+def seed(ddb):
+    """
+    Seeds the catalogue version, `centres` centres c0, c1, ... a few hundred
+    metres apart, and session s1 of returning user u1 with `balance`.
+    """
+    def seed(centres=20, version=1, balance=0):
+        table = os.environ['CENTRES_TABLE']
+        ddb.put(table, {'id': {'S': '__catalogue_version__'}, 'version': {'N': str(version)}})
+        for i in range(centres):
+            ddb.put(table, {
+                'id': {'S': f'c{i}'}, 'name': {'S': f'Centre {i}'},
+                'lat': {'N': str(-16.68 + i * 0.001)}, 'lng': {'N': '-49.26'},
+                'type': {'S': 'A'}, 'status': {'S': 'average'}, 'last_update': {'S': '2025-01-01T12:00:00'},
+            })
+        ddb.put(os.environ['SESSIONS_TABLE'], {'session_id': {'S': 's1'}, 'user_id': {'S': 'u1'}})
+        ddb.put(os.environ['USERS_TABLE'], {
+            'user_id': {'S': 'u1'}, 'balance': {'N': str(balance)},
+            'first_access_time': {'S': '2025-01-01T12:00:00'}, 'first_location_shared': {'BOOL': True},
+        })
+    return seed
@@ -0,0 +1,227 @@
+"""
+In-memory DynamoDB behind the real botocore clients
+Answers requests from a 'before-send' hook, so the handlers' boto3 calls
+are serialized, signed and parsed exactly as in production and the
+'before-call' hooks (the per-request call counter) fire as usual.
+Implements only the operations and expression forms the handlers use.
+"""
+
+import json
+import re
+import threading
+from typing import Callable, Dict, List, Optional
+
+from botocore.awsrequest import AWSResponse
+
+_NAME = r'#?\w+'
+
+
+class _Raw:
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def stream(self, **kwargs):
+        yield self.data
+
+
+def _split_actions(actions: str) -> List[str]:
+    """Comma-separated update actions, ignoring commas inside function calls."""
+    parts, depth, start = [], 0, 0
+    for i, ch in enumerate(actions):
+        if ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+        elif ch == ',' and depth == 0:
+            parts.append(actions[start:i])
+            start = i + 1
+    parts.append(actions[start:])
+    return parts
+
+
+class FakeError(Exception):
+    def __init__(self, code: str, message: str = '', **extra):
+        super().__init__(message)
+        self.body = {'__type': f'com.amazonaws.dynamodb.v20120810#{code}', 'message': message, **extra}
+
+
+def _number(av: Dict):
+    v = av['N']
+    return float(v) if '.' in v else int(v)
+
+
+class FakeDynamoDB:
+    """
+    Tables of wire-format items keyed by their hash key. `calls` lists
+    (operation, table) for every request; `before` maps an operation name
+    to a callback run (with the request body) before it is answered.
+    """
+
+    def __init__(self, keys: Dict[str, str]):
+        self.keys = keys
+        self.tables: Dict[str, Dict[str, Dict]] = {name: {} for name in keys}
+        self.calls: List[tuple] = []
+        self.before: Dict[str, Callable[[Dict], None]] = {}
+        self._lock = threading.Lock()
+
+    def install(self, clients, session=None) -> Callable[[], None]:
+        """
+        Answer requests from each botocore client in `clients`, and from
+        every client `session` (a botocore session) creates from now on;
+        returns an uninstaller.
+        """
+        emitters = [c.meta.events for c in clients] + ([session] if session is not None else [])
+        for events in emitters:
+            events.register('before-send.dynamodb', self._send, unique_id=f'fake-dynamodb-{id(self)}')
+
+        def uninstall():
+            for events in emitters:
+                events.unregister('before-send.dynamodb', unique_id=f'fake-dynamodb-{id(self)}')
+        return uninstall
+
+    def put(self, table: str, item: Dict) -> None:
+        """Store a wire-format item directly."""
+        self.tables[table][item[self.keys[table]]['S']] = item
+
+    def get(self, table: str, key: str) -> Optional[Dict]:
+        return self.tables[table].get(key)
+
+    def _send(self, request, **kwargs):
+        target = request.headers['X-Amz-Target']
+        operation = (target.decode() if isinstance(target, bytes) else target).split('.')[-1]
+        body = json.loads(request.body)
+        self.calls.append((operation, body.get('TableName')))
+        hook = self.before.get(operation)
+        if hook is not None:
+            hook(body)
+        try:
+            with self._lock:
+                status, result = 200, getattr(self, operation)(body)
+        except FakeError as e:
+            status, result = 400, e.body
+        return AWSResponse(request.url, status, {'content-type': 'application/x-amz-json-1.0'},
+                           _Raw(json.dumps(result).encode()))
+
+    # Expressions
+
+    @staticmethod
+    def _name(body: Dict, token: str) -> str:
+        token = token.strip()
+        return body.get('ExpressionAttributeNames', {}).get(token, token)
+
+    def _project(self, body: Dict, item: Dict) -> Dict:
+        expression = body.get('ProjectionExpression')
+        if not expression:
+            return dict(item)
+        keep = {self._name(body, p) for p in expression.split(',')}
+        return {k: v for k, v in item.items() if k in keep}
+
+    def _check(self, body: Dict, item: Optional[Dict], expression: str = 'ConditionExpression') -> bool:
+        condition = body.get(expression)
+        if not condition:
+            return True
+        m = re.fullmatch(rf'attribute_not_exists\(({_NAME})\)', condition.strip())
+        if m:
+            return item is None or self._name(body, m.group(1)) not in item
+        m = re.fullmatch(rf'({_NAME}) (>=|=) (:\w+)', condition.strip())
+        if m:
+            name, value = self._name(body, m.group(1)), body['ExpressionAttributeValues'][m.group(3)]
+            if item is None or name not in item:
+                return False
+            if m.group(2) == '=':
+                return item[name] == value
+            return _number(item[name]) >= _number(value)
+        raise FakeError('ValidationException', f'Unsupported condition in the fake: {condition}')
+
+    def _key(self, table: str, key: Dict) -> str:
+        return key[self.keys[table]]['S']
+
+    # Operations
+
+    def GetItem(self, body: Dict) -> Dict:
+        item = self.tables[body['TableName']].get(self._key(body['TableName'], body['Key']))
+        return {'Item': self._project(body, item)} if item is not None else {}
+
+    def PutItem(self, body: Dict) -> Dict:
+        table, item = body['TableName'], body['Item']
+        if not self._check(body, self.tables[table].get(self._key(table, item))):
+            raise FakeError('ConditionalCheckFailedException', 'The conditional request failed')
+        self.tables[table][self._key(table, item)] = item
+        return {}
+
+    def DeleteItem(self, body: Dict) -> Dict:
+        self.tables[body['TableName']].pop(self._key(body['TableName'], body['Key']), None)
+        return {}
+
+    def UpdateItem(self, body: Dict) -> Dict:
+        table = body['TableName']
+        key = self._key(table, body['Key'])
+        current = self.tables[table].get(key)
+        if not self._check(body, current):
+            raise FakeError('ConditionalCheckFailedException', 'The conditional request failed')
+        item = dict(current or body['Key'])
+        values = body.get('ExpressionAttributeValues', {})
+        updated = {}
+        for clause, actions in re.findall(r'(SET|ADD)\s+(.*?)(?=\s+(?:SET|ADD)\s|$)', body['UpdateExpression']):
+            for action in _split_actions(actions):
+                if clause == 'SET':
+                    name, value = (part.strip() for part in action.split('='))
+                    name = self._name(body, name)
+                    m = re.fullmatch(rf'if_not_exists\(({_NAME}), (:\w+)\) - (:\w+)', value)
+                    if m:
+                        base = item.get(self._name(body, m.group(1))) or values[m.group(2)]
+                        item[name] = {'N': str(_number(base) - _number(values[m.group(3)]))}
+                    else:
+                        item[name] = values[value]
+                else:
+                    name, value = action.split()
+                    name, value = self._name(body, name), values[value]
+                    if 'SS' in value:
+                        item[name] = {'SS': sorted(set(item.get(name, {}).get('SS', [])) | set(value['SS']))}
+                    else:
+                        item[name] = {'N': str(_number(item.get(name, {'N': '0'})) + _number(value))}
+                updated[name] = item[name]
+        self.tables[table][key] = item
+        return {'Attributes': updated} if body.get('ReturnValues') == 'UPDATED_NEW' else {}
+
+    def Scan(self, body: Dict) -> Dict:
+        items = [item for item in self.tables[body['TableName']].values()
+                 if self._check(body, item, 'FilterExpression')]
+        return {'Items': [self._project(body, item) for item in items]}
+
+    def Query(self, body: Dict) -> Dict:
+        values = body['ExpressionAttributeValues']
+        tests = []
+        for part in body['KeyConditionExpression'].split(' AND '):
+            name, op, value = part.split()
+            tests.append((self._name(body, name), op, values[value]['S']))
+        items = [
+            item for item in self.tables[body['TableName']].values()
+            if all(name in item and (item[name]['S'] == v if op == '=' else item[name]['S'] >= v)
+                   for name, op, v in tests)
+        ]
+        return {'Items': [self._project(body, item) for item in items]}
+
+    def BatchGetItem(self, body: Dict) -> Dict:
+        responses = {}
+        for table, request in body['RequestItems'].items():
+            found = (self.tables[table].get(self._key(table, key)) for key in request['Keys'])
+            responses[table] = [self._project(request, item) for item in found if item is not None]
+        return {'Responses': responses, 'UnprocessedKeys': {}}
+
+    def TransactWriteItems(self, body: Dict) -> Dict:
+        entries = [(kind, entry[kind]) for entry in body['TransactItems'] for kind in ('Put', 'Update') if kind in entry]
+        reasons = []
+        for kind, request in entries:
+            table = request['TableName']
+            key = self._key(table, request['Item'] if kind == 'Put' else request['Key'])
+            ok = self._check(request, self.tables[table].get(key))
+            reasons.append({'Code': 'None'} if ok else {'Code': 'ConditionalCheckFailed'})
+        if any(r['Code'] != 'None' for r in reasons):
+            raise FakeError('TransactionCanceledException', 'Transaction cancelled', CancellationReasons=reasons)
+        for kind, request in entries:
+            if kind == 'Put':
+                self.tables[request['TableName']][self._key(request['TableName'], request['Item'])] = request['Item']
+            else:
+                self.UpdateItem(dict(request, ConditionExpression=None))
+        return {}
@@ -0,0 +1,45 @@
+"""
+Catalogue version bumps and their change log entries
+"""
+
+import api_handler
+import catalogue
+
+CENTRES = api_handler.centres_table.name
+VERSION_ID = catalogue.CATALOGUE_VERSION_ID
+
+
+def version(ddb):
+    return int(ddb.get(CENTRES, VERSION_ID)['version']['N'])
+
+
+def logged(ddb, v):
+    entry = ddb.get(CENTRES, f'{catalogue.CHANGELOG_PREFIX}{v}')
+    return entry and sorted(x['S'] for x in entry['centres']['L'])
+
+
+def test_bump_logs_changes_with_the_version(ddb):
+    assert catalogue.bump_catalogue_version(api_handler.centres_table, ['b', 'a', 'b']) == 1
+    assert catalogue.bump_catalogue_version(api_handler.centres_table, ['c']) == 2
+    assert version(ddb) == 2
+    assert logged(ddb, 1) == ['a', 'b'] and logged(ddb, 2) == ['c']
+
+
+def test_bump_retries_on_a_concurrent_bump(ddb):
+    ddb.put(CENTRES, {'id': {'S': VERSION_ID}, 'version': {'N': '4'}})
+    raced = []
+
+    def concurrent_bump(body):
+        if not raced:
+            raced.append(True)
+            ddb.put(CENTRES, {'id': {'S': VERSION_ID}, 'version': {'N': '5'}})
+    ddb.before['TransactWriteItems'] = concurrent_bump
+
+    assert catalogue.bump_catalogue_version(api_handler.centres_table, ['a']) == 6
+    assert logged(ddb, 5) is None and logged(ddb, 6) == ['a']
+
+
+def test_oversized_change_set_is_left_undiffable(ddb, monkeypatch):
+    monkeypatch.setattr(catalogue, 'CHANGELOG_MAX_IDS', 2)
+    assert catalogue.bump_catalogue_version(api_handler.centres_table, ['a', 'b', 'c']) == 1
+    assert version(ddb) == 1 and logged(ddb, 1) is None
@@ -0,0 +1,24 @@
+"""
+Only user-independent bodies are kept in the compressed-body cache
+"""
+
+import api_handler
+
+
+def test_only_shared_bodies_are_cached(ddb, make_event, seed):
+    seed(centres=100)
+
+    def get(method, path):
+        event = make_event(method, path, cookie='s1')
+        event['headers']['accept-encoding'] = 'gzip'
+        response = api_handler.lambda_handler(event, None)
+        assert response['headers']['Content-Encoding'] == 'gzip'
+        return response
+
+    get('POST', '/flow/map')
+    assert api_handler._CENTRES_CACHE['snapshot']['compressed'] == {}
+
+    first = get('GET', '/centres/names')
+    assert len(api_handler._CENTRES_CACHE['snapshot']['compressed']) == 1
+    assert get('GET', '/centres/names')['body'] == first['body']
+    assert len(api_handler._CENTRES_CACHE['snapshot']['compressed']) == 1
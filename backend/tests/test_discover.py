@@ -0,0 +1,39 @@
+"""
+Discover debits the balance with a conditional update and unlocks the centre
+"""
+
+import json
+
+import pytest
+
+import api_handler
+
+USERS = api_handler.users_table.name
+LEDGER = api_handler.ledger_table.name
+
+
+def balance(ddb):
+    return int(ddb.get(USERS, 'u1')['balance']['N'])
+
+
+def test_discover_debits_and_unlocks(ddb, make_event, seed):
+    seed(balance=100)
+    token = api_handler.generate_map_grant_token('u1', 'discover', 0)
+    response = api_handler.lambda_handler(make_event('POST', '/cta/execute', {
+        'cta_id': 'discover', 'token': token, 'payload': {'centre_id': 'c1'},
+    }, cookie='s1'), None)
+
+    assert response['statusCode'] == 200
+    assert json.loads(response['body'])['balance'] == 100 - api_handler.DISCOVER_COST
+    assert balance(ddb) == 100 - api_handler.DISCOVER_COST
+    assert ddb.get(USERS, 'u1')['unlocked_centres']['SS'] == ['c1']
+    assert [int(item['amount']['N']) for item in ddb.tables[LEDGER].values()] == [-api_handler.DISCOVER_COST]
+
+
+def test_discover_is_refused_on_a_low_balance(ddb, seed):
+    seed(balance=api_handler.DISCOVER_COST - 1)
+    with pytest.raises(ValueError, match='Insufficient balance'):
+        api_handler.execute_discover('u1', 'c1')
+    assert balance(ddb) == api_handler.DISCOVER_COST - 1
+    assert 'unlocked_centres' not in ddb.get(USERS, 'u1')
+    assert ddb.tables[LEDGER] == {}
@@ -0,0 +1,153 @@
+"""
+GridIndex, DistanceEngine and DensityGrid against brute force
+Random catalogues and query points, including the antimeridian and the
+poles, must give exactly the radius bands and counts of the plain
+distance loops the index, the engine and the grid replaced.
+"""
+
+import random
+
+import api_handler
+from geo import DensityGrid, DistanceEngine, GridIndex, load_numpy
+
+QUERIES = 800
+
+# (lat, lng, spread in degrees) of the areas centres and query points are drawn from
+AREAS = (
+    (-16.6869, -49.2648, 0.3),   # one city
+    (-16.6869, -49.2648, 3.0),   # one state
+    (0.0, 179.9, 0.4),           # across the antimeridian
+    (89.9, 0.0, 0.2),            # around the north pole
+)
+
+
+def make_centres(rnd, n):
+    centres = []
+    for i in range(n):
+        lat, lng, spread = rnd.choice(AREAS)
+        centres.append({
+            'id': f'centre-{i}',
+            'lat': max(-90.0, min(90.0, lat + rnd.uniform(-spread, spread))),
+            'lng': (lng + rnd.uniform(-spread, spread) + 180) % 360 - 180,
+        })
+    return centres
+
+
+def make_location(rnd, centres):
+    if rnd.random() < 0.3:
+        # Right around a centre, so radius1 is not always empty
+        c = rnd.choice(centres)
+        return {'lat': c['lat'] + rnd.uniform(-0.0006, 0.0006), 'lng': c['lng'] + rnd.uniform(-0.0006, 0.0006)}
+    lat, lng, spread = rnd.choice(AREAS)
+    return {
+        'lat': max(-90.0, min(90.0, lat + rnd.uniform(-spread, spread))),
+        'lng': (lng + rnd.uniform(-spread, spread) + 180) % 360 - 180,
+    }
+
+
+def engines(centres):
+    lats, lngs = [c['lat'] for c in centres], [c['lng'] for c in centres]
+    out = [DistanceEngine(lats, lngs, use_numpy=False)]
+    if load_numpy() is not None:
+        out.append(DistanceEngine(lats, lngs, use_numpy=True))
+    return out
+
+
+def test_grid_candidates_cover_every_centre_in_radius():
+    rnd = random.Random(1)
+    centres = make_centres(rnd, 2000)
+    index = GridIndex([c['lat'] for c in centres], [c['lng'] for c in centres])
+    for _ in range(QUERIES):
+        loc = make_location(rnd, centres)
+        radius_km = rnd.choice((0.05, 1.0, api_handler.RADIUS_2_KM, api_handler.RADIUS_3_KM, 60.0))
+        inside = {
+            i for i, c in enumerate(centres)
+            if api_handler.calculate_distance(loc['lat'], loc['lng'], c['lat'], c['lng']) <= radius_km
+        }
+        candidates = index.candidates(loc['lat'], loc['lng'], radius_km)
+        assert candidates == sorted(set(candidates))
+        assert inside <= set(candidates)
+
+
+def test_radius_context_matches_brute_force():
+    rnd = random.Random(2)
+    centres = make_centres(rnd, 2000)
+    index = GridIndex([c['lat'] for c in centres], [c['lng'] for c in centres])
+    variants = [(index, None)] + [(i, e) for e in engines(centres) for i in (None, index)]
+    for _ in range(QUERIES):
+        loc = make_location(rnd, centres)
+        expected = api_handler.get_user_radius_context(loc, centres)
+        for idx, engine in variants:
+            assert api_handler.get_user_radius_context(loc, centres, idx, engine) == expected
+
+
+def test_engine_classify_bands_are_exclusive():
+    rnd = random.Random(3)
+    centres = make_centres(rnd, 500)
+    for engine in engines(centres):
+        for _ in range(100):
+            loc = make_location(rnd, centres)
+            r1, r2, r3 = engine.classify(loc['lat'], loc['lng'], 50, 7, 13)
+            assert not (set(r1) & set(r2) or set(r2) & set(r3) or set(r1) & set(r3))
+            assert r1 == sorted(r1) and r2 == sorted(r2) and r3 == sorted(r3)
+
+
+def test_density_counts_match_brute_force():
+    rnd = random.Random(4)
+    centres = make_centres(rnd, 2000)
+    lats, lngs = [c['lat'] for c in centres], [c['lng'] for c in centres]
+    engine = DistanceEngine(lats, lngs, use_numpy=False)
+    # The default grid, and a coarse one whose cell size had to be doubled
+    grids = [DensityGrid(lats, lngs), DensityGrid(lats, lngs, cell_deg=0.001, max_cells=500)]
+    for _ in range(QUERIES // 4):
+        loc = make_location(rnd, centres)
+        distances = engine.distances_km(loc['lat'], loc['lng'])
+        for radius_km in (0.05, api_handler.RADIUS_2_KM, api_handler.RADIUS_3_KM, 60.0):
+            expected = sum(1 for d in distances if d <= radius_km)
+            for grid in grids:
+                assert grid.count_within(loc['lat'], loc['lng'], radius_km) == expected
+
+
+def test_radius3_count_matches_classification():
+    rnd = random.Random(5)
+    centres = make_centres(rnd, 2000)
+    density = DensityGrid([c['lat'] for c in centres], [c['lng'] for c in centres])
+    for _ in range(QUERIES // 4):
+        loc = make_location(rnd, centres)
+        expected = api_handler.get_user_radius_context(loc, centres)['radius3_count']
+        assert api_handler.radius3_count_at(density, loc['lat'], loc['lng']) == expected
+
+
+def test_memoized_radius_context_matches_brute_force():
+    rnd = random.Random(6)
+    centres = make_centres(rnd, 2000)
+    snapshot = api_handler._build_snapshot(centres, version=f'test-{rnd.random()}')
+    stats = dict(api_handler.RADIUS_CACHE_STATS)
+    for _ in range(QUERIES // 4):
+        loc = make_location(rnd, centres)
+        if rnd.random() < 0.3:
+            # On the radius1 edge of a centre
+            c = rnd.choice(centres)
+            loc = {'lat': c['lat'] + api_handler.RADIUS_1_METERS / 1000 / 111.195, 'lng': c['lng']}
+        # Several points of the same cell, so most lookups are hits
+        for _ in range(3):
+            point = {
+                'lat': loc['lat'] + rnd.uniform(-1, 1) * api_handler.RADIUS_CELL_DEG,
+                'lng': loc['lng'] + rnd.uniform(-1, 1) * api_handler.RADIUS_CELL_DEG,
+            }
+            expected = dict(api_handler.get_user_radius_context(point, centres), radius3_centres=[])
+            assert api_handler.get_radius_context(snapshot, point) == expected
+    assert api_handler.RADIUS_CACHE_STATS['hits'] > stats['hits']
+
+
+def test_memo_is_dropped_when_the_catalogue_is_rebuilt_at_the_same_version():
+    c1 = {'id': 'c1', 'lat': -16.68, 'lng': -49.26}
+    c2 = {'id': 'c2', 'lat': -16.70, 'lng': -49.26}
+    c9 = {'id': 'c9', 'lat': -16.90, 'lng': -49.26}
+    loc = {'lat': -16.6801, 'lng': -49.26}
+    snapshot = api_handler._build_snapshot([c1, c2], version=5)
+    assert api_handler.get_radius_context(snapshot, loc)['radius1_centres'] == ['c1']
+
+    # A rescan by a writer that did not bump the version reorders the rows
+    rescanned = api_handler._build_snapshot([c9, c1, c2], version=5)
+    assert api_handler.get_radius_context(rescanned, loc)['radius1_centres'] == ['c1']
@@ -0,0 +1,61 @@
+"""
+Background jobs over region shards
+"""
+
+import threading
+
+import api_handler
+import clients
+import status_updater
+
+CENTRES = api_handler.centres_table.name
+
+
+def centre(cid, region=None):
+    item = {
+        'id': {'S': cid}, 'name': {'S': cid}, 'lat': {'N': '-16.68'}, 'lng': {'N': '-49.26'},
+        'type': {'S': 'A'}, 'status': {'S': 'empty'},
+    }
+    if region:
+        item['region'] = {'S': region}
+    return item
+
+
+def test_status_updater_covers_shards_and_unsharded_centres(ddb, monkeypatch):
+    ddb.put(CENTRES, {'id': {'S': '__catalogue_version__'}, 'version': {'N': '1'}})
+    ddb.put(CENTRES, {'id': {'S': '__catalogue_regions__'}, 'regions': {'SS': ['r1', 'r2']}})
+    for item in (centre('a', 'r1'), centre('b', 'r1'), centre('c', 'r2'), centre('d')):
+        ddb.put(CENTRES, item)
+    monkeypatch.setattr(status_updater, 'calculate_new_status', lambda centre, modifier: 'full')
+
+    shard_tables = []
+    real_update_shard = status_updater.update_shard
+
+    def update_shard(table, region, hour_modifier):
+        shard_tables.append((threading.current_thread(), table))
+        return real_update_shard(table, region, hour_modifier)
+    monkeypatch.setattr(status_updater, 'update_shard', update_shard)
+
+    status_updater.lambda_handler({'sweep': True}, None)
+
+    assert {cid: ddb.get(CENTRES, cid)['status']['S'] for cid in 'abcd'} == dict.fromkeys('abcd', 'full')
+    assert ddb.get(CENTRES, '__region_version__#r1')['version']['N'] == '1'
+    assert ddb.get(CENTRES, '__region_version__#r2')['version']['N'] == '1'
+    assert ddb.get(CENTRES, '__catalogue_version__')['version']['N'] == '2'
+    assert sorted(ddb.get(CENTRES, '__changes__#2')['centres']['L'][i]['S'] for i in range(4)) == list('abcd')
+    # Worker threads never share the container's Table object
+    assert all(thread is not threading.main_thread() and table is not clients.table(CENTRES)
+               for thread, table in shard_tables)
+
+
+def test_status_updater_sweeps_unsharded_centres_daily(ddb, monkeypatch):
+    ddb.put(CENTRES, {'id': {'S': '__catalogue_regions__'}, 'regions': {'SS': ['r1']}})
+    ddb.put(CENTRES, centre('a', 'r1'))
+    ddb.put(CENTRES, centre('d'))
+    monkeypatch.setattr(status_updater, 'calculate_new_status', lambda centre, modifier: 'full')
+    monkeypatch.setattr(status_updater, 'SWEEP_HOUR', -1)  # never the current hour
+
+    status_updater.lambda_handler({}, None)
+    assert ddb.get(CENTRES, 'a')['status']['S'] == 'full'
+    assert ddb.get(CENTRES, 'd')['status']['S'] == 'empty'
+    assert [op for op, _ in ddb.calls].count('Scan') == 0
@@ -0,0 +1,91 @@
+"""
+DynamoDB calls per route
+The metrics middleware logs how many DynamoDB calls each request made;
+these pin down that count for the hot routes, cold and warm, and check
+that a background snapshot refresh is never billed to the request.
+"""
+
+import json
+import threading
+
+import api_handler
+
+CENTRES = api_handler.centres_table.name
+
+
+def dispatch(capsys, ev):
+    """(response, the metrics line logged for it)"""
+    response = api_handler.lambda_handler(ev, None)
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines() if '"metric":"route"' in line]
+    return response, lines[-1]
+
+
+def test_bootstrap_new_visitor_makes_no_calls(ddb, capsys, make_event):
+    response, line = dispatch(capsys, make_event('POST', '/bootstrap'))
+    assert response['statusCode'] == 200
+    assert line['ddb_calls'] == 0
+    assert ddb.calls == []
+
+
+def test_bootstrap_known_session(ddb, capsys, make_event, seed):
+    seed()
+    _, line = dispatch(capsys, make_event('POST', '/bootstrap', cookie='s1'))
+    assert line['ddb_calls'] == 2  # session, user
+    assert [op for op, _ in ddb.calls] == ['GetItem', 'GetItem']
+
+
+def test_flow_map_cold_then_warm(ddb, capsys, make_event, seed):
+    seed()
+    response, line = dispatch(capsys, make_event('POST', '/flow/map', cookie='s1'))
+    assert response['statusCode'] == 200
+    assert line['ddb_calls'] == 4  # session, user, catalogue version, scan
+    assert sorted(op for op, _ in ddb.calls) == ['GetItem', 'GetItem', 'GetItem', 'Scan']
+
+    _, line = dispatch(capsys, make_event('POST', '/flow/map', cookie='s1'))
+    assert line['ddb_calls'] == 2  # session, user; the snapshot is still fresh
+
+
+def test_centre_read_cold_then_cached(ddb, capsys, make_event, seed):
+    seed()
+    response, line = dispatch(capsys, make_event('GET', '/centre/c3/read'))
+    assert response['statusCode'] == 200
+    assert line['ddb_calls'] == 2  # catalogue version, centre
+
+    _, line = dispatch(capsys, make_event('GET', '/centre/c3/read'))
+    assert line['ddb_calls'] == 0
+
+
+def test_background_refresh_is_not_counted(ddb, capsys, make_event, seed):
+    seed()
+    response, _ = dispatch(capsys, make_event('POST', '/flow/map', cookie='s1'))
+    view_key = json.loads(response['body'])['version'].split('.', 1)[1]
+
+    # A newer catalogue version makes the next request start a background
+    # refresh (a delta query). The request's last call, the change log read
+    # for its `since`, waits until the refresh has made its first call.
+    ddb.put(CENTRES, {'id': {'S': '__catalogue_version__'}, 'version': {'N': '2'}})
+    api_handler._CENTRES_CACHE['expires_at'] = 0.0
+    refreshing = threading.Event()
+    ddb.before['Query'] = lambda body: refreshing.set()
+    ddb.before['BatchGetItem'] = lambda body: refreshing.wait(5)
+
+    _, line = dispatch(capsys, make_event('POST', '/flow/map', {'since': f'0.{view_key}'}, cookie='s1'))
+    assert refreshing.is_set()
+    assert line['ddb_calls'] == 4  # session, user, catalogue version, change log
+    for thread in threading.enumerate():
+        if thread is not threading.current_thread() and thread.daemon:
+            thread.join(5)
+    assert api_handler._CENTRES_CACHE['snapshot']['version'] == 2
+
+
+def test_centre_read_rereads_after_max_age(ddb, capsys, monkeypatch, make_event, seed):
+    seed()
+    dispatch(capsys, make_event('GET', '/centre/c3/read'))
+    # A writer that does not bump the catalogue version
+    ddb.put(CENTRES, dict(ddb.get(CENTRES, 'c3'), name={'S': 'Renamed'}))
+
+    now = api_handler._now_epoch()
+    monkeypatch.setattr(api_handler, '_now_epoch', lambda: now + api_handler._CENTRES_CACHE['max_age_seconds'])
+    response, line = dispatch(capsys, make_event('GET', '/centre/c3/read'))
+    assert line['ddb_calls'] == 2  # catalogue version, centre
+    assert 'Renamed' in response['body']
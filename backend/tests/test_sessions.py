@@ -0,0 +1,97 @@
+"""
+Session resolution: table rows, signed tokens, revocation and sign-out
+"""
+
+import api_handler
+
+SESSIONS = api_handler.sessions_table.name
+USERS = api_handler.users_table.name
+
+
+def cookie_value(response):
+    return response['headers']['Set-Cookie'].split(';', 1)[0].split('=', 1)[1]
+
+
+def test_revocation_entry_is_not_a_session(ddb, make_event):
+    api_handler.revoke_session('abc')
+    assert ddb.get(SESSIONS, 'revoked#abc') is not None
+
+    response = api_handler.lambda_handler(make_event('POST', '/bootstrap', cookie='revoked#abc'), None)
+    assert response['statusCode'] == 200
+    assert cookie_value(response) != 'revoked#abc'
+    assert api_handler.get_or_create_session('revoked#abc').get('provisional')
+
+
+def test_signout_deletes_table_session(ddb, make_event):
+    ddb.put(SESSIONS, {'session_id': {'S': 's1'}, 'user_id': {'S': 'u1'}})
+    response = api_handler.lambda_handler(make_event('POST', '/auth/signout', cookie='s1'), None)
+    assert response['statusCode'] == 200
+    assert 'Max-Age=0' in response['headers']['Set-Cookie']
+    assert ddb.get(SESSIONS, 's1') is None
+    assert api_handler.get_or_create_session('s1')['user_id'] != 'u1'
+
+
+def test_signout_revokes_signed_token(ddb, monkeypatch, make_event):
+    monkeypatch.setattr(api_handler, 'SESSION_MODE', 'signed')
+    token = api_handler.generate_session_token('s2', 'u2')
+    assert api_handler.get_or_create_session(token, sensitive=True)['user_id'] == 'u2'
+
+    api_handler.lambda_handler(make_event('POST', '/auth/signout', cookie=token), None)
+    assert ddb.get(SESSIONS, 'revoked#s2') is not None
+    # Sensitive routes check the revocation list; the token no longer resolves to its user there
+    assert api_handler.get_or_create_session(token, sensitive=True)['user_id'] != 'u2'
+
+
+def test_client_chosen_id_is_never_adopted(ddb):
+    chosen = '1b4e28ba-2fa1-41d2-883f-0d7d9f2a4c11'  # a well-formed uuid4 the server never issued
+    session = api_handler.get_or_create_session(chosen)
+    assert session['session_id'] != chosen
+    api_handler.persist_session(session)
+    assert ddb.get(SESSIONS, chosen) is None
+    assert ddb.get(SESSIONS, session['session_id'])['user_id']['S'] == session['user_id']
+
+
+def test_provisional_token_persists_under_its_own_ids(ddb, make_event):
+    response = api_handler.lambda_handler(make_event('POST', '/bootstrap'), None)
+    token = cookie_value(response)
+    session = api_handler.get_or_create_session(token)
+    assert session['provisional']
+    assert ddb.get(SESSIONS, session['session_id']) is None
+
+    api_handler.persist_session(session)
+    assert session['cookie_changed'] and 'token' not in session
+    assert ddb.get(SESSIONS, session['session_id'])['user_id']['S'] == session['user_id']
+
+    # The same provisional token persisted again (a retried request) keeps its user
+    retried = api_handler.persist_session(api_handler.get_or_create_session(token))
+    assert (retried['session_id'], retried['user_id']) == (session['session_id'], session['user_id'])
+
+
+def test_conflicting_session_row_is_not_taken_over(ddb):
+    session = api_handler.get_or_create_session(None)
+    ddb.put(SESSIONS, {'session_id': {'S': session['session_id']}, 'user_id': {'S': 'victim'}})
+    minted_id = session['session_id']
+
+    api_handler.persist_session(session)
+    assert session['user_id'] != 'victim'
+    assert session['session_id'] != minted_id
+    assert ddb.get(SESSIONS, minted_id)['user_id']['S'] == 'victim'
+    assert ddb.get(SESSIONS, session['session_id'])['user_id']['S'] == session['user_id']
+
+
+def test_legacy_session_gets_a_signed_token_only_with_a_cookie(ddb, seed, monkeypatch, make_event):
+    seed()
+    monkeypatch.setattr(api_handler, 'SESSION_MODE', 'signed')
+    minted = []
+    sign = api_handler.generate_session_token
+    monkeypatch.setattr(api_handler, 'generate_session_token', lambda *a, **kw: minted.append(a) or sign(*a, **kw))
+
+    response = api_handler.lambda_handler(make_event('POST', '/flow/map', cookie='s1'), None)
+    assert response['statusCode'] == 200 and 'Set-Cookie' not in response['headers']
+    assert minted == []
+
+    # Bootstrap sends a cookie, migrating the table session to a signed token
+    response = api_handler.lambda_handler(make_event('POST', '/bootstrap', cookie='s1'), None)
+    assert minted == [('s1', 'u1')]
+    session = api_handler.get_or_create_session(cookie_value(response))
+    assert (session['session_id'], session['user_id']) == ('s1', 'u1')
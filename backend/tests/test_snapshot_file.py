@@ -0,0 +1,19 @@
+"""
+Published centres snapshots are built from a strongly consistent scan
+"""
+
+import api_handler
+import snapshot_file
+
+CENTRES = api_handler.centres_table.name
+
+
+def test_publish_scans_consistently_and_loads_back(ddb, seed, tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshot_file, 'SNAPSHOT_DIR', str(tmp_path))
+    seed(centres=3)
+    scans = []
+    ddb.before['Scan'] = scans.append
+
+    assert snapshot_file.publish(CENTRES, 7) == str(tmp_path / snapshot_file.snapshot_name(7))
+    assert scans and all(body.get('ConsistentRead') for body in scans)
+    assert sorted(snapshot_file.load(7).ids) == ['c0', 'c1', 'c2']
@@ -15,6 +15,11 @@ import LocationPermissionModal from '../components/LocationPermissionModal';
 import { RefreshIcon } from '../components/Icons';
 import './MapPage.css';
 
+// Discover grants are either per centre or one map-wide grant for every locked pin
+const findDiscoverEntitlement = (entitlements, pin) => entitlements.find(
+  e => e.cta === 'discover' && (e.centre_id === pin.id || (e.scope === 'map' && pin.locked))
+);
+
 const MapPage = () => {
   const navigate = useNavigate();
   const {
@@ -79,9 +84,7 @@ const MapPage = () => {
   const handleDiscover = useCallback(async () => {
     if (!selectedPin) return;
     
-    const entitlement = serverState.entitlements.find(
-      e => e.cta === 'discover' && e.centre_id === selectedPin.id
-    );
+    const entitlement = findDiscoverEntitlement(serverState.entitlements, selectedPin);
     
     if (entitlement) {
       try {
@@ -211,9 +214,7 @@ const MapPage = () => {
           onDiscover={handleDiscover}
           onMoreInfo={handleMoreInfo}
           onGoToCentre={handleGoToCentre}
-          canDiscover={serverState.entitlements.some(
-            e => e.cta === 'discover' && e.centre_id === selectedPin.id
-          )}
+          canDiscover={!!findDiscoverEntitlement(serverState.entitlements, selectedPin)}
         />
       )}
       